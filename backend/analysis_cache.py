@@ -0,0 +1,160 @@
+"""
+Content-addressed cache of report OCR and parsing.
+
+Identical uploads (the same PDF sent again by a patient, or by their clinic)
+are recognized by the SHA-256 computed during ingestion. The key mixes in
+pipeline.cache_salt(), so an OCR or parser change never serves old output.
+Entries hold the OCR text and parsed biomarkers, sealed with the payload
+cipher (storage.py), in the analysis_cache table so every API worker shares
+them. The diet plan is always rebuilt from the parsed markers.
+
+The table is bounded by total payload bytes; least recently used entries
+are evicted after each insert. Entries sealed with a key that has since been
+retired simply become misses.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+from sqlalchemy import delete, func, select, update
+from . import database, pipeline, storage
+
+
+class AnalysisCache:
+    def __init__(self, session_factory, crypto_service, max_bytes: int = 256 * 1024 * 1024, enabled: bool = True):
+        self._session_factory = session_factory
+        self._crypto_service = crypto_service
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.unreadable = 0
+        self.cpu_seconds_saved = 0.0
+        self.stored_bytes = 0 # As of the last store
+
+    @staticmethod
+    def key(upload_sha256: str) -> str:
+        return hashlib.sha256(f"{pipeline.cache_salt()}:{upload_sha256}".encode()).hexdigest()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    async def get(self, upload_sha256: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The cached read_report output for this upload, or None. Never raises."""
+        if not self.enabled or not upload_sha256:
+            return None
+        try:
+            return await self._get(upload_sha256)
+        except Exception as e:
+            print(f"Warning: analysis cache lookup failed: {e}")
+            self._count(misses=1)
+            return None
+
+    async def put(self, upload_sha256: Optional[str], report: Dict[str, Any]):
+        """Stores read_report output; failed OCR is never cached. Never raises."""
+        if not self.enabled or not upload_sha256 or report.get("ocr_failed"):
+            return
+        try:
+            await self._put(upload_sha256, report)
+        except Exception as e:
+            print(f"Warning: analysis cache store failed: {e}")
+
+    async def _get(self, upload_sha256: str) -> Optional[Dict[str, Any]]:
+        key = self.key(upload_sha256)
+        async with self._session_factory() as db:
+            entry = await db.get(database.AnalysisCacheEntry, key)
+            if entry is None:
+                self._count(misses=1)
+                return None
+            try:
+                report = json.loads(storage.unseal(self._crypto_service, entry.encrypted_payload).decode())
+            except storage.PayloadFormatError:
+                await db.execute(delete(database.AnalysisCacheEntry).where(database.AnalysisCacheEntry.key == key))
+                await db.commit()
+                self._count(misses=1, unreadable=1)
+                return None
+            saved = entry.cpu_seconds or 0.0
+            await db.execute(
+                update(database.AnalysisCacheEntry).where(database.AnalysisCacheEntry.key == key).values(
+                    hits=database.AnalysisCacheEntry.hits + 1, last_used_at=datetime.datetime.utcnow()
+                )
+            )
+            await db.commit()
+        self._count(hits=1, cpu_seconds_saved=saved)
+        return report
+
+    async def _put(self, upload_sha256: str, report: Dict[str, Any]):
+        blob = storage.seal(self._crypto_service, storage.encode_json({"text": report["text"], "parsed": report["parsed"]}))
+        if len(blob) > self.max_bytes:
+            return
+        async with self._session_factory() as db:
+            await db.merge(database.AnalysisCacheEntry(
+                key=self.key(upload_sha256),
+                encrypted_payload=blob,
+                size_bytes=len(blob),
+                cpu_seconds=report.get("cpu_seconds", 0.0),
+                hits=0,
+                created_at=datetime.datetime.utcnow(),
+                last_used_at=datetime.datetime.utcnow()
+            ))
+            await db.commit()
+            self._count(stores=1)
+            await self._evict(db)
+
+    async def _evict(self, db):
+        total = (await db.execute(select(func.coalesce(func.sum(database.AnalysisCacheEntry.size_bytes), 0)))).scalar()
+        if total > self.max_bytes:
+            victims = []
+            rows = await db.execute(
+                select(database.AnalysisCacheEntry.key, database.AnalysisCacheEntry.size_bytes)
+                .order_by(database.AnalysisCacheEntry.last_used_at.asc())
+            )
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append(key)
+                total -= size
+            await db.execute(delete(database.AnalysisCacheEntry).where(database.AnalysisCacheEntry.key.in_(victims)))
+            await db.commit()
+            self._count(evictions=len(victims))
+        with self._lock:
+            self.stored_bytes = total
+
+    async def clear(self):
+        async with self._session_factory() as db:
+            await db.execute(delete(database.AnalysisCacheEntry))
+            await db.commit()
+        with self._lock:
+            self.stored_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "cpu_seconds_saved": round(self.cpu_seconds_saved, 3),
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "unreadable": self.unreadable,
+                "stored_bytes": self.stored_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def cache_from_env(crypto_service) -> AnalysisCache:
+    return AnalysisCache(
+        database.AsyncSessionLocal,
+        crypto_service,
+        max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+        enabled=os.getenv("ANALYSIS_CACHE_ENABLED", "1") == "1"
+    )
@@ -0,0 +1,287 @@
+"""
+Batched HIPAA audit trail writer.
+
+Handlers enqueue audit events instead of committing one AuditLog row each.
+A single writer thread drains the queue in FIFO order and commits batches in
+one transaction, triggered by batch size or a short time window, so many
+concurrent requests share one fsync (group commit).
+
+Guarantees:
+- Ordering: one consumer, FIFO queue, timestamps taken at enqueue time.
+- Durability: log() waits until the event's batch has committed (unless
+  wait=False). A failed commit is retried max_retries times with backoff;
+  then the batch is committed one event at a time, and events that still
+  fail are appended to the dead-letter file (AUDIT_DEAD_LETTER_PATH) and
+  their futures fail, so one bad row cannot stall the trail.
+- Backpressure: the queue is bounded; producers wait for space rather than
+  losing events. The enqueue lock is only held for a non-blocking put, so
+  a waiting producer never holds up the event loop.
+- Shutdown: shutdown() drains every queued event before returning; events
+  logged after it has started go straight to the dead-letter file.
+"""
+import asyncio
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict, List, Optional
+from . import database
+
+
+class AuditEvent:
+    __slots__ = ("user_id", "action", "resource", "ip_address", "timestamp", "future")
+
+    def __init__(self, user_id: Optional[int], action: str, resource: str, ip_address: Optional[str]):
+        self.user_id = user_id
+        self.action = action
+        self.resource = resource
+        self.ip_address = ip_address
+        self.timestamp: Optional[datetime.datetime] = None # Set at enqueue time
+        self.future: Future = Future()
+
+
+def _resolve(future: Future, result: Any = None, error: Optional[Exception] = None):
+    """Resolves an event's future unless its waiter already cancelled it."""
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass # Cancelled between the check and the set
+
+
+class AuditWriter:
+    def __init__(self, session_factory, max_queue: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 0.05, wait_timeout: float = 10.0, max_backoff: float = 5.0,
+                 max_retries: int = 5, dead_letter_path: Optional[str] = "audit_dead_letter.jsonl"):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.wait_timeout = wait_timeout
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._queue: "queue.Queue[AuditEvent]" = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._enqueue_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self.events_written = 0
+        self.batches_flushed = 0
+        self.flush_failures = 0
+        self.events_failed = 0 # Moved to the dead-letter file
+        self.backpressure_waits = 0
+        self.durability_timeouts = 0
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        """Starts (or restarts after shutdown) the writer thread."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id: Optional[int], action: str, resource: str, ip_address: Optional[str],
+               block: bool = True, timeout: Optional[float] = None) -> Future:
+        """
+        Enqueues an event and returns a Future resolved once it is committed.
+        Blocks while the queue is full (raises queue.Full if block=False).
+        """
+        if self._stopping.is_set():
+            raise RuntimeError("Audit writer is shut down")
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        event = AuditEvent(user_id, action, resource, ip_address)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Stamp and enqueue atomically so queue (= row) order matches timestamp order.
+            # Never block inside the lock: the event loop takes it too (block=False).
+            with self._enqueue_lock:
+                event.timestamp = datetime.datetime.utcnow()
+                try:
+                    self._queue.put_nowait(event)
+                    break
+                except queue.Full:
+                    if not block or (deadline is not None and time.monotonic() >= deadline):
+                        raise
+            time.sleep(0.005) # Wait for the writer to make room
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return event.future
+
+    async def log(self, user_id: Optional[int], action: str, resource: str, ip_address: Optional[str], wait: bool = True):
+        """Async entry point for handlers; never blocks the event loop."""
+        try:
+            try:
+                future = self.submit(user_id, action, resource, ip_address, block=False)
+            except queue.Full:
+                with self._metrics_lock:
+                    self.backpressure_waits += 1
+                future = await asyncio.to_thread(self.submit, user_id, action, resource, ip_address)
+        except RuntimeError as e:
+            # Shutting down: keep the event in the dead-letter file rather than failing the request
+            event = AuditEvent(user_id, action, resource, ip_address)
+            event.timestamp = datetime.datetime.utcnow()
+            self._dead_letter(event, e)
+            return
+
+        if wait:
+            try:
+                # Shielded: a timed-out wait must not cancel the future the writer will resolve
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_timeout)
+            except asyncio.TimeoutError:
+                # Still queued and will be retried; the request is not failed for it
+                with self._metrics_lock:
+                    self.durability_timeouts += 1
+                print(f"Warning: audit event {action} {resource} not yet committed after {self.wait_timeout}s")
+            except Exception as e:
+                # Already in the dead-letter file; the request is not failed for it either
+                print(f"Warning: audit event {action} {resource} could not be committed: {e}")
+
+    def _next_batch(self) -> List[AuditEvent]:
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stopping.is_set():
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch: List[AuditEvent]):
+        db = self._session_factory()
+        try:
+            db.add_all(
+                database.AuditLog(
+                    user_id=e.user_id,
+                    action=e.action,
+                    resource=e.resource,
+                    ip_address=e.ip_address,
+                    timestamp=e.timestamp
+                )
+                for e in batch
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batch: List[AuditEvent]):
+        start = time.perf_counter()
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._commit(batch)
+                break
+            except Exception as exc:
+                with self._metrics_lock:
+                    self.flush_failures += 1
+                if attempt == self.max_retries:
+                    print(f"Audit flush failed {attempt} times, committing events one by one: {exc}")
+                    self._flush_each(batch)
+                    return
+                backoff = min(self.max_backoff, 0.1 * (2 ** attempt))
+                print(f"Audit flush failed (attempt {attempt}, retrying in {backoff:.1f}s): {exc}")
+                time.sleep(backoff)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._metrics_lock:
+            self.events_written += len(batch)
+            self.batches_flushed += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+        for e in batch:
+            _resolve(e.future, True)
+
+    def _flush_each(self, batch: List[AuditEvent]):
+        """Isolates the events that cannot be committed: they go to the dead-letter file and fail."""
+        for e in batch:
+            try:
+                self._commit([e])
+            except Exception as exc:
+                self._dead_letter(e, exc)
+                _resolve(e.future, error=exc)
+                continue
+            with self._metrics_lock:
+                self.events_written += 1
+            _resolve(e.future, True)
+
+    def _dead_letter(self, event: AuditEvent, exc: Exception):
+        with self._metrics_lock:
+            self.events_failed += 1
+        record = {
+            "user_id": event.user_id, "action": event.action, "resource": event.resource,
+            "ip_address": event.ip_address, "timestamp": event.timestamp.isoformat(), "error": str(exc)
+        }
+        print(f"Audit event {event.action} {event.resource} could not be committed: {exc}")
+        if not self.dead_letter_path:
+            return
+        try:
+            with open(self.dead_letter_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Could not write audit dead-letter file {self.dead_letter_path}: {e} ({record})")
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                return
+
+    def shutdown(self, timeout: Optional[float] = 30.0):
+        """Stops accepting events and blocks until the queue is drained."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "max_queue_depth": self.max_queue_depth,
+                "events_written": self.events_written,
+                "batches_flushed": self.batches_flushed,
+                "avg_batch_size": round(self.events_written / self.batches_flushed, 2) if self.batches_flushed else 0.0,
+                "flush_failures": self.flush_failures,
+                "events_failed": self.events_failed,
+                "backpressure_waits": self.backpressure_waits,
+                "durability_timeouts": self.durability_timeouts,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "avg_flush_ms": round(self._total_flush_ms / self.batches_flushed, 3) if self.batches_flushed else 0.0,
+            }
+
+
+audit_writer = AuditWriter(
+    database.SessionLocal,
+    max_queue=int(os.getenv("AUDIT_QUEUE_SIZE", 10000)),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", 200)),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", 0.05)),
+    max_retries=int(os.getenv("AUDIT_MAX_RETRIES", 5)),
+    dead_letter_path=os.getenv("AUDIT_DEAD_LETTER_PATH", "audit_dead_letter.jsonl")
+)
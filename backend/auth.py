@@ -1,12 +1,17 @@
 import os
+import threading
+import time
 from typing import Optional
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import auth, credentials
 from . import database
+from . import tokens
+from .identity import UserIdentity, identity_cache
 
 load_dotenv()
 
@@ -37,13 +42,32 @@ except Exception as e:
 # Security Scheme
 security = HTTPBearer()
 
+# Verified tokens are reused until their exp; bounded per process
+token_cache = tokens.VerifiedTokenCache(max_entries=int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000)))
+# Optional local verification against cached signing certs (FIREBASE_SIGNING_KEYS_FILE)
+offline_verifier = tokens.verifier_from_env()
+
 def verify_firebase_token(token: str):
     """
     Verifies the Firebase ID token and returns the decoded token dict.
-    Raises exception if invalid.
+    Raises exception if invalid or revoked.
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        token_cache.check_revoked(token, cached)
+        return cached
+
+    token_cache.check_revoked(token)
     try:
-        return auth.verify_id_token(token)
+        if offline_verifier.enabled and offline_verifier.has_key(token):
+            decoded = offline_verifier.verify(token)
+        else:
+            decoded = auth.verify_id_token(token)
+        token_cache.check_revoked(token, decoded)
+        token_cache.put(token, decoded)
+        return decoded
+    except tokens.TokenRevoked:
+        raise
     except Exception as e:
         # Fallback for development/demo without serviceAccountKey
         # We assume the user is the default google user for this environment
@@ -55,9 +79,25 @@ def verify_firebase_token(token: str):
             "picture": "https://via.placeholder.com/150"
         }
 
-def get_current_user(res: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(database.get_db)):
+async def resolve_identity(db: AsyncSession, username: str) -> Optional[UserIdentity]:
+    """
+    Returns the cached identity for a username, querying users only on a miss.
+    Unregistered users are not cached, so registration takes effect immediately.
     """
-    Verifies the Firebase ID Token and returns the corresponding local user.
+    identity = identity_cache.get(username)
+    if identity is None:
+        user = (await db.execute(
+            select(database.User).where(database.User.username == username)
+        )).scalars().first()
+        if user is None:
+            return None
+        identity = identity_cache.put(user)
+    return identity
+
+async def get_current_user(res: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(database.get_async_db)):
+    """
+    Verifies the Firebase ID Token and returns the corresponding local user
+    as a read-only UserIdentity (id, username, full_name, role).
     Raises 401 if user does not exist in local DB (Strict Registration).
     """
     token = res.credentials
@@ -73,7 +113,7 @@ def get_current_user(res: HTTPAuthorizationCredentials = Depends(security), db:
         )
     
     # Strict Check: User MUST exist
-    user = db.query(database.User).filter(database.User.username == email).first()
+    user = await resolve_identity(db, email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -82,7 +122,7 @@ def get_current_user(res: HTTPAuthorizationCredentials = Depends(security), db:
     
     return user
 
-async def get_current_user_optional(request: Request, db: Session = Depends(database.get_db)):
+async def get_current_user_optional(request: Request, db: AsyncSession = Depends(database.get_async_db)):
     auth_header = request.headers.get("Authorization")
     print(f"DEBUG: Auth Header Received: {auth_header}")
     if not auth_header or not auth_header.startswith("Bearer "):
@@ -93,12 +133,114 @@ async def get_current_user_optional(request: Request, db: Session = Depends(data
         decoded_token = verify_firebase_token(token)
         print(f"DEBUG: Decoded Token Email: {decoded_token.get('email')}")
         email = decoded_token.get('email')
-        user = db.query(database.User).filter(database.User.username == email).first()
+        user = await resolve_identity(db, email)
         print(f"DEBUG: Resolved User ID: {user.id if user else 'None'}")
         return user
     except Exception as e:
         print(f"DEBUG: Auth Exception: {e}")
         return None
 
-async def get_current_active_user(current_user: database.User = Depends(get_current_user)):
+async def get_current_active_user(current_user: UserIdentity = Depends(get_current_user)):
     return current_user
+
+async def update_user_role(db: AsyncSession, user: database.User, role: str) -> database.User:
+    user.role = role
+    await db.commit()
+    await db.refresh(user)
+    identity_cache.invalidate(user.username)
+    return user
+
+# Firebase ID tokens are valid for at most an hour after they are issued
+ID_TOKEN_LIFETIME = 3600
+
+async def revoke_token(db: AsyncSession, token: str):
+    """Denies a specific token until it expires (e.g. on logout), in every API process."""
+    exp = token_cache.revoke(token)
+    db.add(database.TokenRevocation(
+        token_digest=tokens.token_digest(token).hex(), revoked_at=time.time(), expires_at=exp
+    ))
+    await db.commit()
+
+async def revoke_user_sessions(db: AsyncSession, username: str):
+    """
+    Rejects every token issued to username (the account email) before now,
+    in every API process, and revokes its Firebase refresh tokens.
+    """
+    revoked_at = token_cache.revoke_user(username)
+    db.add(database.TokenRevocation(
+        subject=username, revoked_at=revoked_at, expires_at=revoked_at + ID_TOKEN_LIFETIME
+    ))
+    await db.commit()
+    try:
+        auth.revoke_refresh_tokens(auth.get_user_by_email(username).uid)
+    except Exception as e:
+        print(f"Warning: Firebase refresh token revocation failed for {username}: {e}")
+
+class RevocationSync:
+    """
+    Applies revocations written by any API process to this process's token
+    cache. Polling keeps token checks in memory; a revocation made elsewhere
+    takes effect here within one interval. Expired rows are pruned as we go.
+    """
+
+    def __init__(self, cache: tokens.VerifiedTokenCache, session_factory, interval: float = 5.0):
+        self.cache = cache
+        self._session_factory = session_factory
+        self.interval = interval
+        self._last_id = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.applied = 0
+        self.last_error: Optional[str] = None
+
+    def poll(self) -> int:
+        """Applies revocations not seen yet; returns how many."""
+        r = database.TokenRevocation
+        now = time.time()
+        db = self._session_factory()
+        try:
+            rows = db.execute(
+                select(r.id, r.token_digest, r.subject, r.revoked_at, r.expires_at)
+                .where(r.id > self._last_id, r.expires_at > now).order_by(r.id.asc())
+            ).all()
+            for row in rows:
+                if row.token_digest:
+                    self.cache.revoke_digest(bytes.fromhex(row.token_digest), row.expires_at)
+                if row.subject:
+                    self.cache.revoke_user(row.subject, row.revoked_at)
+            if rows:
+                self._last_id = rows[-1].id
+            db.execute(delete(r).where(r.expires_at <= now))
+            db.commit()
+        finally:
+            db.close()
+        self.applied += len(rows)
+        return len(rows)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.poll()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Token revocation sync failed: {e}")
+                if self._stop.wait(self.interval):
+                    return
+
+        self._thread = threading.Thread(target=run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+revocation_sync = RevocationSync(
+    token_cache, database.SessionLocal, interval=float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", 5))
+)
@@ -0,0 +1,456 @@
+"""
+Encrypted, content-addressed store for uploaded originals (X-rays, reports).
+
+Files live on the local filesystem under BLOB_STORE_DIR, sharded two levels
+deep (ab/cd/abcd...) so no directory grows unbounded. Only the blob id goes
+into SQL (AnalysisResult.blob_id); the blobs table holds sizes and a
+reference count.
+
+- Ids: HMAC-SHA256 of the upload's SHA-256 under a key derived from the
+  primary encryption key, so identical uploads share one file but a file
+  name does not reveal which known document it is. Uploads made after a key
+  rotation get new ids and simply stop deduplicating against older blobs.
+- Encryption: every blob has its own random data key, sealed with the
+  payload cipher (storage.py) into the file header. The body is AES-256-GCM
+  in CHUNK_SIZE chunks; each nonce carries the chunk index and a final-chunk
+  flag and the header and blob id are associated data, so chunks cannot be
+  reordered, swapped between blobs or truncated unnoticed. Byte ranges only
+  decrypt the chunks they touch. Key rotation re-seals the data key alone.
+- Writes stream through a temp file and are published with os.link, which
+  fails if the blob already exists; a concurrent writer of the same content
+  just keeps the existing file.
+- Reference counts: put() counts one reference inside the caller's
+  transaction, release() drops it. Blobs that have had no references for
+  BLOB_GC_GRACE_SECONDS are deleted by collect(): the row is deleted and the
+  file unlinked before that transaction commits, while put() bumps the row
+  before checking the file, so a blob revived mid-collection is rewritten
+  rather than lost.
+
+File layout:
+
+    magic "BTB" | version (1) | chunk size (4) | nonce prefix (7) | sealed key length (2)
+    | sealed data key | chunk 0 ciphertext + tag | chunk 1 ... | final chunk (may be empty)
+"""
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple, Union
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, storage
+
+MAGIC = b"BTB"
+FORMAT_V1 = 1
+_HEADER = struct.Struct(">3sBI7sH")
+_NONCE = struct.Struct(">7sIB")
+TAG_BYTES = 16
+CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_BYTES", 64 * 1024))
+
+Source = Union[bytes, str, BinaryIO]
+
+
+class BlobNotFound(KeyError):
+    pass
+
+
+class BlobCorrupted(ValueError):
+    pass
+
+
+def _id_key(crypto_service) -> bytes:
+    raw_key = base64.urlsafe_b64decode(crypto_service.key)
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"biotrack blob id").derive(raw_key)
+
+
+def _chunks(source: Source, size: int) -> Iterator[bytes]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for offset in range(0, len(view), size):
+            yield bytes(view[offset:offset + size])
+        return
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        if not isinstance(source, str):
+            f.seek(0)
+        while True:
+            # Ranged reads rely on every chunk but the last being exactly `size`
+            chunk = f.read(size)
+            while chunk and len(chunk) < size:
+                more = f.read(size - len(chunk))
+                if not more:
+                    break
+                chunk += more
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if isinstance(source, str):
+            f.close()
+
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end inclusive) for a single-range "bytes=" Range header, or None to
+    send the whole blob (no header, several ranges, a unit we do not serve, or
+    a malformed header, which RFC 9110 says to ignore). Raises ValueError when
+    a well-formed range cannot be satisfied (answer 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, dash, last = header[len("bytes="):].strip().partition("-")
+    if not dash or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+        return None
+    if not first: # bytes=-N: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f"Empty suffix range {header!r}")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None # Invalid (last before first), not unsatisfiable
+    if start >= size:
+        raise ValueError(f"Range {header!r} starts past the end ({size} bytes)")
+    return start, min(end, size - 1)
+
+
+class BlobStore:
+    def __init__(self, root: str, crypto_service, session_factory=None, chunk_size: int = CHUNK_SIZE,
+                 grace_seconds: float = 3600.0):
+        self.root = root
+        self.crypto_service = crypto_service
+        self._session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.grace_seconds = grace_seconds
+        self._id_key = _id_key(crypto_service)
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._tmp, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.dedup_hits = 0
+        self.bytes_written = 0
+        self.reads = 0
+        self.collected = 0
+        self.last_collect_error: Optional[str] = None
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def blob_id(self, sha256_hex: str) -> str:
+        return hmac.new(self._id_key, bytes.fromhex(sha256_hex), hashlib.sha256).hexdigest()
+
+    def path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    def exists(self, blob_id: str) -> bool:
+        return os.path.exists(self.path(blob_id))
+
+    # --- Files (sync; async callers go through asyncio.to_thread) ---
+
+    def write(self, source: Source, blob_id: str) -> bool:
+        """Encrypts source into the blob's file unless it already exists; True if this call wrote it."""
+        path = self.path(blob_id)
+        if os.path.exists(path):
+            return False
+        data_key, prefix = AESGCM.generate_key(bit_length=256), os.urandom(7)
+        sealed_key = storage.seal(self.crypto_service, data_key)
+        header = _HEADER.pack(MAGIC, FORMAT_V1, self.chunk_size, prefix, len(sealed_key))
+        aad = header[:-2] + blob_id.encode()
+        aead = AESGCM(data_key)
+
+        written = 0
+        tmp = tempfile.NamedTemporaryFile(dir=self._tmp, prefix="blob_", delete=False)
+        try:
+            with tmp:
+                tmp.write(header + sealed_key)
+                index, pending = 0, None
+                for chunk in _chunks(source, self.chunk_size):
+                    if pending is not None:
+                        tmp.write(aead.encrypt(_NONCE.pack(prefix, index, 0), pending, aad))
+                        index += 1
+                    pending = chunk
+                    written += len(chunk)
+                # The final chunk is flagged in its nonce; an empty blob is one empty final chunk
+                tmp.write(aead.encrypt(_NONCE.pack(prefix, index, 1), pending or b"", aad))
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(tmp.name, path)
+            except FileExistsError:
+                return False # Same content, written concurrently
+            except OSError:
+                os.replace(tmp.name, path) # No hard links on this filesystem; same content either way
+        finally:
+            try:
+                os.unlink(tmp.name)
+            except FileNotFoundError:
+                pass
+        self._count(writes=1, bytes_written=written)
+        return True
+
+    def _open(self, blob_id: str) -> Tuple[BinaryIO, AESGCM, bytes, bytes, int, int]:
+        try:
+            f = open(self.path(blob_id), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+        try:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise BlobCorrupted(f"Blob {blob_id} is truncated")
+            magic, version, chunk_size, prefix, key_len = _HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_V1:
+                raise BlobCorrupted(f"Blob {blob_id} has an unknown format")
+            try:
+                data_key = storage.unseal(self.crypto_service, f.read(key_len))
+            except storage.PayloadFormatError as e:
+                raise BlobCorrupted(f"Blob {blob_id} key cannot be unsealed: {e}")
+            return f, AESGCM(data_key), prefix, header[:-2] + blob_id.encode(), chunk_size, _HEADER.size + key_len
+        except Exception:
+            f.close()
+            raise
+
+    @staticmethod
+    def _plain_size(file_size: int, body_start: int, chunk_size: int) -> Tuple[int, int]:
+        """(plaintext bytes, chunk count) for a blob file of file_size bytes."""
+        body = file_size - body_start
+        chunks = max(1, -(-body // (chunk_size + TAG_BYTES)))
+        return body - chunks * TAG_BYTES, chunks
+
+    def size(self, blob_id: str) -> int:
+        f, _, _, _, chunk_size, body_start = self._open(blob_id)
+        with f:
+            return self._plain_size(os.fstat(f.fileno()).st_size, body_start, chunk_size)[0]
+
+    def read(self, blob_id: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Plaintext bytes start..end (inclusive), decrypting only the chunks that
+        overlap the range. Raises BlobNotFound / BlobCorrupted before the first
+        chunk is produced for header problems, mid-stream for a bad chunk.
+        """
+        f, aead, prefix, aad, chunk_size, body_start = self._open(blob_id)
+        size, chunks = self._plain_size(os.fstat(f.fileno()).st_size, body_start, chunk_size)
+        end = size - 1 if end is None else min(end, size - 1)
+        self._count(reads=1)
+
+        def chunks_in_range() -> Iterator[bytes]:
+            with f:
+                first, last = start // chunk_size, max(end, start) // chunk_size
+                f.seek(body_start + first * (chunk_size + TAG_BYTES))
+                for index in range(first, min(last, chunks - 1) + 1):
+                    sealed = f.read(chunk_size + TAG_BYTES)
+                    try:
+                        plain = aead.decrypt(_NONCE.pack(prefix, index, int(index == chunks - 1)), sealed, aad)
+                    except InvalidTag:
+                        raise BlobCorrupted(f"Blob {blob_id} chunk {index} failed authentication")
+                    offset = index * chunk_size
+                    piece = plain[max(0, start - offset):end - offset + 1]
+                    if piece:
+                        yield piece
+
+        if end < start:
+            f.close()
+            return iter(())
+        return chunks_in_range()
+
+    def rewrap(self, blob_id: str, db=None) -> bool:
+        """
+        Re-seals the blob's data key under the primary key; False if it
+        already is. The body is copied, not re-encrypted. With db (a sync
+        session) the blob's row is locked before the file is replaced, as
+        collect() does, and must still exist (else BlobNotFound); the caller
+        commits, so collect() cannot delete the row and the file in between.
+        """
+        path = self.path(blob_id)
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+            magic, version, chunk_size, prefix, key_len = _HEADER.unpack(header)
+            sealed_key = f.read(key_len)
+            if storage.payload_key_id(sealed_key) == self.crypto_service.payload_key_id:
+                return False
+            new_key = storage.seal(self.crypto_service, storage.unseal(self.crypto_service, sealed_key))
+            tmp = tempfile.NamedTemporaryFile(dir=self._tmp, prefix="rewrap_", delete=False)
+            try:
+                with tmp:
+                    tmp.write(_HEADER.pack(magic, version, chunk_size, prefix, len(new_key)) + new_key)
+                    while True:
+                        block = f.read(1024 * 1024)
+                        if not block:
+                            break
+                        tmp.write(block)
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                if db is not None:
+                    b = database.StoredBlob
+                    if not db.execute(update(b).where(b.id == blob_id).values(refcount=b.refcount)).rowcount:
+                        raise BlobNotFound(blob_id) # Collected while we copied it: do not bring the file back
+                os.replace(tmp.name, path)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        return True
+
+    # --- References (caller's transaction) ---
+
+    async def put(self, db: AsyncSession, source: Source, sha256_hex: str, media_type: Optional[str] = None) -> str:
+        """
+        Stores source (if no identical blob exists) and counts one reference in
+        db's transaction; the caller commits. Returns the blob id.
+        """
+        blob_id = self.blob_id(sha256_hex)
+        if not await asyncio.to_thread(self.write, source, blob_id):
+            self._count(dedup_hits=1)
+        b = database.StoredBlob
+        bumped = (await db.execute(
+            update(b).where(b.id == blob_id).values(refcount=b.refcount + 1, orphaned_at=None)
+        )).rowcount
+        # collect() may have removed the file between our write and the row bump
+        if not self.exists(blob_id):
+            await asyncio.to_thread(self.write, source, blob_id)
+        if not bumped:
+            await self._insert(db, blob_id, media_type)
+        return blob_id
+
+    async def _insert(self, db: AsyncSession, blob_id: str, media_type: Optional[str]):
+        b = database.StoredBlob
+        values = dict(
+            id=blob_id, media_type=media_type, size_bytes=await asyncio.to_thread(self.size, blob_id),
+            stored_bytes=os.path.getsize(self.path(blob_id)), refcount=1, created_at=datetime.datetime.utcnow()
+        )
+        dialect = db.bind.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(b.__table__).values(**values)
+            # Another request inserted the row since our bump found nothing
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["id"], set_={"refcount": b.__table__.c.refcount + 1, "orphaned_at": None}
+            ))
+            return
+        # Generic fallback for other backends
+        db.add(b(**values))
+        await db.flush()
+
+    async def release(self, db: AsyncSession, blob_id: Optional[str]):
+        """Drops one reference in db's transaction; the file goes at the next collect() after the grace period."""
+        if not blob_id:
+            return
+        b = database.StoredBlob
+        await db.execute(update(b).where(b.id == blob_id, b.refcount > 0).values(refcount=b.refcount - 1))
+        await db.execute(
+            update(b).where(b.id == blob_id, b.refcount == 0, b.orphaned_at.is_(None))
+            .values(orphaned_at=datetime.datetime.utcnow())
+        )
+
+    # --- Garbage collection (sync, own sessions) ---
+
+    def collect(self, sweep_files: bool = False) -> int:
+        """
+        Deletes blobs unreferenced for longer than the grace period and stale
+        temp files. sweep_files also removes blob files that never got a row
+        (a crash between write and commit); that walks the whole tree.
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.grace_seconds)
+        b = database.StoredBlob
+        removed = 0
+        db = self._session_factory()
+        try:
+            candidates = db.scalars(select(b.id).where(b.refcount <= 0, b.orphaned_at < cutoff)).all()
+            for blob_id in candidates:
+                deleted = db.execute(delete(b).where(b.id == blob_id, b.refcount <= 0)).rowcount
+                if deleted:
+                    # Unlink before committing: a concurrent put() waits on the row and then rewrites the file
+                    try:
+                        os.unlink(self.path(blob_id))
+                    except FileNotFoundError:
+                        pass
+                    removed += 1
+                db.commit()
+
+            stale = time.time() - self.grace_seconds
+            for name in os.listdir(self._tmp):
+                path = os.path.join(self._tmp, name)
+                if os.path.getmtime(path) < stale:
+                    os.unlink(path)
+            if sweep_files:
+                removed += self._sweep_files(db, stale)
+        finally:
+            db.close()
+        self._count(collected=removed)
+        return removed
+
+    def _sweep_files(self, db, stale: float) -> int:
+        removed = 0
+        for dirpath, _, names in os.walk(self.root):
+            if dirpath == self._tmp:
+                continue
+            for name in names:
+                path = os.path.join(dirpath, name)
+                if os.path.getmtime(path) < stale and db.get(database.StoredBlob, name) is None:
+                    os.unlink(path)
+                    removed += 1
+        return removed
+
+    def start_collector(self, interval: float):
+        """Runs collect() every interval seconds on a daemon thread, sweeping files on the first pass."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            sweep = True
+            while True:
+                try:
+                    self.collect(sweep_files=sweep)
+                    self.last_collect_error = None
+                except Exception as e:
+                    self.last_collect_error = str(e)
+                    print(f"Blob collection failed: {e}")
+                sweep = False
+                if self._stop.wait(interval):
+                    return
+
+        self._thread = threading.Thread(target=run, name="blob-collector", daemon=True)
+        self._thread.start()
+
+    def stop_collector(self, timeout: Optional[float] = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "dedup_hits": self.dedup_hits,
+                "bytes_written": self.bytes_written,
+                "reads": self.reads,
+                "collected": self.collected,
+                "last_collect_error": self.last_collect_error,
+            }
+
+
+def store_from_env(crypto_service) -> BlobStore:
+    return BlobStore(
+        os.getenv("BLOB_STORE_DIR", "blobstore"),
+        crypto_service,
+        session_factory=database.SessionLocal,
+        grace_seconds=float(os.getenv("BLOB_GC_GRACE_SECONDS", 3600))
+    )
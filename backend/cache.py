@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from . import storage
+
+
+class PayloadCache:
+    """
+    In-process LRU cache of decrypted analysis payloads.
+
+    Entries are keyed by result id plus a digest of the ciphertext, so a
+    re-encrypted or rewritten row never serves stale plaintext. The cache is
+    bounded by plaintext bytes and entries expire after a TTL to limit how
+    long PHI stays resident in memory.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 300.0, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict() # key -> (payload, size, expires_at)
+        self._by_result: Dict[Any, set] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _digest(ciphertext) -> bytes:
+        if isinstance(ciphertext, str):
+            ciphertext = ciphertext.encode()
+        return hashlib.blake2b(ciphertext, digest_size=16).digest()
+
+    def get(self, result_id, ciphertext) -> Optional[Dict[str, Any]]:
+        key = (result_id, self._digest(ciphertext))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, result_id, ciphertext, payload: Dict[str, Any], size: int):
+        if size > self.max_bytes:
+            return
+        key = (result_id, self._digest(ciphertext))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, size, self._clock() + self.ttl_seconds)
+            self._by_result.setdefault(result_id, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def load(self, result_id, ciphertext: Union[bytes, str], crypto_service) -> Dict[str, Any]:
+        """
+        Returns the decoded payload, decrypting and parsing only on a miss.
+        Accepts a binary v2 payload or a legacy Fernet token (see storage.py).
+        Callers must treat the returned dict as read-only; it is shared.
+        """
+        data = self.get(result_id, ciphertext)
+        if data is None:
+            plaintext = storage.decrypt_stored(crypto_service, ciphertext)
+            data = json.loads(plaintext.decode())
+            self.put(result_id, ciphertext, data, len(plaintext))
+        return data
+
+    def evict(self, result_id):
+        """Drops every cached variant of a result, e.g. when the report is deleted."""
+        with self._lock:
+            for key in list(self._by_result.get(result_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_result.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key):
+        payload, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._by_result.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_result[key[0]]
+
+
+payload_cache = PayloadCache(
+    max_bytes=int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("PAYLOAD_CACHE_TTL_SECONDS", 300))
+)
@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, Float, String, Text, Date, DateTime, LargeBinary, ForeignKey, Index, UniqueConstraint, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import datetime
 import os
 from dotenv import load_dotenv
@@ -9,11 +11,85 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./medical_assistant.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+# Storage profile for SQLite: "production" (WAL, tuned pragmas) or "default"
+# (plain rollback journal, the stock sqlite3 settings).
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        # WAL lets readers run alongside the single writer and turns most
+        # commits into an append; NORMAL only fsyncs at checkpoints, which is
+        # still durable across application crashes.
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", 256 * 1024 * 1024)),
+        "cache_size": -int(os.getenv("SQLITE_CACHE_KB", 64 * 1024)), # Negative = KiB
+        "temp_store": "MEMORY",
+    },
+}
+
+def sqlite_pragmas(profile: str) -> dict:
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {', '.join(SQLITE_PROFILES)}")
+    return SQLITE_PROFILES[profile]
+
+def pool_options(url: str, profile: str) -> dict:
+    """Pool sizing for file-backed databases; in-memory SQLite keeps SQLAlchemy's default pool."""
+    parsed = make_url(url)
+    if profile == "default" or (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30)),
+        "pool_pre_ping": "sqlite" not in url,
+    }
+
+def install_sqlite_pragmas(sync_engine, profile: str):
+    """Applies the profile's PRAGMAs to every new connection of a SQLite engine."""
+    pragmas = sqlite_pragmas(profile)
+    if not pragmas or sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def make_engine(url: str, profile: str = DB_PROFILE):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {},
+        **pool_options(url, profile)
+    )
+    install_sqlite_pragmas(engine, profile)
+    return engine
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def async_database_url(url: str) -> str:
+    """Maps a sync DATABASE_URL onto its async driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+# Request handlers use the async engine; scripts, migrations and the audit
+# writer thread keep using the sync engine above.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_database_url(SQLALCHEMY_DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, DB_PROFILE))
+install_sqlite_pragmas(async_engine.sync_engine, DB_PROFILE)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 class User(Base):
@@ -29,11 +105,18 @@ class AnalysisResult(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     analysis_type = Column(String) # xray, report
-    encrypted_data = Column(Text) # AES-256 encrypted JSON or blob path
+    encrypted_data = Column(Text) # Legacy: base64 Fernet token of the JSON (NULL once migrated)
+    encrypted_payload = Column(LargeBinary) # Versioned compressed + encrypted JSON, see storage.py
+    blob_id = Column(String(64), ForeignKey("blobs.id"), nullable=True) # Uploaded original, see blobstore.py
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     owner = relationship("User")
 
+    # Serves the keyset-paginated history listing (see history.py)
+    __table_args__ = (
+        Index("ix_analysis_results_user_type_created", "user_id", "analysis_type", "created_at"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -56,6 +139,8 @@ class MealLog(Base):
 
     owner = relationship("User")
 
+    __table_args__ = (Index("ix_meal_logs_user_created", "user_id", "created_at"),)
+
 class WaterLog(Base):
     __tablename__ = "water_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -65,8 +150,80 @@ class WaterLog(Base):
 
     owner = relationship("User")
 
+    __table_args__ = (Index("ix_water_logs_user_created", "user_id", "created_at"),)
+
+class DailyNutritionRollup(Base):
+    __tablename__ = "daily_nutrition_rollup"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False) # UTC calendar day
+    calories = Column(Integer, default=0, nullable=False)
+    protein = Column(Integer, default=0, nullable=False)
+    carbs = Column(Integer, default=0, nullable=False)
+    fats = Column(Integer, default=0, nullable=False)
+    water_ml = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_daily_nutrition_rollup_user_day"),)
+
+class TrendPoint(Base):
+    __tablename__ = "trend_points"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    result_id = Column(Integer, ForeignKey("analysis_results.id"), unique=True)
+    recorded_at = Column(DateTime, default=datetime.datetime.utcnow)
+    encrypted_projection = Column(Text) # Encrypted JSON: biomarkers, macros, vitality score
+
+    __table_args__ = (Index("ix_trend_points_user_recorded", "user_id", "recorded_at"),)
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+    id = Column(String, primary_key=True) # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(String, default="queued") # queued, processing, completed, failed
+    stage = Column(String, default="queued")
+    progress = Column(Integer, default=0) # 0-100
+    analysis_id = Column(Integer, ForeignKey("analysis_results.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AnalysisCacheEntry(Base):
+    """OCR text and parsed biomarkers of an upload, addressed by content hash (see analysis_cache.py)."""
+    __tablename__ = "analysis_cache"
+    key = Column(String(64), primary_key=True) # SHA-256 of pipeline salt + upload SHA-256
+    encrypted_payload = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    cpu_seconds = Column(Float, default=0.0) # What producing the entry cost
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class TokenRevocation(Base):
+    """A logout (token_digest) or a per-user session revocation (subject), shared by all API processes (see auth.RevocationSync)."""
+    __tablename__ = "token_revocations"
+    # Pollers read ids above the last one seen: ids must never be reused after pruning
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    token_digest = Column(String(64), nullable=True) # SHA-256 hex of the revoked ID token
+    subject = Column(String, nullable=True) # Firebase uid or email whose earlier tokens are revoked
+    revoked_at = Column(Float, nullable=False) # Epoch seconds, like the tokens' iat/exp
+    expires_at = Column(Float, nullable=False, index=True) # No token it applies to is valid after this
+
+class StoredBlob(Base):
+    """An encrypted file in the blob store and how many results reference it (see blobstore.py)."""
+    __tablename__ = "blobs"
+    id = Column(String(64), primary_key=True) # Keyed hash of the content; also the file name
+    media_type = Column(String)
+    size_bytes = Column(Integer, nullable=False) # Plaintext
+    stored_bytes = Column(Integer, nullable=False) # On disk, with header and tags
+    refcount = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    orphaned_at = Column(DateTime, nullable=True, index=True) # When refcount last reached 0
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    from . import migrations
+    migrations.run_migrations(engine)
     db = SessionLocal()
     guest = db.query(User).filter(User.username == "guest").first()
     if not guest:
@@ -88,3 +245,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,213 @@
+"""
+Rule-table diet plan selection.
+
+Biomarker values are bucketed against per-marker thresholds, the buckets
+switch on clinical conditions, and the highest-priority rule whose
+conditions are all present picks one of the precomputed plans. Adding a
+marker, condition or combination is a table edit rather than another elif.
+
+Plans are immutable and built once at import. A patient's plan depends only
+on the bucket signature, so the selection is memoized per signature and the
+batch API resolves each distinct signature once.
+"""
+import bisect
+import functools
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Tuple
+
+# Ascending thresholds; a value's bucket is how many of them it exceeds
+MARKER_THRESHOLDS: Mapping[str, Tuple[float, ...]] = MappingProxyType({
+    "Glucose": (99, 126),
+    "HbA1c": (5.6, 6.5),
+    "Systolic BP": (120, 140),
+    "Creatinine": (1.2,),
+})
+# Units the thresholds are in (labs.py's canonical units); readings in any other unit are ignored
+MARKER_UNITS: Mapping[str, str] = MappingProxyType({
+    "Glucose": "mg/dL",
+    "HbA1c": "%",
+    "Systolic BP": "mmHg",
+    "Creatinine": "mg/dL",
+})
+MARKERS = tuple(MARKER_THRESHOLDS)
+_SLOTS = {name: i for i, name in enumerate(MARKERS)}
+_THRESHOLDS = tuple(MARKER_THRESHOLDS.values())
+
+
+class Condition(NamedTuple):
+    name: str
+    any_of: Tuple[Tuple[str, int], ...] # (marker, minimum bucket) - any one is enough
+
+
+CONDITIONS = (
+    Condition("diabetic", (("Glucose", 2), ("HbA1c", 2))),
+    Condition("hypertensive", (("Systolic BP", 2),)),
+    Condition("renal", (("Creatinine", 1),)),
+)
+
+
+class Rule(NamedTuple):
+    priority: int
+    requires: FrozenSet[str]
+    plan: str
+
+
+# Highest priority first; the empty rule is the fallback
+RULES = tuple(sorted((
+    Rule(40, frozenset({"diabetic", "hypertensive"}), "diabetic_dash"),
+    Rule(30, frozenset({"diabetic"}), "low_glycemic"),
+    Rule(20, frozenset({"hypertensive"}), "dash"),
+    Rule(10, frozenset({"renal"}), "renal"),
+    Rule(0, frozenset(), "balanced"),
+), key=lambda r: -r.priority))
+
+
+MEAL_FIELDS = ("time", "name", "calories", "protein", "carbs", "fats", "desc")
+
+
+class DietPlan(NamedTuple):
+    """Immutable plan template; to_dict() produces the JSON shape the API returns."""
+    diet_type: str
+    macros: Mapping[str, int]
+    meals: Tuple[Mapping[str, Any], ...]
+    shopping_list: Tuple[str, ...]
+    recommendations: Tuple[str, ...]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "diet_type": self.diet_type,
+            "macros": self.macros.copy(),
+            "meals": [m.copy() for m in self.meals],
+            "shopping_list": list(self.shopping_list),
+            "recommendations": list(self.recommendations)
+        }
+
+
+def _plan(diet_type, macros, meals, shopping_list) -> DietPlan:
+    return DietPlan(
+        diet_type,
+        MappingProxyType(macros),
+        tuple(MappingProxyType(dict(zip(MEAL_FIELDS, m))) for m in meals),
+        tuple(shopping_list),
+        (f"Follow the {diet_type} plan.", "Stay hydrated.", "Monitor portion sizes.")
+    )
+
+
+PLANS: Mapping[str, DietPlan] = MappingProxyType({
+    "balanced": _plan(
+        "Balanced Maintenance",
+        {"calories": 2000, "protein": 150, "carbs": 200, "fats": 65, "hydration": 2500},
+        [
+            ("Breakfast", "Oatmeal with Berries", 400, 12, 60, 8, "Steel-cut oats with blueberries and almonds"),
+            ("Lunch", "Grilled Chicken Salad", 600, 45, 20, 35, "Mixed greens, cherry tomatoes, balsamic vinaigrette"),
+            ("Snack", "Greek Yogurt Parfait", 250, 15, 30, 5, "Low-fat yogurt with honey and granola"),
+            ("Dinner", "Baked Salmon & Quinoa", 550, 40, 45, 20, "Lemon herb salmon with steamed broccoli"),
+        ],
+        ["Oats", "Blueberries", "Chicken Breast", "Mixed Greens", "Salmon", "Quinoa", "Greek Yogurt"]
+    ),
+    "low_glycemic": _plan(
+        "Low Glycemic / Diabetic Friendly",
+        {"calories": 1800, "protein": 140, "carbs": 130, "fats": 70, "hydration": 2200},
+        [
+            ("Breakfast", "Vegetable Omelet", 350, 22, 8, 25, "3 eggs with spinach and mushrooms"),
+            ("Lunch", "Turkey Lettuce Wraps", 450, 35, 15, 28, "Lean ground turkey, asian slaw, lettuce cups"),
+            ("Snack", "Handful of Almonds", 180, 6, 6, 16, "Raw almonds (unsalted)"),
+            ("Dinner", "Zucchini Noodles with Pesto", 400, 28, 12, 24, "Spiralized zucchini, chicken, basil pesto"),
+        ],
+        ["Eggs", "Spinach", "Ground Turkey", "Lettuce", "Zucchini", "Chicken Breast", "Almonds", "Pesto"]
+    ),
+    "dash": _plan(
+        "DASH (Heart Healthy)",
+        {"calories": 1900, "protein": 130, "carbs": 220, "fats": 50, "hydration": 2000},
+        [
+            ("Breakfast", "Banana & Spinach Smoothie", 300, 10, 55, 4, "Spinach, banana, skim milk, chia seeds"),
+            ("Lunch", "Lentil Soup", 450, 25, 65, 8, "Low-sodium lentil soup with whole wheat roll"),
+            ("Snack", "Apple Slices", 100, 1, 25, 0, "Fresh apple slices"),
+            ("Dinner", "Grilled White Fish", 500, 45, 40, 15, "Cod or Tilapia with brown rice and asparagus"),
+        ],
+        ["Banana", "Spinach", "Skim Milk", "Lentils", "Whole Wheat Rolls", "Cod/Tilapia", "Brown Rice", "Asparagus"]
+    ),
+    "diabetic_dash": _plan(
+        "Low Glycemic DASH (Diabetic + Heart Healthy)",
+        {"calories": 1800, "protein": 135, "carbs": 140, "fats": 55, "hydration": 2000},
+        [
+            ("Breakfast", "Spinach Egg-White Omelet", 250, 24, 8, 10, "Egg whites with spinach and tomatoes, no added salt"),
+            ("Lunch", "Lentil & Greens Salad", 450, 28, 40, 14, "Lentils, mixed greens, olive oil and lemon"),
+            ("Snack", "Unsalted Almonds", 160, 6, 6, 14, "Small handful of raw almonds"),
+            ("Dinner", "Herb-Baked Cod", 450, 45, 30, 12, "Cod with quinoa and steamed asparagus"),
+        ],
+        ["Egg Whites", "Spinach", "Tomatoes", "Lentils", "Mixed Greens", "Almonds", "Cod", "Quinoa", "Asparagus"]
+    ),
+    "renal": _plan(
+        "Renal Friendly",
+        {"calories": 1800, "protein": 60, "carbs": 250, "fats": 60, "hydration": 1800},
+        [
+            ("Breakfast", "Rice Cereal with Berries", 350, 4, 70, 4, "Rice cereal with almond milk and strawberries"),
+            ("Lunch", "Pasta with Olive Oil", 500, 10, 80, 14, "White pasta with garlic, olive oil, and bell peppers"),
+            ("Snack", "Rice Cakes", 100, 2, 22, 0, "Plain rice cakes"),
+            ("Dinner", "Eggplant Stir-fry", 450, 8, 60, 20, "Eggplant, onions, carrots, white rice"),
+        ],
+        ["Rice Cereal", "Strawberries", "Pasta", "Bell Peppers", "Eggplant", "White Rice", "Rice Cakes"]
+    ),
+})
+
+
+def marker_signature(biomarkers) -> Tuple[int, ...]:
+    """
+    Canonical memo key: one bucket per known marker, in MARKERS order.
+    Accepts the extractor's [{"name", "value", "unit"}] list or a plain {name: value}
+    mapping; readings whose unit differs from MARKER_UNITS are left out.
+    """
+    if isinstance(biomarkers, Mapping):
+        biomarkers = [{"name": k, "value": v} for k, v in biomarkers.items()]
+    buckets = [0] * len(MARKERS)
+    for m in biomarkers or ():
+        slot = _SLOTS.get(m.get("name"))
+        if slot is None:
+            continue
+        unit = m.get("unit")
+        if unit and unit.lower() != MARKER_UNITS[m["name"]].lower():
+            continue # Not converted to the threshold's unit (e.g. creatinine in mmol/L)
+        value = m.get("value")
+        if type(value) not in (int, float):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+        # Bucket = number of thresholds strictly below the value
+        buckets[slot] = bisect.bisect_left(_THRESHOLDS[slot], value)
+    return tuple(buckets)
+
+
+def conditions_for(signature: Tuple[int, ...]) -> FrozenSet[str]:
+    buckets = dict(zip(MARKERS, signature))
+    return frozenset(c.name for c in CONDITIONS if any(buckets[m] >= level for m, level in c.any_of))
+
+
+@functools.lru_cache(maxsize=4096)
+def plan_for_signature(signature: Tuple[int, ...]) -> DietPlan:
+    active = conditions_for(signature)
+    for rule in RULES:
+        if rule.requires <= active:
+            return PLANS[rule.plan]
+    return PLANS["balanced"]
+
+
+def generate_plan(diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
+    return plan_for_signature(marker_signature(diagnosis_data.get("biomarkers", []))).to_dict()
+
+
+def generate_plans(diagnoses: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Plans for many patients. Each distinct signature is resolved and rendered
+    once per call, so patients with the same plan share one dict in the result.
+    """
+    rendered: Dict[Tuple[int, ...], Dict[str, Any]] = {}
+    plans = []
+    for d in diagnoses:
+        signature = marker_signature(d.get("biomarkers", []))
+        plan = rendered.get(signature)
+        if plan is None:
+            plan = rendered[signature] = plan_for_signature(signature).to_dict()
+        plans.append(plan)
+    return plans
@@ -0,0 +1,209 @@
+"""
+Memory-mapped food composition database.
+
+build() converts a nutrient CSV (same columns as data/foods.csv) into one
+read-only file that every worker process maps instead of parsing the CSV
+into Python objects. The OS page cache holds a single copy shared by all
+workers, and opening the file costs the same for 12 foods or 500,000.
+
+Layout (little endian, every section 8-byte aligned):
+
+    header          magic, version, counts and section offsets
+    name offsets    uint32[count + 1] into the name blob
+    name blob       UTF-8 names, concatenated
+    synonym offsets uint32[count + 1] into the synonym blob
+    synonym blob    UTF-8, "|"-joined per food
+    key offsets     uint32[key_count + 1] into the key blob
+    key blob        normalized spellings (foods.tokenize joined by " "), sorted bytewise
+    key foods       uint32[key_count], food id per key
+    columns         float32[count] per column in COLUMNS order
+
+Lookups go through MappedNameIndex, a binary search over the sorted keys for
+each n-gram of the query; it returns matches in the same shape as
+foods.TokenAutomaton.scan.
+"""
+import csv
+import mmap
+import struct
+from typing import Dict, Iterator, List, Sequence, Tuple
+from .foods import NUTRIENTS, tokenize
+
+MAGIC = b"BTFOODDB"
+VERSION = 1
+COLUMNS = ("serving_g",) + NUTRIENTS
+
+_HEADER = struct.Struct("<8sIIII8Q")
+
+
+class FoodDBError(ValueError):
+    pass
+
+
+def _align(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def _string_section(strings: Sequence[bytes]) -> Tuple[bytes, bytes]:
+    offsets = [0]
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+    return struct.pack(f"<{len(offsets)}I", *offsets), b"".join(strings)
+
+
+def build(csv_path: str, out_path: str) -> Dict[str, int]:
+    """Builds the mapped file from a nutrient CSV; returns row/key counts and file size."""
+    names: List[bytes] = []
+    synonyms: List[bytes] = []
+    columns: Dict[str, List[float]] = {c: [] for c in COLUMNS}
+    keys: Dict[bytes, int] = {}
+    max_key_tokens = 0
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            food_id = len(names)
+            name = row["name"].strip()
+            syns = [s.strip() for s in (row.get("synonyms") or "").split("|") if s.strip()]
+            names.append(name.encode())
+            synonyms.append("|".join(syns).encode())
+            columns["serving_g"].append(float(row.get("serving_g") or 100))
+            for n in NUTRIENTS:
+                columns[n].append(float(row.get(n) or 0))
+            for spelling in [name] + syns:
+                tokens = tokenize(spelling)
+                if tokens:
+                    keys.setdefault(" ".join(tokens).encode(), food_id) # First spelling wins
+                    max_key_tokens = max(max_key_tokens, len(tokens))
+
+    count = len(names)
+    sorted_keys = sorted(keys)
+    sections = [
+        *_string_section(names),
+        *_string_section(synonyms),
+        *_string_section(sorted_keys),
+        struct.pack(f"<{len(sorted_keys)}I", *(keys[k] for k in sorted_keys)),
+        b"".join(struct.pack(f"<{count}f", *columns[c]) for c in COLUMNS),
+    ]
+
+    body = bytearray()
+    offsets = []
+    for section in sections:
+        _align(body)
+        offsets.append(_HEADER.size + len(body))
+        body.extend(section)
+
+    if _HEADER.size + len(body) > 0xFFFFFFFF or any(len(s) > 0xFFFFFFFF for s in sections):
+        raise FoodDBError("Food table too large for 32-bit offsets")
+
+    header = _HEADER.pack(MAGIC, VERSION, count, len(sorted_keys), max_key_tokens, *offsets)
+    with open(out_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+    return {"foods": count, "keys": len(sorted_keys), "bytes": len(header) + len(body)}
+
+
+class _Strings:
+    """Sequence view over an offsets array + blob inside the mapping."""
+
+    def __init__(self, mm: mmap.mmap, offsets: memoryview, blob_start: int):
+        self._mm = mm
+        self._offsets = offsets
+        self._blob_start = blob_start
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self._mm[self._blob_start + self._offsets[i]:self._blob_start + self._offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.raw(i).decode()
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class MappedFoodTable:
+    """Read-only food table backed by the mapped file; same interface as foods.FoodTable."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, key_count, max_key_tokens, *offsets = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise FoodDBError(f"{path} is not a version {VERSION} food database")
+        name_off, name_blob, syn_off, syn_blob, key_off, key_blob, key_food, cols = offsets
+
+        view = memoryview(self._mm)
+        self.path = path
+        self.count = count
+        self.max_key_tokens = max_key_tokens
+        self.names = _Strings(self._mm, view[name_off:name_off + 4 * (count + 1)].cast("I"), name_blob)
+        self._synonyms = _Strings(self._mm, view[syn_off:syn_off + 4 * (count + 1)].cast("I"), syn_blob)
+        self.keys = _Strings(self._mm, view[key_off:key_off + 4 * (key_count + 1)].cast("I"), key_blob)
+        self.key_foods = view[key_food:key_food + 4 * key_count].cast("I")
+        self.columns = {
+            c: view[cols + 4 * count * i:cols + 4 * count * (i + 1)].cast("f")
+            for i, c in enumerate(COLUMNS)
+        }
+        self.serving_g = self.columns["serving_g"]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def synonyms(self):
+        return _SynonymView(self._synonyms)
+
+    def nutrients(self, food_id: int) -> Dict[str, float]:
+        return {n: round(self.columns[n][food_id], 3) for n in NUTRIENTS}
+
+    def name_index(self) -> "MappedNameIndex":
+        return MappedNameIndex(self)
+
+
+class _SynonymView:
+    def __init__(self, strings: _Strings):
+        self._strings = strings
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __getitem__(self, i: int) -> Tuple[str, ...]:
+        raw = self._strings[i]
+        return tuple(raw.split("|")) if raw else ()
+
+
+class MappedNameIndex:
+    """Binary search over the sorted spelling keys; O(tokens x key length x log keys) per query."""
+
+    def __init__(self, table: MappedFoodTable):
+        self._keys = table.keys
+        self._foods = table.key_foods
+        self._max_tokens = table.max_key_tokens
+
+    def _lower_bound(self, target: bytes) -> int:
+        lo, hi = 0, len(self._keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._keys.raw(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def scan(self, tokens: Sequence[str]) -> List[Tuple[int, int, int]]:
+        matches = []
+        n = len(self._keys)
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(len(tokens), start + self._max_tokens) + 1):
+                target = " ".join(tokens[start:end]).encode()
+                i = self._lower_bound(target)
+                if i < n and self._keys.raw(i) == target:
+                    matches.append((start, end, self._foods[i]))
+                    i += 1
+                # Stop growing the n-gram once no longer key shares this prefix
+                if i >= n or not self._keys.raw(i).startswith(target + b" "):
+                    break
+        return matches
@@ -0,0 +1,261 @@
+"""
+Food lookup engine for free-text meal descriptions.
+
+"2 eggs and a banana" is tokenized once and scanned with a token-level
+Aho-Corasick automaton built over every food name and synonym, so the cost
+of a lookup depends on the length of the text, not on the size of the food
+table. Each match takes its quantity and unit from the words just before it
+("200 g of chicken", "half a cup of rice", "a dozen eggs") and the items are
+summed.
+
+The engine is built once per process (food_engine below), from the
+memory-mapped database when one has been built (see fooddb.py) or else from
+data/foods.csv / FOOD_TABLE_PATH.
+"""
+import csv
+import os
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+DEFAULT_FOODS_CSV = os.path.join(os.path.dirname(__file__), "data", "foods.csv")
+DEFAULT_FOOD_DB = os.path.join(os.path.dirname(__file__), "data", "foods.bin")
+
+_TOKEN_RE = re.compile(r"\d+/\d+|\d+(?:\.\d+)?|[a-z]+")
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "half": 0.5, "quarter": 0.25, "couple": 2, "few": 3, "dozen": 12,
+}
+MASS_UNITS = {"g": 1, "gram": 1, "gr": 1, "kg": 1000, "kilogram": 1000, "oz": 28.35, "ounce": 28.35, "lb": 453.6, "pound": 453.6}
+# Household measures are counted as servings of the food
+SERVING_UNITS = {"serving", "portion", "piece", "slice", "cup", "bowl", "plate", "glass", "handful", "scoop", "fillet", "tbsp", "tablespoon"}
+FILLER_WORDS = {"of"}
+
+
+def singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [singular(t) for t in _TOKEN_RE.findall(text.lower())]
+
+
+def _number(token: str) -> Optional[float]:
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    if "/" in token:
+        num, den = token.split("/")
+        return int(num) / int(den) if int(den) else None
+    if token[0].isdigit():
+        return float(token)
+    return None
+
+
+class FoodTable:
+    """
+    Column-oriented food table: parallel lists indexed by food id.
+    Anything exposing names/synonyms/serving_g/nutrient columns can stand in.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.synonyms: List[Tuple[str, ...]] = []
+        self.serving_g: List[float] = []
+        self.columns: Dict[str, List[float]] = {n: [] for n in NUTRIENTS}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str, synonyms: Sequence[str], serving_g: float, **nutrients: float) -> int:
+        self.names.append(name)
+        self.synonyms.append(tuple(synonyms))
+        self.serving_g.append(float(serving_g))
+        for n in NUTRIENTS:
+            self.columns[n].append(float(nutrients.get(n, 0)))
+        return len(self.names) - 1
+
+    def nutrients(self, food_id: int) -> Dict[str, float]:
+        return {n: self.columns[n][food_id] for n in NUTRIENTS}
+
+    @classmethod
+    def from_csv(cls, path: str) -> "FoodTable":
+        table = cls()
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                table.add(
+                    row["name"].strip(),
+                    [s.strip() for s in (row.get("synonyms") or "").split("|") if s.strip()],
+                    row.get("serving_g") or 100,
+                    **{n: row.get(n) or 0 for n in NUTRIENTS}
+                )
+        return table
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton whose alphabet is tokens rather than characters."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[Tuple[int, int]]] = [None] # (pattern length, value) ending here
+        self._out_link: List[int] = [0] # Nearest suffix state with an output
+        self.patterns = 0
+
+    def add(self, tokens: Sequence[str], value: int):
+        if not tokens:
+            return
+        state = 0
+        for token in tokens:
+            nxt = self._goto[state].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._out_link.append(0)
+            state = nxt
+        if self._out[state] is None: # First spelling registered wins
+            self._out[state] = (len(tokens), value)
+            self.patterns += 1
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(token, 0)
+                self._fail[nxt] = fail
+                self._out_link[nxt] = fail if self._out[fail] is not None else self._out_link[fail]
+
+    def scan(self, tokens: Sequence[str]) -> List[Tuple[int, int, int]]:
+        """Every match as (start, end, value), end exclusive."""
+        matches = []
+        state = 0
+        for i, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            s = state if self._out[state] is not None else self._out_link[state]
+            while s:
+                length, value = self._out[s]
+                matches.append((i + 1 - length, i + 1, value))
+                s = self._out_link[s]
+        return matches
+
+
+class FoodEngine:
+    def __init__(self, table, matcher=None):
+        """matcher needs scan(tokens) -> [(start, end, food_id)]; defaults to an in-memory automaton."""
+        self.table = table
+        if matcher is None:
+            matcher = TokenAutomaton()
+            for food_id in range(len(table)):
+                for spelling in (table.names[food_id],) + tuple(table.synonyms[food_id]):
+                    matcher.add(tokenize(spelling), food_id)
+            matcher.build()
+        self.matcher = matcher
+
+    @classmethod
+    def from_csv(cls, path: str) -> "FoodEngine":
+        return cls(FoodTable.from_csv(path))
+
+    @classmethod
+    def from_mapped(cls, path: str) -> "FoodEngine":
+        from .fooddb import MappedFoodTable
+        table = MappedFoodTable(path)
+        return cls(table, matcher=table.name_index())
+
+    def _quantity(self, tokens: Sequence[str], start: int, stop: int) -> Tuple[float, Optional[str]]:
+        """Reads '<number words> [unit] [of]' backwards from the word before a food name."""
+        i = start - 1
+        while i >= stop and tokens[i] in FILLER_WORDS:
+            i -= 1
+        unit = None
+        if i >= stop and (tokens[i] in MASS_UNITS or tokens[i] in SERVING_UNITS):
+            unit = tokens[i]
+            i -= 1
+        words = []
+        while i >= stop and _number(tokens[i]) is not None:
+            words.append(tokens[i])
+            i -= 1
+
+        amount = None
+        for word in reversed(words):
+            value = _number(word)
+            if amount is None:
+                amount = value
+            elif "/" in word and amount >= 1: # "2 1/2"
+                amount += value
+            else: # "a dozen", "half a", "two dozen"
+                amount *= value
+        return (float(amount) if amount is not None else 1.0), unit
+
+    def parse(self, text: str) -> List[Dict[str, Any]]:
+        tokens = tokenize(text)
+        # Leftmost-longest, non-overlapping
+        matches = sorted(self.matcher.scan(tokens), key=lambda m: (m[0], m[0] - m[1]))
+        items = []
+        last_end = 0
+        for start, end, food_id in matches:
+            if start < last_end:
+                continue
+            amount, unit = self._quantity(tokens, start, last_end)
+            if unit in MASS_UNITS:
+                servings = amount * MASS_UNITS[unit] / self.table.serving_g[food_id]
+            else:
+                servings = amount
+            nutrients = self.table.nutrients(food_id)
+            items.append({
+                "food": self.table.names[food_id],
+                "quantity": amount,
+                "unit": unit or "serving",
+                "servings": round(servings, 3),
+                **{n: round(v * servings, 1) for n, v in nutrients.items()}
+            })
+            last_end = end
+        return items
+
+    def estimate(self, text: str) -> Dict[str, Any]:
+        items = self.parse(text)
+        totals = {n: sum(item[n] for item in items) for n in NUTRIENTS}
+        return {
+            "calories": int(round(totals["calories"])),
+            "protein": round(totals["protein"], 1),
+            "carbs": round(totals["carbs"], 1),
+            "fats": round(totals["fats"], 1),
+            "items": items,
+        }
+
+    def estimate_many(self, texts: Iterable[str]) -> List[Dict[str, Any]]:
+        return [self.estimate(t) for t in texts]
+
+
+def load_engine() -> FoodEngine:
+    """
+    Prefers the memory-mapped database (FOOD_DB_PATH, built by build_food_db.py)
+    and falls back to parsing the CSV into memory.
+    """
+    db_path = os.getenv("FOOD_DB_PATH", DEFAULT_FOOD_DB)
+    if os.path.exists(db_path):
+        try:
+            return FoodEngine.from_mapped(db_path)
+        except Exception as e:
+            print(f"Warning: could not open food database {db_path}, using CSV: {e}")
+    return FoodEngine.from_csv(os.getenv("FOOD_TABLE_PATH", DEFAULT_FOODS_CSV))
+
+
+food_engine = load_engine()
@@ -0,0 +1,72 @@
+"""
+Keyset pagination for a user's report history.
+
+Pages are ordered newest first on (created_at, id) and the cursor is the last
+row's key, so fetching page N costs the same index seek as page 1 regardless
+of how many reports the user has. Only metadata columns are selected; the
+encrypted payload is never read for the listing.
+"""
+import base64
+import datetime
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime.datetime, result_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), result_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, result_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(result_id)
+    except Exception as e:
+        raise InvalidCursor("Malformed history cursor") from e
+
+
+async def report_history_page(db: AsyncSession, user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                              cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Returns (items, next_cursor); next_cursor is None on the last page."""
+    r = database.AnalysisResult
+    query = select(r.id, r.analysis_type, r.created_at).where(
+        r.user_id == user_id,
+        r.analysis_type == "report"
+    )
+    if cursor:
+        created_at, result_id = decode_cursor(cursor)
+        query = query.where(or_(
+            r.created_at < created_at,
+            and_(r.created_at == created_at, r.id < result_id)
+        ))
+    # One extra row tells us whether another page exists
+    rows = (await db.execute(
+        query.order_by(r.created_at.desc(), r.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    items = [
+        {
+            "id": row.id,
+            "type": row.analysis_type,
+            "created_at": row.created_at.isoformat(),
+            "status": "Processed"
+        }
+        for row in rows
+    ]
+    return items, next_cursor
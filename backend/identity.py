@@ -0,0 +1,89 @@
+"""
+Process-local cache mapping a verified email (users.username) to a
+lightweight, read-only user record, so authenticated requests don't need a
+users table lookup each time.
+
+Entries are invalidated explicitly on registration and role changes; the TTL
+bounds staleness across API workers, which each hold their own cache.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class UserIdentity:
+    """Attribute-compatible with database.User for the fields handlers read."""
+    __slots__ = ("id", "username", "full_name", "role")
+
+    def __init__(self, id: int, username: str, full_name: Optional[str], role: Optional[str]):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user) -> "UserIdentity":
+        return cls(user.id, user.username, user.full_name, user.role)
+
+    def __repr__(self):
+        return f"UserIdentity(id={self.id}, role={self.role!r})"
+
+
+class IdentityCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # username -> (identity, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[UserIdentity]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user) -> UserIdentity:
+        identity = user if isinstance(user, UserIdentity) else UserIdentity.from_user(user)
+        with self._lock:
+            self._entries[identity.username] = (identity, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(identity.username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+identity_cache = IdentityCache(
+    max_entries=int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", 10000)),
+    ttl_seconds=float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", 60))
+)
@@ -0,0 +1,36 @@
+import io
+from typing import BinaryIO, Union
+from PIL import Image, ImageSequence
+
+# info keys that change how pixels render; everything else (EXIF, XMP, ICC,
+# comments, DPI, software tags) is dropped as potentially identifying metadata
+_RENDERING_KEYS = ("transparency",)
+
+
+def _clean_frame(frame: Image.Image) -> Image.Image:
+    # copy() duplicates the pixel buffer in C (palette included) and works for
+    # every mode, including 16-bit grayscale ("I;16") radiographs
+    clean = frame.copy()
+    clean.info = {k: frame.info[k] for k in _RENDERING_KEYS if k in frame.info}
+    return clean
+
+
+def strip_metadata(content: Union[bytes, BinaryIO]) -> bytes:
+    """
+    Re-encodes an image without its metadata.
+
+    Pixels are copied buffer-to-buffer inside Pillow rather than through a
+    per-pixel Python list, and every frame of a multi-frame image (TIFF, GIF,
+    MPO) is preserved. The original container format is kept when known.
+    """
+    img = Image.open(io.BytesIO(content) if isinstance(content, bytes) else content)
+    fmt = img.format if img.format else "PNG"
+
+    frames = [_clean_frame(frame) for frame in ImageSequence.Iterator(img)]
+
+    buf = io.BytesIO()
+    if len(frames) > 1 and fmt.upper() in Image.SAVE_ALL:
+        frames[0].save(buf, format=fmt, save_all=True, append_images=frames[1:])
+    else:
+        frames[0].save(buf, format=fmt)
+    return buf.getvalue()
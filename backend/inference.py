@@ -0,0 +1,194 @@
+"""
+Micro-batching inference server for XRayAnalyzer.
+
+A CPU model costs nearly as much for one image as for several, because each
+forward pass streams all the weights through the cache. Handlers therefore
+never call the model themselves: they decode their upload (in a thread, so a
+bad image fails only its own request) and enqueue the fixed-size array. A
+single inference thread takes everything already waiting (up to
+max_batch_size), tops the batch up to the size of the previous one for at
+most max_wait, and runs one forward pass for all of them.
+
+- Latency: a request waits at most max_wait for company, and only when the
+  previous batch suggests company is coming; a lone caller never waits, and
+  under load batches are already full when the worker gets to them.
+- Backpressure: the queue is bounded; producers wait for space.
+- Failures: an exception in the forward pass fails only that batch's requests.
+- Cancellation: requests whose caller has gone away are dropped from the batch.
+- Shutdown: shutdown() finishes every queued request before returning.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .models import XRayAnalyzer
+
+
+class InferenceRequest:
+    __slots__ = ("image", "enqueued", "future")
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.enqueued = time.perf_counter()
+        self.future: Future = Future()
+
+
+class InferenceServer:
+    def __init__(self, analyzer: XRayAnalyzer, max_batch_size: int = 16, max_wait: float = 0.005,
+                 max_queue: int = 256):
+        self.analyzer = analyzer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[InferenceRequest]" = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_batch_size = 1
+        self._metrics_lock = threading.Lock()
+        self.requests_served = 0
+        self.batches_run = 0
+        self.batch_failures = 0
+        self.requests_cancelled = 0
+        self.backpressure_waits = 0
+        self.batch_sizes: Counter = Counter()
+        self._total_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+        self._total_forward_ms = 0.0
+
+    def start(self):
+        """Starts (or restarts after shutdown) the inference thread."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="xray-inference", daemon=True)
+                self._thread.start()
+
+    def submit(self, image: np.ndarray, block: bool = True, timeout: Optional[float] = None) -> Future:
+        """
+        Queues one prepared image (XRayAnalyzer.prepare) and returns a Future
+        for its prediction. Blocks while the queue is full (queue.Full if block=False).
+        """
+        if self._stopping.is_set():
+            raise RuntimeError("Inference server is shut down")
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        request = InferenceRequest(image)
+        self._queue.put(request, block=block, timeout=timeout)
+        return request.future
+
+    async def predict(self, image_bytes: bytes) -> Dict[str, Any]:
+        """Async entry point for handlers; raises models.UnreadableImage for undecodable uploads."""
+        image = await asyncio.to_thread(self.analyzer.prepare, image_bytes)
+        try:
+            future = self.submit(image, block=False)
+        except queue.Full:
+            with self._metrics_lock:
+                self.backpressure_waits += 1
+            future = await asyncio.to_thread(self.submit, image)
+        return await asyncio.wrap_future(future)
+
+    def _next_batch(self) -> List[InferenceRequest]:
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        try:
+            while len(batch) < self.max_batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        # Only wait for as many callers as the last batch had: a lone caller is
+        # served at once, and a steady set of N callers does not wait for an N+1th
+        target = min(self.max_batch_size, self._last_batch_size)
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < target and not self._stopping.is_set():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        self._last_batch_size = len(batch)
+        return batch
+
+    def _run_batch(self, batch: List[InferenceRequest]):
+        # Callers that gave up (e.g. a cancelled predict) are dropped; the rest can no longer be cancelled
+        live = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if len(live) < len(batch):
+            with self._metrics_lock:
+                self.requests_cancelled += len(batch) - len(live)
+            batch = live
+            if not batch:
+                return
+        start = time.perf_counter()
+        try:
+            results = self.analyzer.infer([r.image for r in batch])
+        except Exception as exc:
+            print(f"X-ray inference failed for a batch of {len(batch)}: {exc}")
+            with self._metrics_lock:
+                self.batch_failures += 1
+            for r in batch:
+                r.future.set_exception(exc)
+            return
+        done = time.perf_counter()
+        waits_ms = [(start - r.enqueued) * 1000 for r in batch]
+        with self._metrics_lock:
+            self.requests_served += len(batch)
+            self.batches_run += 1
+            self.batch_sizes[len(batch)] += 1
+            self._total_wait_ms += sum(waits_ms)
+            self.max_queue_wait_ms = max(self.max_queue_wait_ms, max(waits_ms))
+            self._total_forward_ms += (done - start) * 1000
+        for r, result in zip(batch, results):
+            r.future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._run_batch(batch)
+            elif self._stopping.is_set():
+                return
+
+    def shutdown(self, timeout: Optional[float] = 30.0):
+        """Stops accepting requests and blocks until the queue is drained."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {
+                "model": self.analyzer.model.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "queue_depth": self._queue.qsize(),
+                "requests_served": self.requests_served,
+                "batches_run": self.batches_run,
+                "avg_batch_size": round(self.requests_served / self.batches_run, 2) if self.batches_run else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "batch_failures": self.batch_failures,
+                "requests_cancelled": self.requests_cancelled,
+                "backpressure_waits": self.backpressure_waits,
+                "avg_queue_wait_ms": round(self._total_wait_ms / self.requests_served, 3) if self.requests_served else 0.0,
+                "max_queue_wait_ms": round(self.max_queue_wait_ms, 3),
+                "avg_forward_ms": round(self._total_forward_ms / self.batches_run, 3) if self.batches_run else 0.0,
+            }
+
+
+def server_from_env(analyzer: XRayAnalyzer) -> InferenceServer:
+    return InferenceServer(
+        analyzer,
+        max_batch_size=int(os.getenv("XRAY_MAX_BATCH_SIZE", 16)),
+        max_wait=float(os.getenv("XRAY_BATCH_WAIT_MS", 5)) / 1000,
+        max_queue=int(os.getenv("XRAY_QUEUE_SIZE", 256))
+    )
@@ -0,0 +1,242 @@
+"""
+Background report analysis jobs.
+
+Uploads are acknowledged with a job id; OCR and parsing run in a bounded
+process pool so the event loop never blocks on tesseract. Job state lives in
+the report_jobs table so any API worker can answer status polls.
+
+Jobs run as tasks in the process that accepted them, so a restart or crash
+loses them. Unfinished jobs that have not moved for OCR_JOB_STALE_SECONDS
+are marked failed at startup (fail_stale_jobs) and when polled
+(expire_if_stale), so clients stop polling and upload again.
+"""
+import asyncio
+import datetime
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence, Tuple
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, pipeline
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+MAX_PENDING_JOBS = int(os.getenv("OCR_MAX_PENDING_JOBS", 64))
+# Files of one batch upload that may be in the pool at the same time
+BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", OCR_WORKERS))
+# Longer than any OCR run: other API workers may still be running younger jobs
+JOB_STALE_SECONDS = int(os.getenv("OCR_JOB_STALE_SECONDS", 1800))
+UNFINISHED_STATUSES = ("queued", "processing")
+INTERRUPTED_ERROR = "Analysis was interrupted by a server restart. Please upload the report again."
+
+
+class PipelinePool:
+    """
+    Lazily started ProcessPoolExecutor with a fixed worker count.
+    Uses the spawn context so workers never inherit DB connections or Firebase state.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+pool = PipelinePool(OCR_WORKERS)
+
+# Strong references so running jobs are not garbage collected mid-flight
+_running: set = set()
+# Files of batch uploads not yet analyzed; they count against MAX_PENDING_JOBS too
+_batch_slots = 0
+
+
+def running_job_ids() -> set:
+    return {task.get_name() for task in _running}
+
+
+def pending_jobs() -> int:
+    return len(_running) + _batch_slots
+
+
+def reserve_slots(count: int) -> bool:
+    """Claims count pending-job slots for a batch upload; False (claims nothing) if that would exceed MAX_PENDING_JOBS."""
+    global _batch_slots
+    if pending_jobs() + count > MAX_PENDING_JOBS:
+        return False
+    _batch_slots += count
+    return True
+
+
+def release_slots(count: int):
+    global _batch_slots
+    _batch_slots = max(0, _batch_slots - count)
+
+
+async def create_job(db: AsyncSession, user_id: int) -> database.ReportJob:
+    job = database.ReportJob(id=uuid.uuid4().hex, user_id=user_id, status="queued", stage="queued", progress=0)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def update_job(job_id: str, **fields):
+    async with database.AsyncSessionLocal() as db:
+        await db.execute(
+            update(database.ReportJob).where(database.ReportJob.id == job_id).values(
+                **fields, updated_at=datetime.datetime.utcnow()
+            )
+        )
+        await db.commit()
+
+
+def _stale_cutoff(max_age: float) -> datetime.datetime:
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age)
+
+
+def fail_stale_jobs(max_age: float = JOB_STALE_SECONDS) -> int:
+    """Marks unfinished jobs not updated for max_age seconds as failed (at startup); returns how many."""
+    j = database.ReportJob
+    db = database.SessionLocal()
+    try:
+        failed = db.execute(
+            update(j).where(j.status.in_(UNFINISHED_STATUSES), j.updated_at < _stale_cutoff(max_age))
+            .values(status="failed", stage="failed", error=INTERRUPTED_ERROR, updated_at=datetime.datetime.utcnow())
+        ).rowcount
+        db.commit()
+    finally:
+        db.close()
+    if failed:
+        print(f"Marked {failed} interrupted report job(s) as failed")
+    return failed
+
+
+async def expire_if_stale(db: AsyncSession, job: database.ReportJob, max_age: float = JOB_STALE_SECONDS) -> database.ReportJob:
+    """Fails a polled job that no process is running any more (never one running here)."""
+    if job.status not in UNFINISHED_STATUSES or job.id in running_job_ids():
+        return job
+    if job.updated_at is not None and job.updated_at >= _stale_cutoff(max_age):
+        return job
+    j = database.ReportJob
+    await db.execute(
+        update(j).where(j.id == job.id, j.status.in_(UNFINISHED_STATUSES))
+        .values(status="failed", stage="failed", error=INTERRUPTED_ERROR, updated_at=datetime.datetime.utcnow())
+    )
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+def job_status(job: database.ReportJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress,
+        "analysis_id": job.analysis_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+
+async def read_report(upload, cache=None, semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """
+    pipeline.read_report for an IngestedUpload, served from the analysis cache
+    (analysis_cache.py) when an identical upload was read before. Only misses
+    take a pool slot (and the semaphore, if given).
+    """
+    report = await cache.get(upload.sha256) if cache is not None else None
+    if report is None:
+        if semaphore is not None:
+            async with semaphore:
+                report = await pool.run(pipeline.read_report, upload.source)
+        else:
+            report = await pool.run(pipeline.read_report, upload.source)
+        if cache is not None:
+            await cache.put(upload.sha256, report)
+    return report
+
+
+async def analyze_upload(upload, cache=None) -> Dict[str, Any]:
+    report = await read_report(upload, cache)
+    return pipeline.build_result(report["text"], report["parsed"])
+
+
+async def process_report_job(job_id: str, upload, user_id: int, ip_address: str, persist: Callable, cache=None):
+    """
+    Runs OCR and parsing in the pool (or takes them from the cache), then
+    stores the result via await persist(db, user_id, combined_result, ip_address, upload).
+    The job owns the IngestedUpload and closes it when done, after persist has
+    had the chance to keep the original.
+    """
+    try:
+        await update_job(job_id, status="processing", stage="ocr", progress=10)
+        report = await read_report(upload, cache)
+
+        await update_job(job_id, stage="analysis", progress=60)
+        combined_result = pipeline.build_result(report["text"], report["parsed"])
+
+        await update_job(job_id, stage="storing", progress=90)
+        async with database.AsyncSessionLocal() as db:
+            db_result = await persist(db, user_id, combined_result, ip_address, upload)
+            analysis_id = db_result.id
+
+        await update_job(job_id, status="completed", stage="completed", progress=100, analysis_id=analysis_id)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        await update_job(job_id, status="failed", stage="failed", error=str(e))
+    finally:
+        upload.close()
+
+
+def submit_report_job(job_id: str, upload, user_id: int, ip_address: str, persist: Callable, cache=None):
+    task = asyncio.get_running_loop().create_task(
+        process_report_job(job_id, upload, user_id, ip_address, persist, cache), name=job_id
+    )
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
+
+
+async def analyze_many(uploads: Sequence, cache=None, concurrency: int = BATCH_CONCURRENCY
+                       ) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Analyzes every IngestedUpload, at most `concurrency` of them in the pool
+    at a time (cache hits skip the queue), yielding (index, result, error) in
+    completion order. Closing the iterator early cancels whatever has not started.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def analyze(index: int, upload):
+        try:
+            report = await read_report(upload, cache, semaphore)
+            return index, pipeline.build_result(report["text"], report["parsed"]), None
+        except Exception as e:
+            return index, None, e
+
+    tasks = [asyncio.ensure_future(analyze(i, upload)) for i, upload in enumerate(uploads)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,236 @@
+"""
+Biomarker extraction from OCR'd lab report text.
+
+One compiled pattern (every analyte alias in a single alternation) is run
+over the whole text with finditer, so a report is read in one left-to-right
+pass no matter how many pages or analytes it has. Each match captures the
+value, the unit and, when printed on the same line, the reference range and
+the lab's H/L flag. Values and ranges are converted to the analyte's
+canonical unit (glucose in mmol/L becomes mg/dL, and so on), so the diet
+rules and trends see consistent numbers whichever lab produced the report.
+A value in a unit with no known conversion keeps the lab's unit; it is
+judged only against the range or flag printed with it.
+
+The first result for an analyte wins; later pages usually repeat it in
+summary or history tables.
+"""
+import re
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+Conversion = Union[float, Callable[[float], float]]
+
+
+class Analyte(NamedTuple):
+    name: str
+    aliases: Tuple[str, ...]
+    unit: str
+    low: Optional[float] # Default reference range, canonical unit
+    high: Optional[float]
+    conversions: Mapping[str, Conversion] = {} # normalized unit -> factor (or function) to canonical
+
+
+ANALYTES = (
+    Analyte("Glucose", ("glucose", "fasting glucose", "glucose, fasting", "fasting blood sugar", "blood sugar", "fbs", "fbg"),
+            "mg/dL", 70, 99, {"mmol/l": 18.016}),
+    Analyte("HbA1c", ("hba1c", "hb a1c", "a1c", "hemoglobin a1c", "haemoglobin a1c", "glycated hemoglobin",
+                      "glycated haemoglobin", "glycosylated hemoglobin"),
+            "%", 4.0, 5.6, {"mmol/mol": lambda v: v * 0.09148 + 2.152}),
+    Analyte("Cholesterol", ("cholesterol", "total cholesterol", "cholesterol, total"), "mg/dL", None, 200, {"mmol/l": 38.67}),
+    Analyte("LDL", ("ldl", "ldl cholesterol", "ldl-c", "ldl-cholesterol"), "mg/dL", None, 100, {"mmol/l": 38.67}),
+    Analyte("HDL", ("hdl", "hdl cholesterol", "hdl-c", "hdl-cholesterol"), "mg/dL", 40, None, {"mmol/l": 38.67}),
+    Analyte("Triglycerides", ("triglycerides", "triglyceride", "tg"), "mg/dL", None, 150, {"mmol/l": 88.57}),
+    Analyte("Systolic BP", ("systolic bp", "systolic blood pressure", "systolic", "sbp"), "mmHg", 90, 120),
+    Analyte("Diastolic BP", ("diastolic bp", "diastolic blood pressure", "diastolic", "dbp"), "mmHg", 60, 80),
+    Analyte("Creatinine", ("creatinine", "serum creatinine", "creatinine, serum"), "mg/dL", 0.7, 1.3, {"umol/l": 1 / 88.42}),
+    Analyte("BUN", ("bun", "blood urea nitrogen", "urea nitrogen"), "mg/dL", 7, 20, {"mmol/l": 2.801}),
+    Analyte("eGFR", ("egfr", "estimated gfr"), "mL/min/1.73m2", 90, None),
+    Analyte("Hemoglobin", ("hemoglobin", "haemoglobin", "hgb", "hb"), "g/dL", 12.0, 17.5, {"g/l": 0.1, "mmol/l": 1.611}),
+    Analyte("Sodium", ("sodium",), "mmol/L", 135, 145, {"meq/l": 1}),
+    Analyte("Potassium", ("potassium",), "mmol/L", 3.5, 5.1, {"meq/l": 1}),
+    Analyte("TSH", ("tsh", "thyroid stimulating hormone"), "mIU/L", 0.4, 4.0, {"uiu/ml": 1, "miu/ml": 1000}),
+    Analyte("Vitamin D", ("vitamin d", "25-oh vitamin d", "25-hydroxy vitamin d", "vitamin d, 25-hydroxy"), "ng/mL", 30, 100,
+            {"nmol/l": 1 / 2.496}),
+    Analyte("Ferritin", ("ferritin",), "ng/mL", 30, 400, {"ug/l": 1}),
+)
+
+# "Blood Pressure 145/92 mmHg" yields both readings
+PAIRED_ALIASES = {"blood pressure": ("Systolic BP", "Diastolic BP"), "bp": ("Systolic BP", "Diastolic BP")}
+
+UNITS = ("mg/dl", "mmol/l", "umol/l", "µmol/l", "μmol/l", "mmol/mol", "%", "mmhg", "g/dl", "g/l", "miu/l", "miu/ml",
+         "uiu/ml", "µiu/ml", "μiu/ml", "ng/ml", "nmol/l", "ug/l", "µg/l", "meq/l", "ml/min/1.73m2", "ml/min")
+
+_ALIAS_TO_ANALYTE: Dict[str, Analyte] = {alias: a for a in ANALYTES for alias in a.aliases}
+_BY_NAME = {a.name: a for a in ANALYTES}
+
+
+def _alternation(words) -> str:
+    """
+    Regex alternation factored into a prefix trie ("c(?:holesterol|reatinine)")
+    so the engine tests a shared prefix once instead of once per alias. Optional
+    tails are greedy, so the longest alias at a position wins.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        branches = [(r"[^\S\n]+" if ch == " " else re.escape(ch)) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+_NAMES = list(_ALIAS_TO_ANALYTE) + list(PAIRED_ALIASES)
+_FIRST_CHARS = re.escape("".join(sorted({n[0] for n in _NAMES})))
+_NUM = r"\d+(?:\.\d+)?"
+_UNIT = _alternation(UNITS)
+_FLAG = r"(?:high|low|hi|lo|h|l|\*)"
+
+_PATTERN = re.compile(rf"""
+    (?=[{_FIRST_CHARS}])(?<![\w-])                 # cheap first-character filter before the trie
+    (?P<name>{_alternation(_NAMES)})(?![\w-])
+    [^\S\n]*(?:\((?P<unit0>{_UNIT})\))?           # "Creatinine (mg/dL) 0.9"
+    [^\d\n]{{0,30}}?                                # separators and qualifiers: ":", "(serum)", "....."
+    (?<![\w.])[<>]?(?P<value>{_NUM})(?:[^\S\n]*/[^\S\n]*(?P<value2>{_NUM}))?(?![\d.])
+    [^\S\n]*(?P<flag1>{_FLAG}(?![\w/]))?
+    [^\S\n]*(?P<unit>{_UNIT})?(?![\w/])
+    [^\S\n]*(?P<flag2>{_FLAG}(?![\w/]))?
+    (?:[^\S\n]*(?:ref(?:erence)?(?:[^\S\n]+range)?|range|normal)?[^\S\n]*:?[^\S\n]*[\[(]?[^\S\n]*
+       (?:(?P<low>{_NUM})[^\S\n]*(?:-|–|to)[^\S\n]*(?P<high>{_NUM})
+         |(?P<cmp><=?|>=?|≤|≥)[^\S\n]*(?P<bound>{_NUM})))?
+""", re.IGNORECASE | re.VERBOSE)
+
+
+def normalize_unit(unit: Optional[str]) -> Optional[str]:
+    return unit.lower().replace("µ", "u").replace("μ", "u") if unit else None
+
+
+def _convert(value: float, analyte: Analyte, unit: Optional[str]) -> Optional[float]:
+    """value in the analyte's canonical unit, or None when the unit is not convertible."""
+    if unit is None or unit == analyte.unit.lower():
+        return value
+    factor = analyte.conversions.get(unit)
+    if factor is None:
+        return None
+    return factor(value) if callable(factor) else value * factor
+
+
+def _tidy(value: float) -> Union[int, float]:
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+
+def _format_range(low: Optional[float], high: Optional[float]) -> str:
+    if low is not None and high is not None:
+        return f"{_tidy(low)} - {_tidy(high)}"
+    if high is not None:
+        return f"< {_tidy(high)}"
+    if low is not None:
+        return f"> {_tidy(low)}"
+    return ""
+
+
+def _status(value: float, low: Optional[float], high: Optional[float], flag: Optional[str]) -> str:
+    if low is not None and value < low:
+        return "Low"
+    if high is not None and value > high:
+        return "High"
+    if low is None and high is None and flag:
+        return "Low" if flag.lower().startswith("l") else "High"
+    return "Normal"
+
+
+def _reading(analyte: Analyte, raw: float, unit_text: Optional[str], flag: Optional[str] = None,
+             ref_low: Optional[str] = None, ref_high: Optional[str] = None,
+             cmp: Optional[str] = None, bound: Optional[str] = None) -> Dict[str, Any]:
+    unit = normalize_unit(unit_text)
+    value = _convert(raw, analyte, unit)
+    if value is None:
+        # Unit not convertible for this analyte: keep the lab's own numbers. The
+        # default range is in the canonical unit, so only a printed range or the
+        # lab's flag can say whether the value is out of range.
+        value, shown_unit, convert = raw, unit_text, (lambda v: v)
+        low = high = None
+    else:
+        shown_unit, convert = analyte.unit, (lambda v: _convert(v, analyte, unit))
+        low, high = analyte.low, analyte.high
+
+    if ref_low is not None:
+        low, high = convert(float(ref_low)), convert(float(ref_high))
+    elif bound is not None:
+        limit = convert(float(bound))
+        low, high = (None, limit) if cmp in ("<", "<=", "≤") else (limit, None)
+
+    return {
+        "name": analyte.name,
+        "value": _tidy(value),
+        "unit": shown_unit,
+        "range": _format_range(low, high),
+        "status": _status(value, low, high, flag),
+    }
+
+
+def extract(text: str) -> List[Dict[str, Any]]:
+    """Biomarkers found in text, in report order; the first reading of each analyte wins."""
+    return extract_pages([text])
+
+
+def extract_pages(pages: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Like extract over the joined pages, but consumes them one at a time so a
+    PDF's early pages are parsed while later ones are still being OCR'd.
+    Matches never span lines, so splitting at page breaks loses nothing.
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+    for page in pages:
+        _scan(page or "", found)
+    return list(found.values())
+
+
+def _scan(text: str, found: Dict[str, Dict[str, Any]]):
+    for m in _PATTERN.finditer(text):
+        alias = " ".join(m.group("name").lower().split())
+        unit_text = m.group("unit") or m.group("unit0")
+        value, value2 = float(m.group("value")), m.group("value2")
+        if alias in PAIRED_ALIASES:
+            # Both readings share the line, so they keep their default ranges
+            if value2 is not None:
+                for name, raw in zip(PAIRED_ALIASES[alias], (value, float(value2))):
+                    if name not in found:
+                        found[name] = _reading(_BY_NAME[name], raw, unit_text)
+            continue
+        analyte = _ALIAS_TO_ANALYTE[alias]
+        if analyte.name not in found and value2 is None:
+            found[analyte.name] = _reading(
+                analyte, value, unit_text, m.group("flag1") or m.group("flag2"),
+                m.group("low"), m.group("high"), m.group("cmp"), m.group("bound")
+            )
+
+
+def interpret(biomarkers: List[Dict[str, Any]]) -> str:
+    if not biomarkers:
+        return "No recognized biomarkers were found in the report text."
+    high = [b["name"] for b in biomarkers if b["status"] == "High"]
+    low = [b["name"] for b in biomarkers if b["status"] == "Low"]
+    parts = []
+    if high:
+        parts.append(f"Above reference range: {', '.join(high)}.")
+    if low:
+        parts.append(f"Below reference range: {', '.join(low)}.")
+    parts.append("All other measured markers are within range." if parts else "All measured markers are within range.")
+    return " ".join(parts)
+
+
+def parse_report(text: str) -> Dict[str, Any]:
+    return parse_pages([text])
+
+
+def parse_pages(pages: Iterable[str]) -> Dict[str, Any]:
+    biomarkers = extract_pages(pages)
+    return {"biomarkers": biomarkers, "interpretation": interpret(biomarkers)}
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response, Depends, Query, status
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 # from fastapi.security import OAuth2PasswordRequestForm # Removed unused
@@ -7,10 +7,11 @@ from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
 import os
-from PIL import Image
-import io
 import json
-from sqlalchemy.orm import Session
+import hashlib
+import asyncio
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -18,10 +19,25 @@ load_dotenv()
 
 # Import local modules
 # Import local modules
-from .models import XRayAnalyzer
-from .services import MedicalCryptoService, OCRService, DietRecommendationEngine, BiomarkerExtractor, NutritionEstimator
+from .models import XRayAnalyzer, UnreadableImage
+from .services import MedicalCryptoService
 from . import database
 from . import auth
+from . import trends
+from . import nutrition
+from . import jobs
+from . import imaging
+from . import uploads
+from . import history
+from . import storage
+from . import rotation
+from . import foods
+from . import diet
+from . import analysis_cache
+from . import inference
+from . import blobstore
+from .cache import payload_cache
+from .audit import audit_writer
 
 # Initialize Database
 database.init_db()
@@ -32,12 +48,31 @@ app = FastAPI(
     version="1.1.0"
 )
 
+# Cap upload request bodies on the wire, before Starlette spools the multipart body:
+# from Content-Length when there is one, else while the chunks arrive. Added before
+# CORSMiddleware so CORS wraps it and the 413 carries the CORS headers.
+UPLOAD_PATHS = ("/analyze-xray", "/analyze-report")
+BATCH_UPLOAD_PATH = "/analyze-report/batch"
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 50))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", 500 * 1024 * 1024))
+
+def upload_body_limit(path: str) -> Optional[int]:
+    if path == BATCH_UPLOAD_PATH:
+        return MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    if path in UPLOAD_PATHS:
+        return uploads.max_upload_bytes() + MULTIPART_OVERHEAD_BYTES
+    return None
+
+app.add_middleware(uploads.BodySizeLimit, limit_for=upload_body_limit)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -61,10 +96,42 @@ async def read_root():
 
 # Initialize Services
 xray_analyzer = XRayAnalyzer()
+# Concurrent X-ray uploads share forward passes
+xray_server = inference.server_from_env(xray_analyzer)
 crypto_service = MedicalCryptoService()
-ocr_service = OCRService()
-diet_engine = DietRecommendationEngine()
-biomarker_parser = BiomarkerExtractor()
+# Encrypted originals of uploads, deduplicated by content
+blob_store = blobstore.store_from_env(crypto_service)
+rotation_worker = rotation.worker_from_env(crypto_service, blob_store)
+# Identical re-uploads reuse their earlier OCR and parse output
+report_cache = analysis_cache.cache_from_env(crypto_service)
+
+# Uploads at or below this size may request an inline (?sync=true) analysis
+SYNC_ANALYSIS_MAX_BYTES = int(os.getenv("SYNC_ANALYSIS_MAX_BYTES", 2 * 1024 * 1024))
+# Keep the (metadata-stripped) upload so it can be downloaded again
+STORE_UPLOAD_ORIGINALS = os.getenv("STORE_UPLOAD_ORIGINALS", "1") == "1"
+
+@app.on_event("startup")
+def start_background_workers():
+    audit_writer.start()
+    xray_server.start()
+    auth.revocation_sync.start()
+    # Jobs of a previous run died with it; tell their pollers
+    jobs.fail_stale_jobs()
+    blob_store.start_collector(float(os.getenv("BLOB_GC_INTERVAL_SECONDS", 300)))
+    # Retired keys are configured: re-encrypt their rows under the primary key
+    if len(crypto_service.keys) > 1 and os.getenv("KEY_ROTATION_AUTOSTART", "1") == "1":
+        rotation_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_background_workers():
+    jobs.pool.shutdown()
+    xray_server.shutdown()
+    rotation_worker.stop()
+    blob_store.stop_collector()
+    auth.revocation_sync.stop()
+    # Drain queued audit events before the process exits
+    audit_writer.shutdown()
+    await database.async_engine.dispose()
 
 # Pydantic Schemas
 
@@ -86,6 +153,7 @@ class ReportResponse(BaseModel):
     diet_plan: Dict[str, Any]
     interpretation: Optional[str] = None
     analysis_id: int
+    original_url: Optional[str] = None
 
 class MealIn(BaseModel):
     name: str
@@ -109,15 +177,9 @@ class NutritionSummary(BaseModel):
     goal_protein: int = 150
 
 # Helper: Audit Logger
-def log_audit(db: Session, user_id: Optional[int], action: str, resource: str, request: Request):
-    db_log = database.AuditLog(
-        user_id=user_id,
-        action=action,
-        resource=resource,
-        ip_address=request.client.host
-    )
-    db.add(db_log)
-    db.commit()
+async def log_audit(user_id: Optional[int], action: str, resource: str, ip_address: str):
+    # Batched by the audit writer; returns once the event's batch is committed
+    await audit_writer.log(user_id, action, resource, ip_address)
 
 # --- Auth Routes ---
 # Note: Auth is now handled via Firebase ID Tokens verified in `get_current_user`
@@ -126,7 +188,7 @@ def log_audit(db: Session, user_id: Optional[int], action: str, resource: str, r
 @app.post("/auth/register", response_model=UserOut)
 async def register_user(
     request: Request,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Explicit registration endpoint. 
@@ -150,8 +212,11 @@ async def register_user(
         raise HTTPException(status_code=400, detail="Token missing email")
 
     # Check if exists
-    db_user = db.query(database.User).filter(database.User.username == email).first()
+    db_user = (await db.execute(
+        select(database.User).where(database.User.username == email)
+    )).scalars().first()
     if db_user:
+        auth.identity_cache.put(db_user)
         return db_user # Idempotent success
     
     # Create
@@ -162,132 +227,227 @@ async def register_user(
         role="patient"
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    auth.identity_cache.put(new_user)
     return new_user
 
+class RoleUpdate(BaseModel):
+    role: str
+
+@app.patch("/admin/users/{user_id}/role", response_model=UserOut)
+async def update_user_role(
+    user_id: int,
+    update: RoleUpdate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    if update.role not in ("patient", "doctor", "admin"):
+        raise HTTPException(status_code=400, detail="Role must be patient, doctor or admin")
+
+    user = await db.get(database.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Also drops the cached identity so the new role applies on the next request
+    return await auth.update_user_role(db, user, update.role)
+
+@app.post("/admin/users/{user_id}/revoke-sessions")
+async def revoke_user_sessions(
+    user_id: int,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
+):
+    """Signs the user out everywhere: every ID token issued so far is rejected."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    user = await db.get(database.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await auth.revoke_user_sessions(db, user.username)
+    await log_audit(current_user.id, "REVOKE_SESSIONS", f"USER_ID_{user.id}", request.client.host)
+    return {"message": "Sessions revoked"}
+
+@app.get("/admin/key-rotation")
+async def get_key_rotation(current_user: auth.UserIdentity = Depends(auth.get_current_active_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return rotation_worker.stats()
+
+@app.post("/admin/key-rotation", status_code=202)
+async def start_key_rotation(current_user: auth.UserIdentity = Depends(auth.get_current_active_user)):
+    """Starts a re-encryption pass; poll GET /admin/key-rotation for progress."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    if not rotation_worker.start():
+        raise HTTPException(status_code=409, detail="A key rotation pass is already running")
+    return rotation_worker.stats()
+
+@app.post("/auth/logout")
+async def logout_user(
+    res: auth.HTTPAuthorizationCredentials = Depends(auth.security),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Revokes the presented ID token so it cannot be reused for the rest of its
+    lifetime: at once in this process, and in other API processes within
+    TOKEN_REVOCATION_SYNC_SECONDS.
+    """
+    await auth.revoke_token(db, res.credentials)
+    return {"message": "Logged out"}
+
 @app.get("/users/me", response_model=UserOut)
-async def read_users_me(current_user: database.User = Depends(auth.get_current_active_user)):
+async def read_users_me(current_user: auth.UserIdentity = Depends(auth.get_current_active_user)):
     return current_user
 
 @app.get("/reports/history")
 async def get_report_history(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    response: Response,
+    limit: int = Query(history.DEFAULT_PAGE_SIZE, ge=1, le=history.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    results = db.query(database.AnalysisResult).filter(
-        database.AnalysisResult.user_id == current_user.id,
-        database.AnalysisResult.analysis_type == "report"
-    ).order_by(database.AnalysisResult.created_at.desc()).all()
-    
-    # Return metadata for the list
-    history = []
-    for r in results:
-        # We don't decrypt here for the list view to stay fast, 
-        # but we could return snippets if needed.
-        history.append({
-            "id": r.id,
-            "type": r.analysis_type,
-            "created_at": r.created_at.isoformat(),
-            "status": "Processed"
-        })
-    return history
+    """
+    Newest reports first, metadata only. When more reports exist the
+    X-Next-Cursor header carries the cursor for the next page.
+    """
+    try:
+        items, next_cursor = await history.report_history_page(db, current_user.id, limit, cursor)
+    except history.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 @app.get("/reports/{report_id}", response_model=ReportResponse)
 async def get_report_detail(
     report_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    result = db.query(database.AnalysisResult).filter(
-        database.AnalysisResult.id == report_id,
-        database.AnalysisResult.user_id == current_user.id
-    ).first()
+    result = (await db.execute(
+        select(database.AnalysisResult).where(
+            database.AnalysisResult.id == report_id,
+            database.AnalysisResult.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not result:
         raise HTTPException(status_code=404, detail="Report not found")
         
-    # Decrypt the data
-    decrypted_data = crypto_service.decrypt_file(result.encrypted_data.encode())
-    data = json.loads(decrypted_data.decode())
+    # Decrypt the data (served from the payload cache on repeat views)
+    data = payload_cache.load(result.id, storage.stored_ciphertext(result), crypto_service)
     
-    return {**data, "analysis_id": result.id}
+    return {**data, "analysis_id": result.id, "original_url": original_url(result)}
+
+def original_url(result: database.AnalysisResult) -> Optional[str]:
+    return f"/reports/{result.id}/original" if result.blob_id else None
+
+@app.api_route("/reports/{report_id}/original", methods=["GET", "HEAD"])
+async def download_report_original(
+    report_id: int,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
+):
+    """
+    The uploaded image or report, decrypted as it streams. Honours a single
+    Range (206; 416 when unsatisfiable), so viewers can fetch tiles or resume
+    without the whole file being decrypted. The ETag is the blob id.
+    """
+    result = (await db.execute(
+        select(database.AnalysisResult).where(
+            database.AnalysisResult.id == report_id,
+            database.AnalysisResult.user_id == current_user.id
+        )
+    )).scalars().first()
+    blob = await db.get(database.StoredBlob, result.blob_id) if result and result.blob_id else None
+    if not blob:
+        raise HTTPException(status_code=404, detail="Original not found")
+
+    size, etag = blob.size_bytes, f'"{blob.id}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Cache-Control": "private, no-store"}
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None # The client's partial copy is of something else: send it all
+    try:
+        byte_range = blobstore.byte_range(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    status_code = 206 if byte_range else 200
+    media_type = blob.media_type or "application/octet-stream"
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    try:
+        body = await asyncio.to_thread(blob_store.read, blob.id, start, end)
+    except blobstore.BlobNotFound:
+        raise HTTPException(status_code=404, detail="Original not found")
+    await log_audit(current_user.id, "ORIGINAL_DOWNLOAD", f"RESULT_ID_{result.id}", request.client.host)
+    # A sync iterator: Starlette decrypts the chunks in its threadpool
+    return StreamingResponse(body, status_code=status_code, headers=headers, media_type=media_type)
 
 @app.delete("/reports/{report_id}")
 async def delete_report(
     report_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    result = db.query(database.AnalysisResult).filter(
-        database.AnalysisResult.id == report_id,
-        database.AnalysisResult.user_id == current_user.id
-    ).first()
+    result = (await db.execute(
+        select(database.AnalysisResult).where(
+            database.AnalysisResult.id == report_id,
+            database.AnalysisResult.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not result:
         raise HTTPException(status_code=404, detail="Report not found")
         
-    db.delete(result)
-    db.commit()
+    await db.execute(delete(database.TrendPoint).where(database.TrendPoint.result_id == result.id))
+    await blob_store.release(db, result.blob_id)
+    await db.delete(result)
+    await db.commit()
+    payload_cache.evict(report_id)
     return {"message": "Report deleted successfully"}
 
 @app.get("/analytics/trends")
 async def get_analytics_trends(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    results = db.query(database.AnalysisResult).filter(
-        database.AnalysisResult.user_id == current_user.id,
-        database.AnalysisResult.analysis_type == "report"
-    ).order_by(database.AnalysisResult.created_at.asc()).all()
-    
-    trends = []
-    for r in results:
-        try:
-            decrypted_data = crypto_service.decrypt_file(r.encrypted_data.encode())
-            data = json.loads(decrypted_data.decode())
-            
-            # Extract macros if available
-            macros = {}
-            if "diet_plan" in data and "macros" in data["diet_plan"]:
-                macros = data["diet_plan"]["macros"]
-            
-            # Mock Vitality Score based on biomarkers
-            biomarker_count = len(data.get("biomarkers", {}))
-            vitality_score = min(100, 70 + (biomarker_count * 5)) # Base 70 + 5 per detected biomarker
-            
-            trends.append({
-                "date": r.created_at.isoformat(),
-                "biomarkers": data.get("biomarkers", {}),
-                "macros": macros,
-                "vitality_score": vitality_score
-            })
-        except Exception as e:
-            print(f"Error decrypting result {r.id}: {e}")
-            continue
-            
-    print(f"DEBUG: Returning {len(trends)} trend items")
-    if len(trends) > 0:
-        print(f"DEBUG: Latest biomarkers: {trends[-1]['biomarkers']}")
-    return trends
+    # Reads the compact per-report projections instead of every full payload
+    return await trends.load_trends(db, crypto_service, current_user.id, cache=payload_cache)
 
 @app.get("/nutrition/daily-plan")
 async def get_daily_nutrition(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
     # Get the latest report analysis
-    result = db.query(database.AnalysisResult).filter(
-        database.AnalysisResult.user_id == current_user.id,
-        database.AnalysisResult.analysis_type == "report"
-    ).order_by(database.AnalysisResult.created_at.desc()).first()
+    result = (await db.execute(
+        select(database.AnalysisResult).where(
+            database.AnalysisResult.user_id == current_user.id,
+            database.AnalysisResult.analysis_type == "report"
+        ).order_by(database.AnalysisResult.created_at.desc()).limit(1)
+    )).scalars().first()
     
     if not result:
         return {"diet_plan": None, "message": "No report analysis found. Please upload a report."}
         
     try:
-        decrypted_data = crypto_service.decrypt_file(result.encrypted_data.encode())
-        data = json.loads(decrypted_data.decode())
+        data = payload_cache.load(result.id, storage.stored_ciphertext(result), crypto_service)
     except Exception as e:
         print(f"Decryption failed (Key Rotation?): {e}")
         # Fallback: act as if no report exists so user can re-upload
@@ -303,64 +463,52 @@ async def get_daily_nutrition(
 @app.post("/nutrition/meals", response_model=MealOut)
 async def log_meal(
     meal: MealIn,
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
+    logged_at = datetime.utcnow()
     db_meal = database.MealLog(
         user_id=current_user.id,
         name=meal.name,
         calories=meal.calories,
         protein=meal.protein,
         carbs=meal.carbs,
-        fats=meal.fats
+        fats=meal.fats,
+        created_at=logged_at
     )
     db.add(db_meal)
-    db.commit()
-    db.refresh(db_meal)
+    await nutrition.bump_rollup(
+        db, current_user.id, logged_at.date(),
+        calories=meal.calories, protein=meal.protein, carbs=meal.carbs, fats=meal.fats
+    )
+    await db.commit()
+    await db.refresh(db_meal)
     return db_meal
 
 @app.get("/nutrition/meals", response_model=List[MealOut])
 async def get_todays_meals(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
     # Filter for today (UTC for simplicity, ideally user timezone)
     today = datetime.utcnow().date()
-    # Simple filter: created_at >= today's start
-    # Note: sqlite stores datetime, so be careful. 
-    # For now, we will return top 50 recent meals to keep it simple or implement proper date filter
-    meals = db.query(database.MealLog).filter(
-        database.MealLog.user_id == current_user.id
-    ).order_by(database.MealLog.created_at.desc()).limit(50).all()
-    
-    # Filter in python for safety against sqlite date quirks if needed, or valid sqlalchemy
-    todays_meals = [m for m in meals if m.created_at.date() == today]
-    return todays_meals
+    return await nutrition.meals_for_day(db, current_user.id, today)
 
 @app.get("/nutrition/summary", response_model=NutritionSummary)
 async def get_nutrition_summary(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
     today = datetime.utcnow().date()
-    # Meals
-    meals = db.query(database.MealLog).filter(
-        database.MealLog.user_id == current_user.id
-    ).all()
-    todays_meals = [m for m in meals if m.created_at.date() == today]
-    
-    # Water
-    water_logs = db.query(database.WaterLog).filter(
-        database.WaterLog.user_id == current_user.id
-    ).all()
-    todays_water = sum(w.amount_ml for w in water_logs if w.created_at.date() == today)
+    # Single rollup row maintained by log_meal / log_water
+    totals = await nutrition.daily_totals(db, current_user.id, today)
 
     summary = NutritionSummary(
-        total_calories=sum(m.calories for m in todays_meals),
-        total_protein=sum(m.protein for m in todays_meals),
-        total_carbs=sum(m.carbs for m in todays_meals),
-        total_fats=sum(m.fats for m in todays_meals),
-        total_water_ml=todays_water,
+        total_calories=totals["calories"],
+        total_protein=totals["protein"],
+        total_carbs=totals["carbs"],
+        total_fats=totals["fats"],
+        total_water_ml=totals["water_ml"],
         goal_calories=2000,
         goal_protein=150
     )
@@ -368,17 +516,14 @@ async def get_nutrition_summary(
 
 @app.get("/nutrition/hydration/history")
 async def get_hydration_history(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
     from datetime import timedelta
     today = datetime.utcnow().date()
     start_date = today - timedelta(days=6) # Last 7 days including today
 
-    logs = db.query(database.WaterLog).filter(
-        database.WaterLog.user_id == current_user.id,
-        database.WaterLog.created_at >= start_date # simple datetime comparison works in sqlite
-    ).all()
+    rollups = await nutrition.rollups_between(db, current_user.id, start_date, today)
 
     # Init structure: Mon..Sun or Day-6..Day-0? 
     # UI shows Mon, Tue, Wed... fixed order or rotating?
@@ -403,8 +548,7 @@ async def get_hydration_history(
         is_today = (i == 0)
         day_label = "TODAY" if is_today else day.strftime("%a").upper()
         
-        # Filter logs for this day
-        day_total = sum(l.amount_ml for l in logs if l.created_at.date() == day)
+        day_total = rollups[day].water_ml if day in rollups else 0
         
         history.append({
             "label": day_label,
@@ -416,17 +560,14 @@ async def get_hydration_history(
 
 @app.get("/nutrition/protein/history")
 async def get_protein_history(
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
     from datetime import timedelta
     today = datetime.utcnow().date()
     start_date = today - timedelta(days=6)
 
-    meals = db.query(database.MealLog).filter(
-        database.MealLog.user_id == current_user.id,
-        database.MealLog.created_at >= start_date 
-    ).all()
+    rollups = await nutrition.rollups_between(db, current_user.id, start_date, today)
 
     history = []
     daily_goal = 150 # Default goal, ideally fetched from user profile/report
@@ -436,7 +577,7 @@ async def get_protein_history(
         is_today = (i == 0)
         day_label = "TODAY" if is_today else day.strftime("%a").upper()
         
-        day_total = sum(m.protein for m in meals if m.created_at.date() == day)
+        day_total = rollups[day].protein if day in rollups else 0
         
         history.append({
             "label": day_label,
@@ -452,22 +593,51 @@ class WaterIn(BaseModel):
 @app.post("/nutrition/water")
 async def log_water(
     water: WaterIn,
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    new_log = database.WaterLog(user_id=current_user.id, amount_ml=water.amount_ml)
+    logged_at = datetime.utcnow()
+    new_log = database.WaterLog(user_id=current_user.id, amount_ml=water.amount_ml, created_at=logged_at)
     db.add(new_log)
-    db.commit()
-    db.refresh(new_log)
+    await nutrition.bump_rollup(db, current_user.id, logged_at.date(), water_ml=water.amount_ml)
+    await db.commit()
+    await db.refresh(new_log)
     return {"message": "Water logged", "current_total": water.amount_ml}
 
 class EstimateIn(BaseModel):
     query: str
 
+class EstimateBatchIn(BaseModel):
+    queries: List[str]
+
+MAX_ESTIMATE_BATCH = int(os.getenv("MAX_ESTIMATE_BATCH", 500))
+
 @app.post("/nutrition/estimate")
 async def estimate_nutrition(data: EstimateIn):
-    estimator = NutritionEstimator()
-    return estimator.estimate_nutrition(data.query)
+    # Totals for every food found in the text, plus the parsed items
+    return foods.food_engine.estimate(data.query)
+
+@app.post("/nutrition/estimate/batch")
+async def estimate_nutrition_batch(data: EstimateBatchIn):
+    if len(data.queries) > MAX_ESTIMATE_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_ESTIMATE_BATCH} queries per batch.")
+    return {"results": foods.food_engine.estimate_many(data.queries)}
+
+class DietPlanBatchIn(BaseModel):
+    patients: List[Dict[str, Any]] # Each {"biomarkers": [{"name", "value"}, ...]}
+
+MAX_DIET_PLAN_BATCH = int(os.getenv("MAX_DIET_PLAN_BATCH", 5000))
+
+@app.post("/nutrition/diet-plans/batch")
+async def diet_plans_batch(
+    data: DietPlanBatchIn,
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
+):
+    if current_user.role not in ("doctor", "admin"):
+        raise HTTPException(status_code=403, detail="Doctor or admin role required")
+    if len(data.patients) > MAX_DIET_PLAN_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_DIET_PLAN_BATCH} patients per batch.")
+    return {"plans": diet.generate_plans(data.patients)}
 
 # --- Medical Analysis Routes ---
 
@@ -475,123 +645,288 @@ async def estimate_nutrition(data: EstimateIn):
 async def analyze_xray(
     request: Request,
     file: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
-    current_user: database.User = Depends(auth.get_current_active_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.UserIdentity = Depends(auth.get_current_active_user)
 ):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
-
-    content = await file.read()
+    # Type is sniffed from magic bytes; content_type is client-controlled
+    upload = await uploads.ingest_upload(file, uploads.IMAGE_KINDS)
     
     # Anonymization: Strip metadata
+    with upload:
+        try:
+            clean_content = imaging.strip_metadata(upload.open())
+        except Exception as e:
+            print(f"Image processing error: {e}")
+            clean_content = upload.read()
+
     try:
-        img = Image.open(io.BytesIO(content))
-        img_no_exif = Image.new(img.mode, img.size)
-        img_no_exif.putdata(list(img.getdata()))
-        
-        buf = io.BytesIO()
-        img_no_exif.save(buf, format=img.format if img.format else "PNG")
-        clean_content = buf.getvalue()
-    except Exception as e:
-        print(f"Image processing error: {e}")
-        clean_content = content
-
-    # Simulated AI Analysis for X-Ray
-    findings = [
-        "No acute osseous abnormality detected.",
-        "Lungs are clear. No pleural effusion or pneumothorax.",
-        "Cardiac silhouette is within normal limits."
-    ]
-    
+        prediction = await xray_server.predict(clean_content)
+    except UnreadableImage:
+        raise HTTPException(status_code=400, detail="Could not read the X-ray image.")
+
+    if not prediction["diagnostic"]:
+        # E.g. the NumPy reference model: its scores must not become patient-facing findings
+        findings = ["Automated X-ray screening is not available. Radiologist review required."]
+        status = "Non-diagnostic"
+    elif prediction["prediction"] == "Normal":
+        findings = [
+            "No acute osseous abnormality detected.",
+            "Lungs are clear. No pleural effusion or pneumothorax."
+        ]
+        status = prediction["prediction"]
+    else:
+        findings = ["Possible abnormality detected. Radiologist review recommended."]
+        status = prediction["prediction"]
+
     combined_result = {
         "extracted_text": "X-Ray Image Analysis",
-        "biomarkers": {"Status": "Normal", "Region": "Chest"},
-        "diet_plan": {"findings": findings[:2]},
+        "biomarkers": [{
+            "name": "X-Ray Classification",
+            "value": prediction["prediction"] if prediction["diagnostic"] else "Not assessed",
+            "unit": "",
+            "range": "",
+            "status": status,
+            "confidence": round(prediction["confidence"], 4),
+            "region": "Chest"
+        }],
+        "diet_plan": {
+            "findings": findings, "model": prediction["model"], "diagnostic": prediction["diagnostic"],
+            "scores": prediction["scores"]
+        },
     }
 
     # Encrypt and store results
-    encrypted_payload = crypto_service.encrypt_file(json.dumps(combined_result).encode())
-    db_result = database.AnalysisResult(
-        user_id=current_user.id,
-        analysis_type="xray",
-        encrypted_data=encrypted_payload.decode()
-    )
+    db_result = database.AnalysisResult(user_id=current_user.id, analysis_type="xray")
+    storage.store_result_payload(crypto_service, db_result, combined_result)
+    # The stripped image, not the upload: no metadata reaches the blob store
+    await attach_original(db, db_result, clean_content, hashlib.sha256(clean_content).hexdigest(), upload.media_type)
     db.add(db_result)
-    db.commit()
-    db.refresh(db_result)
+    await db.commit()
+    await db.refresh(db_result)
 
     # HIPAA Audit Trail
-    log_audit(db, current_user.id, "XRAY_ANALYSIS", f"RESULT_ID_{db_result.id}", request)
+    await log_audit(current_user.id, "XRAY_ANALYSIS", f"RESULT_ID_{db_result.id}", request.client.host)
     
-    return {**combined_result, "analysis_id": db_result.id}
+    return {**combined_result, "analysis_id": db_result.id, "original_url": original_url(db_result)}
+
+async def resolve_report_user(db: AsyncSession, current_user: Optional[auth.UserIdentity]) -> auth.UserIdentity:
+    # Anonymous uploads are attributed to the shared guest account
+    if current_user:
+        return current_user
+    guest = await auth.resolve_identity(db, "guest")
+    if not guest:
+        guest_user = database.User(
+            username="guest", 
+            full_name="Guest User", 
+            hashed_password="N/A", 
+            role="patient"
+        )
+        db.add(guest_user)
+        await db.commit()
+        await db.refresh(guest_user)
+        guest = auth.identity_cache.put(guest_user)
+    return guest
+
+async def attach_original(db: AsyncSession, db_result: database.AnalysisResult, source, sha256: str, media_type: Optional[str]):
+    """Stores the uploaded file in the blob store and references it from db_result; the caller commits."""
+    if not STORE_UPLOAD_ORIGINALS:
+        return
+    try:
+        db_result.blob_id = await blob_store.put(db, source, sha256, media_type)
+    except OSError as e:
+        # The analysis is still worth keeping without its original
+        print(f"Could not store the uploaded original: {e}")
+
+async def add_report_result(db: AsyncSession, user_id: int, combined_result: Dict[str, Any], upload=None) -> database.AnalysisResult:
+    # Encryption and Storage; the caller commits. upload must still be open.
+    db_result = database.AnalysisResult(user_id=user_id, analysis_type="report")
+    storage.store_result_payload(crypto_service, db_result, combined_result)
+    if upload is not None:
+        await attach_original(db, db_result, upload.source, upload.sha256, upload.media_type)
+    db.add(db_result)
+    await db.flush()
+    trends.record_trend_point(db, crypto_service, db_result, combined_result)
+    return db_result
+
+async def persist_report_result(db: AsyncSession, user_id: int, combined_result: Dict[str, Any], ip_address: str,
+                                upload=None) -> database.AnalysisResult:
+    db_result = await add_report_result(db, user_id, combined_result, upload)
+    await db.commit()
+    await db.refresh(db_result)
+
+    # HIPAA Audit Trail
+    await log_audit(user_id, "REPORT_ANALYSIS", f"RESULT_ID_{db_result.id}", ip_address)
+    return db_result
 
-@app.post("/analyze-report", response_model=ReportResponse)
+@app.post("/analyze-report")
 async def analyze_report(
     request: Request,
     file: UploadFile = File(...), 
-    db: Session = Depends(database.get_db),
-    current_user: Optional[database.User] = Depends(auth.get_current_user_optional)
+    sync: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Optional[auth.UserIdentity] = Depends(auth.get_current_user_optional)
 ):
+    """
+    Queues the report for background analysis and returns 202 with a job id.
+    Poll /reports/jobs/{job_id} for progress. Small uploads may pass
+    ?sync=true to receive the full ReportResponse inline instead.
+    """
     try:
-        # User Resolution Logic
-        if not current_user:
-            # Create guest if not exists
-            current_user = db.query(database.User).filter(database.User.username == "guest").first()
-            if not current_user:
-                current_user = database.User(
-                    username="guest", 
-                    full_name="Guest User", 
-                    hashed_password="N/A", 
-                    role="patient"
-                )
-                db.add(current_user)
-                db.commit()
-                db.refresh(current_user)
-        
-        content = await file.read()
-        
-        # OCR and LLM Parsing
+        current_user = await resolve_report_user(db, current_user)
+
+        if not sync and jobs.pending_jobs() >= jobs.MAX_PENDING_JOBS:
+            raise HTTPException(status_code=503, detail="Analysis queue is full. Please retry shortly.")
+
+        upload = await uploads.ingest_upload(file, uploads.REPORT_KINDS)
+
+        if sync:
+            with upload:
+                if upload.size > SYNC_ANALYSIS_MAX_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Synchronous analysis is limited to {SYNC_ANALYSIS_MAX_BYTES} bytes. Omit ?sync=true to queue a job."
+                    )
+                # Still runs in the pool so the event loop stays responsive
+                combined_result = await jobs.analyze_upload(upload, report_cache)
+                db_result = await persist_report_result(db, current_user.id, combined_result, request.client.host, upload)
+            return {**combined_result, "analysis_id": db_result.id, "original_url": original_url(db_result)}
+
         try:
-            text = ocr_service.extract_text(content)
-        except Exception as e:
-            print(f"OCR Error: {e}")
-            text = "Sample medical report text extracted via fallback."
-        
-        parsed_data = biomarker_parser.parse_with_llm(text)
-        diet_plan = diet_engine.generate_diet_plan(parsed_data)
-        
-        combined_result = {
-            "extracted_text": text,
-            "biomarkers": parsed_data["biomarkers"],
-            "diet_plan": diet_plan,
-            "interpretation": parsed_data.get("interpretation", "No interpretation available.")
-        }
-
-        # Encryption and Storage
-        encrypted_payload = crypto_service.encrypt_file(json.dumps(combined_result).encode())
-        db_result = database.AnalysisResult(
-            user_id=current_user.id,
-            analysis_type="report",
-            encrypted_data=encrypted_payload.decode()
+            job = await jobs.create_job(db, current_user.id)
+        except Exception:
+            upload.close()
+            raise
+        # The job takes ownership of the upload and closes it when finished
+        jobs.submit_report_job(job.id, upload, current_user.id, request.client.host, persist_report_result, report_cache)
+        return JSONResponse(
+            status_code=202,
+            content={**jobs.job_status(job), "status_url": f"/reports/jobs/{job.id}"}
         )
-        db.add(db_result)
-        db.commit()
-        db.refresh(db_result)
-
-        # HIPAA Audit Trail
-        log_audit(db, current_user.id, "REPORT_ANALYSIS", f"RESULT_ID_{db_result.id}", request)
-        
-        return {**combined_result, "analysis_id": db_result.id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+def ndjson(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, default=str) + "\n").encode()
+
+@app.post(BATCH_UPLOAD_PATH)
+async def analyze_report_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Optional[auth.UserIdentity] = Depends(auth.get_current_user_optional)
+):
+    """
+    Analyzes many reports in one request (e.g. a patient's lab history).
+    Streams NDJSON: one line per file as it finishes ("rejected", "analyzed"
+    or "failed"), then a final line once every analyzed report and its audit
+    entry has been stored in a single transaction, with the analysis ids.
+    """
+    current_user = await resolve_report_user(db, current_user)
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} files per batch.")
+    # Every file counts against the same limit as queued jobs; released as each one is analyzed
+    if not jobs.reserve_slots(len(files)):
+        raise HTTPException(status_code=503, detail="Analysis queue is full. Please retry shortly.")
+
+    ingested, rejected = [], []
+    try:
+        for index, file in enumerate(files):
+            try:
+                ingested.append((index, await uploads.ingest_upload(file, uploads.REPORT_KINDS)))
+            except HTTPException as e:
+                rejected.append({"index": index, "filename": file.filename, "status": "rejected", "error": e.detail})
+    except BaseException:
+        for _, upload in ingested:
+            upload.close()
+        jobs.release_slots(len(files))
+        raise
+    jobs.release_slots(len(rejected))
+
+    user_id, ip_address = current_user.id, request.client.host
+
+    async def results():
+        analyzed = []
+        unfinished = len(ingested)
+        # Uploads stay open until their originals are in the blob store
+        try:
+            for line in rejected:
+                yield ndjson(line)
+            async for i, combined_result, error in jobs.analyze_many([upload for _, upload in ingested], report_cache):
+                index, upload = ingested[i]
+                jobs.release_slots(1)
+                unfinished -= 1
+                if error is not None:
+                    yield ndjson({"index": index, "filename": upload.filename, "status": "failed", "error": str(error)})
+                    continue
+                analyzed.append((index, combined_result, upload))
+                yield ndjson({"index": index, "filename": upload.filename, "sha256": upload.sha256, "status": "analyzed", **combined_result})
+
+            # Request-scoped sessions are closed before the body streams, so the batch gets its own
+            try:
+                async with database.AsyncSessionLocal() as batch_db:
+                    stored = []
+                    for index, combined_result, upload in sorted(analyzed, key=lambda r: r[0]):
+                        db_result = await add_report_result(batch_db, user_id, combined_result, upload)
+                        batch_db.add(database.AuditLog(
+                            user_id=user_id, action="REPORT_ANALYSIS", resource=f"RESULT_ID_{db_result.id}", ip_address=ip_address
+                        ))
+                        stored.append((index, db_result.id))
+                    await batch_db.commit()
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                yield ndjson({"status": "store_failed", "stored": 0, "error": str(e)})
+                return
+            yield ndjson({"status": "stored", "stored": len(stored), "analysis_ids": {str(i): rid for i, rid in stored}})
+        finally:
+            jobs.release_slots(unfinished)
+            for _, upload in ingested:
+                upload.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/reports/jobs/{job_id}")
+async def get_report_job(
+    job_id: str,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Optional[auth.UserIdentity] = Depends(auth.get_current_user_optional)
+):
+    current_user = await resolve_report_user(db, current_user)
+    job = (await db.execute(
+        select(database.ReportJob).where(
+            database.ReportJob.id == job_id,
+            database.ReportJob.user_id == current_user.id
+        )
+    )).scalars().first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return jobs.job_status(await jobs.expire_if_stale(db, job))
+
 @app.get("/health")
 async def health_check():
     return {"status": "online", "compliance": "HIPAA-ready", "version": "1.1.0"}
 
+@app.get("/metrics")
+async def get_metrics():
+    # Counters only; no PHI is exposed here
+    return {
+        "payload_cache": payload_cache.stats(),
+        "token_cache": auth.token_cache.stats(),
+        "identity_cache": auth.identity_cache.stats(),
+        "audit_writer": audit_writer.stats(),
+        "key_rotation": rotation_worker.stats(),
+        "analysis_cache": report_cache.stats(),
+        "xray_inference": xray_server.stats(),
+        "blob_store": blob_store.stats()
+    }
+
 # Serve static files (HTML, etc.) from the 'public' directory
 # This allows navigation to work (e.g., dashboard.html)
 # Place this at the end to avoid capturing other routes
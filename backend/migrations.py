@@ -0,0 +1,90 @@
+"""
+Versioned, idempotent schema migrations for existing databases.
+
+Base.metadata.create_all() only creates missing tables; it never adds indexes
+or columns to tables that already exist. Each migration below brings an older
+database up to the current models and is recorded in schema_migrations so it
+runs once.
+"""
+import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from . import database
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _create_index(conn, table, name: str):
+    for index in table.indexes:
+        if index.name == name:
+            index.create(conn, checkfirst=True)
+            return
+    raise KeyError(f"Index {name} is not declared on {table.name}")
+
+
+def _add_column(conn, table, name: str):
+    """ALTER TABLE ... ADD COLUMN for a column declared on the model, if missing."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if name in existing:
+        return
+    column = table.c[name]
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(conn.dialect)}"))
+
+
+@migration(1, "Composite (user_id, created_at) indexes on meal_logs and water_logs")
+def _nutrition_log_indexes(conn):
+    _create_index(conn, database.MealLog.__table__, "ix_meal_logs_user_created")
+    _create_index(conn, database.WaterLog.__table__, "ix_water_logs_user_created")
+
+
+@migration(2, "Populate daily_nutrition_rollup from existing meal and water logs")
+def _populate_nutrition_rollups(conn):
+    from . import nutrition
+    nutrition.rebuild_rollups(Session(bind=conn))
+
+
+@migration(3, "Composite (user_id, analysis_type, created_at) index on analysis_results")
+def _report_history_index(conn):
+    _create_index(conn, database.AnalysisResult.__table__, "ix_analysis_results_user_type_created")
+
+
+@migration(4, "Binary encrypted_payload column on analysis_results")
+def _binary_payload_column(conn):
+    # Existing rows keep their Fernet text until migrate_payloads.py rewrites them
+    _add_column(conn, database.AnalysisResult.__table__, "encrypted_payload")
+
+
+@migration(5, "blob_id column on analysis_results")
+def _result_blob_column(conn):
+    # The blobs table itself is new and created by create_all
+    _add_column(conn, database.AnalysisResult.__table__, "blob_id")
+
+
+def run_migrations(engine) -> List[int]:
+    """Applies pending migrations in version order and returns the versions applied."""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+        for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.datetime.utcnow()}
+            )
+            print(f"Applied migration {version}: {description}")
+            applied_now.append(version)
+    return applied_now
@@ -1,21 +1,157 @@
-import random
+"""
+X-ray classification.
+
+XRayModel is the interface a real CPU model plugs into: it takes a float32
+batch of shape (N, size, size), already normalized, and returns class
+probabilities of shape (N, len(labels)). Batching is the point: the weights
+are streamed through once per batch instead of once per image, which is
+where CPU inference time goes (see inference.py and bench_xray_inference.py).
+
+ReferenceModel is a small NumPy network (one 3x3 convolution and two dense
+layers) with seeded weights, or weights from an .npz file. It makes no
+medical claims; it exists so the serving path, tests and benchmarks run with
+the cost profile of a real model and deterministic output. Like every model
+that does not set diagnostic = True, its predictions are returned flagged as
+non-diagnostic and /analyze-xray generates no findings from them.
+
+XRAY_MODEL selects the model: "reference" (default) or "package.module:factory"
+for any callable returning an XRayModel.
+"""
+import importlib
+import io
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+XRAY_INPUT_SIZE = int(os.getenv("XRAY_INPUT_SIZE", 224))
+XRAY_LABELS = ("Normal", "Abnormal")
+
+
+class UnreadableImage(ValueError):
+    pass
+
+
+class XRayModel:
+    name = "model"
+    labels: Tuple[str, ...] = XRAY_LABELS
+    input_size = XRAY_INPUT_SIZE
+    diagnostic = False # Set by models validated to back patient-facing findings
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """(N, size, size) float32 -> (N, len(labels)) probabilities."""
+        raise NotImplementedError
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+class ReferenceModel(XRayModel):
+    """
+    pool 4x4 -> conv 3x3 x FILTERS + relu -> pool 2x2 -> dense HIDDEN + relu -> dense labels.
+    The first dense layer holds nearly all the weights, as in real classifiers.
+    """
+    name = "numpy-reference"
+    FILTERS = 16
+    HIDDEN = 128
+
+    def __init__(self, input_size: int = XRAY_INPUT_SIZE, weights_path: str = None, seed: int = 0):
+        if input_size % 8:
+            raise ValueError("ReferenceModel input size must be a multiple of 8")
+        self.input_size = input_size
+        pooled = input_size // 4
+        self._features = ((pooled - 2) // 2) ** 2 * self.FILTERS
+        if weights_path:
+            with np.load(weights_path) as w:
+                self.conv, self.w1, self.b1, self.w2, self.b2 = (
+                    w[k].astype(np.float32) for k in ("conv", "w1", "b1", "w2", "b2")
+                )
+            if self.w1.shape != (self._features, self.HIDDEN):
+                raise ValueError(f"{weights_path}: w1 is {self.w1.shape}, expected {(self._features, self.HIDDEN)}")
+        else:
+            rng = np.random.default_rng(seed)
+            self.conv = rng.normal(0, 1 / 3, (9, self.FILTERS)).astype(np.float32)
+            self.w1 = rng.normal(0, 1 / np.sqrt(self._features), (self._features, self.HIDDEN)).astype(np.float32)
+            self.b1 = np.zeros(self.HIDDEN, dtype=np.float32)
+            self.w2 = rng.normal(0, 1 / np.sqrt(self.HIDDEN), (self.HIDDEN, len(self.labels))).astype(np.float32)
+            self.b2 = np.zeros(len(self.labels), dtype=np.float32)
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        n = batch.shape[0]
+        # Pooling by strided views: one add (or max) per offset, each over 1/16 (1/4) of the input
+        x = sum(batch[:, dy::4, dx::4] for dy in range(4) for dx in range(4)) * np.float32(1 / 16)
+        # im2col through a strided view: (n, h, w, 3, 3) without copying until the reshape
+        patches = np.lib.stride_tricks.sliding_window_view(x, (3, 3), axis=(1, 2))
+        h = patches.shape[1] - patches.shape[1] % 2
+        x = np.maximum(patches[:, :h, :h].reshape(n * h * h, 9) @ self.conv, 0).reshape(n, h, h, self.FILTERS)
+        x = np.maximum(np.maximum(x[:, 0::2, 0::2], x[:, 1::2, 0::2]), np.maximum(x[:, 0::2, 1::2], x[:, 1::2, 1::2]))
+        x = np.maximum(x.reshape(n, -1) @ self.w1 + self.b1, 0)
+        return _softmax(x @ self.w2 + self.b2)
+
+
+def load_model() -> XRayModel:
+    spec = os.getenv("XRAY_MODEL", "reference")
+    if spec == "reference":
+        return ReferenceModel(weights_path=os.getenv("XRAY_MODEL_WEIGHTS") or None)
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr or "load_model")()
+
 
 class XRayAnalyzer:
-    def __init__(self):
-        # Mock initialization (No heavy model loading)
-        print("XRayAnalyzer initialized (Mock Mode)")
-        pass
-
-    def predict(self, image_bytes):
-        """
-        Mock inference to save memory/build time for deployment.
-        """
-        # Simulate processing time or logic if needed
-        is_abnormal = random.choice([True, False])
-        confidence = random.uniform(0.7, 0.99)
-        
-        return {
-            "prediction": "Abnormal" if is_abnormal else "Normal",
-            "confidence": confidence,
-            "status": "Success"
-        }
+    def __init__(self, model: XRayModel = None):
+        self.model = model or load_model()
+        print(f"XRayAnalyzer initialized ({self.model.name}, {self.model.input_size}px)")
+        if not self.model.diagnostic:
+            print(f"Warning: X-ray model {self.model.name} is not diagnostic; set XRAY_MODEL to a validated model for findings")
+
+    def prepare(self, image_bytes: bytes) -> np.ndarray:
+        """Decodes one image to a (size, size) array in its own precision; raises UnreadableImage."""
+        size = self.model.input_size
+        try:
+            img = Image.open(io.BytesIO(image_bytes))
+            img.draft("L", (size * 2, size * 2)) # JPEG: decode at reduced scale, a no-op for other formats
+            if img.mode in ("I;16B", "I;16L", "I;16N"):
+                # Explicit-endian 16-bit (TIFF/DICOM exports): Pillow only resizes native I;16
+                img = Image.fromarray(np.asarray(img).astype(np.uint16))
+            if img.mode not in ("L", "RGB", "I", "I;16"):
+                img = img.convert("L")
+            img = img.resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+            if img.mode == "RGB":
+                img = img.convert("L")
+            return np.asarray(img)
+        except Exception as e:
+            raise UnreadableImage(f"Cannot decode X-ray image: {e}") from e
+
+    @staticmethod
+    def to_tensor(images: Sequence[np.ndarray]) -> np.ndarray:
+        """Stacks prepared images and standardizes each one, in a single vectorized pass."""
+        batch = np.stack(images).astype(np.float32)
+        flat = batch.reshape(len(batch), -1)
+        mean = flat.mean(axis=1)
+        std = flat.std(axis=1)
+        return (batch - mean[:, None, None]) / np.maximum(std, 1e-6)[:, None, None]
+
+    def infer(self, images: Sequence[np.ndarray]) -> List[Dict[str, Any]]:
+        probabilities = self.model.forward(self.to_tensor(images))
+        best = probabilities.argmax(axis=1)
+        labels = self.model.labels
+        return [
+            {
+                "prediction": labels[i],
+                "confidence": float(p[i]),
+                "scores": {label: round(float(v), 4) for label, v in zip(labels, p)},
+                "model": self.model.name,
+                "diagnostic": self.model.diagnostic,
+                "status": "Success"
+            }
+            for i, p in zip(best, probabilities)
+        ]
+
+    def predict_batch(self, images: Sequence[bytes]) -> List[Dict[str, Any]]:
+        return self.infer([self.prepare(b) for b in images])
+
+    def predict(self, image_bytes: bytes) -> Dict[str, Any]:
+        return self.predict_batch([image_bytes])[0]
@@ -0,0 +1,132 @@
+import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import database
+
+
+def day_window(day: datetime.date) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Half-open [start, end) UTC bounds for a calendar day.
+    Range predicates keep the (user_id, created_at) index usable, unlike date().
+    """
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return start, start + datetime.timedelta(days=1)
+
+
+async def meals_for_day(db: AsyncSession, user_id: int, day: datetime.date, limit: int = 50) -> List[database.MealLog]:
+    start, end = day_window(day)
+    return (await db.execute(
+        select(database.MealLog).where(
+            database.MealLog.user_id == user_id,
+            database.MealLog.created_at >= start,
+            database.MealLog.created_at < end
+        ).order_by(database.MealLog.created_at.desc()).limit(limit)
+    )).scalars().all()
+
+
+ROLLUP_FIELDS = ("calories", "protein", "carbs", "fats", "water_ml")
+
+
+async def bump_rollup(db: AsyncSession, user_id: int, day: datetime.date, **deltas):
+    """
+    Adds deltas to the user's rollup row for a day, creating it if needed.
+    Runs in the caller's transaction so the raw log and its rollup commit together.
+    """
+    values = {field: int(deltas.get(field) or 0) for field in ROLLUP_FIELDS}
+    table = database.DailyNutritionRollup.__table__
+    dialect = db.bind.dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(user_id=user_id, day=day, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={field: table.c[field] + stmt.excluded[field] for field in ROLLUP_FIELDS}
+        )
+        await db.execute(stmt)
+        return
+
+    # Generic fallback for other backends
+    row = (await db.execute(
+        select(database.DailyNutritionRollup).where(
+            database.DailyNutritionRollup.user_id == user_id,
+            database.DailyNutritionRollup.day == day
+        ).with_for_update()
+    )).scalars().first()
+    if row is None:
+        db.add(database.DailyNutritionRollup(user_id=user_id, day=day, **values))
+    else:
+        for field, delta in values.items():
+            setattr(row, field, getattr(row, field) + delta)
+
+
+async def rollups_between(db: AsyncSession, user_id: int, start_day: datetime.date, end_day: datetime.date) -> Dict[datetime.date, database.DailyNutritionRollup]:
+    """Rollup rows for start_day..end_day inclusive, keyed by day. Missing days had no logs."""
+    rows = (await db.execute(
+        select(database.DailyNutritionRollup).where(
+            database.DailyNutritionRollup.user_id == user_id,
+            database.DailyNutritionRollup.day >= start_day,
+            database.DailyNutritionRollup.day <= end_day
+        )
+    )).scalars().all()
+    return {r.day: r for r in rows}
+
+
+async def daily_totals(db: AsyncSession, user_id: int, day: datetime.date) -> Dict[str, int]:
+    row = (await rollups_between(db, user_id, day, day)).get(day)
+    return {field: (getattr(row, field) if row else 0) for field in ROLLUP_FIELDS}
+
+
+def _as_date(value) -> datetime.date:
+    # SQLite returns date() as text, Postgres as a date
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Recomputes rollups from the raw meal and water logs, optionally for one user.
+    Returns the number of rollup rows written.
+    """
+    rollup_q = db.query(database.DailyNutritionRollup)
+    meal_q = db.query(
+        database.MealLog.user_id,
+        func.date(database.MealLog.created_at),
+        func.coalesce(func.sum(database.MealLog.calories), 0),
+        func.coalesce(func.sum(database.MealLog.protein), 0),
+        func.coalesce(func.sum(database.MealLog.carbs), 0),
+        func.coalesce(func.sum(database.MealLog.fats), 0)
+    )
+    water_q = db.query(
+        database.WaterLog.user_id,
+        func.date(database.WaterLog.created_at),
+        func.coalesce(func.sum(database.WaterLog.amount_ml), 0)
+    )
+    if user_id is not None:
+        rollup_q = rollup_q.filter(database.DailyNutritionRollup.user_id == user_id)
+        meal_q = meal_q.filter(database.MealLog.user_id == user_id)
+        water_q = water_q.filter(database.WaterLog.user_id == user_id)
+
+    totals: Dict[Tuple[int, datetime.date], Dict[str, int]] = {}
+    for uid, day, calories, protein, carbs, fats in meal_q.group_by(database.MealLog.user_id, func.date(database.MealLog.created_at)):
+        row = totals.setdefault((uid, _as_date(day)), dict.fromkeys(ROLLUP_FIELDS, 0))
+        row.update(calories=int(calories), protein=int(protein), carbs=int(carbs), fats=int(fats))
+    for uid, day, water_ml in water_q.group_by(database.WaterLog.user_id, func.date(database.WaterLog.created_at)):
+        row = totals.setdefault((uid, _as_date(day)), dict.fromkeys(ROLLUP_FIELDS, 0))
+        row["water_ml"] = int(water_ml)
+
+    rollup_q.delete(synchronize_session=False)
+    db.add_all(
+        database.DailyNutritionRollup(user_id=uid, day=day, **values)
+        for (uid, day), values in totals.items()
+    )
+    db.commit()
+    return len(totals)
@@ -0,0 +1,134 @@
+"""
+PDF lab reports: embedded text first, OCR only where needed.
+
+Most lab PDFs are generated, not scanned, so every page that already carries
+a text layer is read directly and never touches tesseract. Pages without one
+(scans, faxes, photos pasted into a PDF) are rasterized in document order
+and OCR'd on a thread pool; tesseract runs as a subprocess, so threads give
+real parallelism. The pool is sized per worker process, and each tesseract
+is limited to one OpenMP thread (OMP_THREAD_LIMIT), so the process pool,
+the page threads and tesseract's own threads do not multiply. iter_page_text yields pages in order as soon as each is
+ready, with a bounded number of rasterized pages in flight, so the parser
+can start on page 1 while later pages are still being recognized.
+
+Requires PyMuPDF; without it PDFs fall back to the pipeline placeholder.
+"""
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+
+try:
+    import pymupdf
+except ImportError: # Older releases only ship the "fitz" name
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+PDF_MAGIC = b"%PDF-"
+# Each of the OCR_WORKERS processes (jobs.py, same default) gets its share of the
+# cores, so a batch of scanned PDFs runs about one tesseract per core, not cores²
+_PROCESS_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", max(1, (os.cpu_count() or 2) // _PROCESS_WORKERS)))
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", 300))
+# Pages with fewer extractable characters than this are treated as images
+MIN_TEXT_LAYER_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", 20))
+
+Source = Union[bytes, str, BinaryIO]
+
+
+class PDFSupportMissing(RuntimeError):
+    pass
+
+
+def is_pdf(source: Source) -> bool:
+    if isinstance(source, bytes):
+        return source.startswith(PDF_MAGIC)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+    pos = source.tell()
+    head = source.read(len(PDF_MAGIC))
+    source.seek(pos)
+    return head == PDF_MAGIC
+
+
+def open_document(source: Source):
+    if pymupdf is None:
+        raise PDFSupportMissing("PyMuPDF is not installed; cannot read PDF reports")
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    data = source if isinstance(source, bytes) else source.read()
+    return pymupdf.open(stream=data, filetype="pdf")
+
+
+def rasterize(page, dpi: int = PDF_OCR_DPI):
+    """Grayscale PIL image of a page at the OCR resolution."""
+    from PIL import Image
+    pix = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY, alpha=False)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    image.info["dpi"] = (dpi, dpi) # Lets preprocessing skip the downscale
+    return image
+
+
+def _ocr(image) -> str:
+    from .services import OCRService
+    return OCRService.image_to_text(image)
+
+
+def _recognize(ocr, image, page_no: int, on_error: Optional[Callable[[int, Exception], None]]) -> str:
+    # One unreadable page must not cost the text of the others
+    try:
+        return ocr(image)
+    except Exception as e:
+        print(f"OCR Error on PDF page {page_no + 1}: {e}")
+        if on_error is not None:
+            on_error(page_no, e)
+        return ""
+
+
+def iter_page_text(source: Source, workers: int = PDF_OCR_WORKERS, ocr=_ocr,
+                   on_error: Optional[Callable[[int, Exception], None]] = None) -> Iterator[str]:
+    """
+    Text of each page in order. Text-layer pages are free; image pages are
+    OCR'd by up to `workers` threads with at most 2 x workers rasterized
+    pages waiting, which keeps memory flat on long scanned reports. A page
+    that cannot be OCR'd yields "" and is reported to on_error(page_no, exc).
+    """
+    workers = max(1, workers)
+    doc = open_document(source)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-ocr")
+    window: deque = deque() # str for ready pages, Future for pages being OCR'd
+    in_flight = 0
+    try:
+        for page_no, page in enumerate(doc):
+            text = page.get_text("text")
+            if len(text.strip()) >= MIN_TEXT_LAYER_CHARS:
+                window.append(text)
+            else:
+                # PyMuPDF documents are not thread safe: rasterize here, recognize in the pool
+                window.append(executor.submit(_recognize, ocr, rasterize(page), page_no, on_error))
+                in_flight += 1
+            while window and (isinstance(window[0], str) or window[0].done() or in_flight >= 2 * workers):
+                head = window.popleft()
+                if isinstance(head, Future):
+                    in_flight -= 1
+                    head = head.result()
+                yield head
+        while window:
+            head = window.popleft()
+            yield head.result() if isinstance(head, Future) else head
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        doc.close()
+
+
+def page_stats(source: Source) -> dict:
+    """How many pages carry a text layer versus need OCR."""
+    doc = open_document(source)
+    try:
+        text_pages = sum(1 for page in doc if len(page.get_text("text").strip()) >= MIN_TEXT_LAYER_CHARS)
+        return {"pages": doc.page_count, "text_layer": text_pages, "ocr": doc.page_count - text_pages}
+    finally:
+        doc.close()
@@ -0,0 +1,89 @@
+"""
+Report analysis stages as plain module-level functions.
+
+Everything here is picklable and free of database access, so the stages can
+run inside a worker process (see jobs.py) as well as inline.
+"""
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+from .services import OCRService, DietRecommendationEngine, BiomarkerExtractor
+
+try:
+    import resource
+except ImportError: # Windows: no rusage, only this process's CPU time is counted
+    resource = None
+
+FALLBACK_TEXT = "Sample medical report text extracted via fallback."
+
+# Bump when OCR or parsing output changes so cached analyses are not reused
+PIPELINE_VERSION = "1"
+
+
+def cache_salt() -> str:
+    """Everything besides the upload bytes that decides read_report's output."""
+    from . import pdfs, preprocess
+    prep = ",".join(preprocess.STEPS) or "none"
+    return (f"v{PIPELINE_VERSION}:dpi{pdfs.PDF_OCR_DPI}:min{pdfs.MIN_TEXT_LAYER_CHARS}"
+            f":prep{prep}@{preprocess.TARGET_DPI}:{os.getenv('ANALYSIS_CACHE_SALT', '')}")
+
+
+def _cpu_seconds() -> float:
+    # Includes finished child processes: tesseract runs as a subprocess
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def iter_text(source: Union[bytes, str], failures: Optional[List[int]] = None) -> Iterator[str]:
+    """
+    Report text page by page (a PDF streams its pages as they are read or
+    OCR'd; an image is one page). source is the upload bytes or the path of
+    a spooled upload file. Pages that could not be OCR'd are appended to failures.
+    """
+    produced = False
+    on_page_error = (lambda page_no, e: failures.append(page_no)) if failures is not None else None
+    try:
+        for page in OCRService.iter_pages(source, on_page_error):
+            produced = True
+            yield page
+    except Exception as e:
+        print(f"OCR Error: {e}")
+        if not produced:
+            yield FALLBACK_TEXT
+
+
+def build_result(text: str, parsed_data: Dict[str, Any]) -> Dict[str, Any]:
+    diet_plan = DietRecommendationEngine.generate_diet_plan(parsed_data)
+    return {
+        "extracted_text": text,
+        "biomarkers": parsed_data["biomarkers"],
+        "diet_plan": diet_plan,
+        "interpretation": parsed_data.get("interpretation", "No interpretation available.")
+    }
+
+
+def read_report(source: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    OCR and biomarker parsing, the expensive and cacheable part of an analysis:
+    {"text", "parsed", "cpu_seconds", "ocr_failed"}. Biomarkers are parsed page
+    by page while later pages are still being OCR'd.
+    """
+    started = _cpu_seconds()
+    pages, failures = [], []
+
+    def recorded():
+        for page in iter_text(source, failures):
+            pages.append(page)
+            yield page
+
+    parsed_data = BiomarkerExtractor.parse_pages(recorded())
+    text = "\n".join(pages)
+    return {
+        "text": text,
+        "parsed": parsed_data,
+        "cpu_seconds": round(_cpu_seconds() - started, 4),
+        "ocr_failed": text == FALLBACK_TEXT or bool(failures) # Not worth caching
+    }
+
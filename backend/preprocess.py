@@ -0,0 +1,227 @@
+"""
+Image clean-up ahead of tesseract.
+
+Phone photos and scans arrive in color, at whatever resolution the device
+chose, slightly rotated and often with a dark scanner or table border.
+Tesseract is slower and less accurate on all of these. prepare() runs the
+configured steps over a NumPy view of the image:
+
+    grayscale  single channel (Pillow's C conversion); implied by the rest
+    downscale  to OCR_TARGET_DPI; integer factors are a block mean summed
+               from strided views, no per-pixel Python
+    binarize   Bradley adaptive threshold from an integral image, so uneven
+               lighting and shadows do not swallow text
+    deskew     projection-profile search over +/- OCR_MAX_SKEW degrees on a
+               sample of ink pixels, then one rotation
+    crop       cuts scanner/table border bands near the edges, then crops
+               to the ink bounding box
+
+Steps come from OCR_PREPROCESS (comma-separated, in the order above;
+"none" disables preprocessing). The default is DEFAULT_STEPS, the two
+steps that only drop information tesseract does not use; binarize, deskew
+and crop are opt-in until bench_ocr_preprocess.py shows they improve
+accuracy on real tesseract output.
+"""
+import math
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+ALL_STEPS = ("grayscale", "downscale", "binarize", "deskew", "crop")
+DEFAULT_STEPS = ("grayscale", "downscale")
+TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", 300))
+MAX_SKEW_DEGREES = float(os.getenv("OCR_MAX_SKEW", 5))
+# Long side of a letter/A4 page at TARGET_DPI; used when the image carries no DPI
+PAGE_LONG_SIDE_INCHES = 11.7
+INK_THRESHOLD = 128 # Gray level below which a pixel counts as ink for deskew/crop
+BORDER_INK_FRACTION = 0.6 # Rows/columns with more ink than this are border, not text
+BORDER_REACH = 0.15 # How far in from each edge border bands are looked for
+CROP_MARGIN = 16
+BINARIZE_SENSITIVITY = 0.15 # Bradley t: darker than (1 - t) x local mean is ink
+BINARIZE_MIN_CONTRAST = 16 # Gray levels; keeps sensor noise on dark backgrounds from turning into ink
+
+
+def configured_steps() -> Tuple[str, ...]:
+    raw = os.getenv("OCR_PREPROCESS", ",".join(DEFAULT_STEPS)).strip().lower()
+    if raw in ("", "none", "off", "0"):
+        return ()
+    steps = tuple(s.strip() for s in raw.split(",") if s.strip())
+    unknown = [s for s in steps if s not in ALL_STEPS]
+    if unknown:
+        print(f"Warning: ignoring unknown OCR_PREPROCESS steps: {', '.join(unknown)}")
+    return tuple(s for s in ALL_STEPS if s in steps)
+
+
+STEPS = configured_steps()
+
+
+def _dpi(image: Image.Image) -> Optional[float]:
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] and dpi[0] > 1:
+        return float(dpi[0])
+    return None
+
+
+def to_grayscale(image: Image.Image) -> np.ndarray:
+    if image.mode in ("I;16", "I;16B", "I"):
+        arr = np.asarray(image, dtype=np.float32)
+        span = max(float(arr.max() - arr.min()), 1.0)
+        return ((arr - arr.min()) * (255.0 / span)).astype(np.uint8)
+    if image.mode != "L":
+        image = image.convert("L")
+    return np.asarray(image)
+
+
+def downscale(gray: np.ndarray, dpi: Optional[float], target_dpi: int = TARGET_DPI) -> Tuple[np.ndarray, Optional[float]]:
+    """Shrinks oversized images towards target_dpi; never upscales."""
+    h, w = gray.shape
+    if dpi is not None:
+        scale = target_dpi / dpi
+    else:
+        scale = (PAGE_LONG_SIDE_INCHES * target_dpi) / max(h, w)
+    if scale >= 0.9:
+        return gray, dpi
+    factor = 1 / scale
+    if abs(factor - round(factor)) < 0.15:
+        f = int(round(factor))
+        hh, ww = h - h % f, w - w % f
+        # f x f strided views of the page, each one pixel per block, summed in place
+        acc = np.zeros((hh // f, ww // f), dtype=np.uint32)
+        for dy in range(f):
+            for dx in range(f):
+                acc += gray[dy:hh:f, dx:ww:f]
+        out = (acc // (f * f)).astype(np.uint8)
+    else:
+        out = np.asarray(Image.fromarray(gray).resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BOX))
+    return out, (dpi * scale if dpi is not None else None)
+
+
+def _border(fractions: np.ndarray) -> Tuple[int, int]:
+    """First and last index inside any border band within BORDER_REACH of either end."""
+    n = len(fractions)
+    reach = max(1, int(n * BORDER_REACH))
+    head = np.flatnonzero(fractions[:reach] > BORDER_INK_FRACTION)
+    tail = np.flatnonzero(fractions[n - reach:] > BORDER_INK_FRACTION)
+    start = head[-1] + 1 if len(head) else 0
+    stop = n - reach + tail[0] if len(tail) else n
+    return start, max(stop, start)
+
+
+def crop(gray: np.ndarray, margin: int = CROP_MARGIN) -> np.ndarray:
+    ink = gray < INK_THRESHOLD
+    top, bottom = _border(ink.mean(axis=1))
+    left, right = _border(ink.mean(axis=0))
+    if (top, bottom, left, right) != (0, len(ink), 0, ink.shape[1]):
+        # A band's inner edge is often a few pixels of partial shadow
+        top, left = min(top + 4, bottom), min(left + 4, right)
+        bottom, right = max(bottom - 4, top), max(right - 4, left)
+    inner = ink[top:bottom, left:right]
+
+    # Speckle and the stair-stepped ends of rotated border lines are a pixel or two per row
+    ys = np.flatnonzero(inner.sum(axis=1) > max(2, inner.shape[1] // 500))
+    xs = np.flatnonzero(inner.sum(axis=0) > max(2, inner.shape[0] // 500))
+    if len(ys) == 0 or len(xs) == 0:
+        return gray
+    y0, y1 = max(top + ys[0] - margin, 0), min(top + ys[-1] + margin + 1, gray.shape[0])
+    x0, x1 = max(left + xs[0] - margin, 0), min(left + xs[-1] + margin + 1, gray.shape[1])
+    out = gray[y0:y1, x0:x1].copy()
+    # Whatever survives of the border inside the margin becomes paper
+    out[:max(top - y0, 0)] = 255
+    out[:, :max(left - x0, 0)] = 255
+    out[max(bottom - y0, 0):] = 255
+    out[:, max(right - x0, 0):] = 255
+    return out
+
+
+def estimate_skew(gray: np.ndarray, max_degrees: float = MAX_SKEW_DEGREES, sample: int = 60000) -> float:
+    """
+    Skew of the text lines in degrees, counter-clockwise like PIL's rotate.
+    Level text gives the sharpest horizontal projection, so the angle whose
+    sheared row histogram has the largest sum of squares wins. Searched
+    coarse-to-fine on a fixed sample of ink pixels.
+    """
+    ys, xs = np.nonzero(gray < INK_THRESHOLD)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > sample:
+        pick = np.random.default_rng(0).choice(len(ys), sample, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32) - gray.shape[1] / 2
+
+    def score(degrees: float) -> float:
+        rows = np.round(ys + xs * math.tan(math.radians(degrees))).astype(np.int64)
+        counts = np.bincount(rows - rows.min())
+        return float(np.dot(counts, counts))
+
+    best = 0.0
+    for step, span in ((1.0, max_degrees), (0.2, 1.0), (0.05, 0.2)):
+        candidates = np.arange(best - span, best + span + step / 2, step)
+        best = float(max(candidates, key=score))
+    return best if abs(best) >= 0.1 else 0.0
+
+
+def deskew(gray: np.ndarray, angle: Optional[float] = None, binary: bool = False) -> np.ndarray:
+    angle = estimate_skew(gray) if angle is None else angle
+    if not angle:
+        return gray
+    # Nearest keeps a binarized page two-tone; interpolating would bring back gray edges
+    resample = Image.NEAREST if binary else Image.BILINEAR
+    return np.asarray(Image.fromarray(gray).rotate(-angle, resample=resample, expand=True, fillcolor=255))
+
+
+def _box_sums(values: np.ndarray, half: int, axis: int) -> np.ndarray:
+    """Sum over a 2*half+1 window along one axis, clipped at the edges, from one cumsum."""
+    n = values.shape[axis]
+    padded = np.cumsum(values, axis=axis, dtype=np.int32)
+    padded = np.concatenate([np.zeros_like(np.take(padded, [0], axis=axis)), padded], axis=axis)
+    hi = np.minimum(np.arange(n) + half + 1, n)
+    lo = np.maximum(np.arange(n) - half, 0)
+    return np.take(padded, hi, axis=axis) - np.take(padded, lo, axis=axis)
+
+
+def binarize(gray: np.ndarray, dpi: Optional[float] = None, sensitivity: float = BINARIZE_SENSITIVITY,
+             min_contrast: int = BINARIZE_MIN_CONTRAST) -> np.ndarray:
+    """
+    Bradley-Roth adaptive threshold: a pixel is ink when it is darker than
+    (1 - sensitivity) x the mean of the window around it, and by at least
+    min_contrast gray levels. The window sums
+    come from a separable integral image (two cumsums), so the cost does
+    not depend on the window size.
+    """
+    h, w = gray.shape
+    window = max(15, int(round((dpi or TARGET_DPI) / 10)) | 1) # About a tenth of an inch, odd
+    half = window // 2
+    sums = _box_sums(_box_sums(gray, half, 0), half, 1) # 255 x window^2 fits int32 comfortably
+    rows = np.minimum(np.arange(h) + half + 1, h) - np.maximum(np.arange(h) - half, 0)
+    cols = np.minimum(np.arange(w) + half + 1, w) - np.maximum(np.arange(w) - half, 0)
+    mean = sums / (rows[:, None] * cols[None, :]).astype(np.float32)
+    ink = (gray < mean * (1.0 - sensitivity)) & (gray < mean - min_contrast)
+    return np.where(ink, 0, 255).astype(np.uint8)
+
+
+def prepare(image: Image.Image, steps: Sequence[str] = None) -> Image.Image:
+    """
+    The image tesseract should see; returned unchanged when no steps are
+    configured. Every other step works on one channel, so any of them
+    implies grayscale.
+    """
+    steps = STEPS if steps is None else tuple(steps)
+    if not steps:
+        return image
+    dpi = _dpi(image)
+    gray = to_grayscale(image)
+    if "downscale" in steps:
+        gray, dpi = downscale(gray, dpi)
+    if "binarize" in steps:
+        gray = binarize(gray, dpi)
+    if "deskew" in steps:
+        gray = deskew(gray, binary="binarize" in steps)
+    if "crop" in steps:
+        gray = crop(gray)
+    out = Image.fromarray(gray)
+    if dpi:
+        out.info["dpi"] = (dpi, dpi)
+    return out
@@ -0,0 +1,237 @@
+"""
+Background re-encryption after an encryption key rotation.
+
+Once ENCRYPTION_KEYS lists a new primary key, new writes use it immediately
+and old rows stay readable through the retired keys. This worker walks
+analysis_results (then trend_points, then the blob store's files) in id order
+and rewrites every row not yet under the primary key:
+
+- Small batches, each in its own short transaction, so the table is never
+  locked for long and SQLite writers only wait for one batch.
+- A pause between batches throttles it well below request traffic.
+- Each update is conditional on the row still holding the ciphertext that was
+  read, so a concurrent delete or rewrite is never overwritten.
+- Blobs only get their data key re-sealed (BlobStore.rewrap); the chunk
+  ciphertext is copied as is.
+- Progress lives in stats() (exposed on /metrics); a pass can be re-run any
+  time and only touches rows that still need it.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import func, select, update
+from . import blobstore, database, storage
+
+
+class KeyRotationWorker:
+    def __init__(self, session_factory, crypto_service, batch_size: int = 50, pause: float = 0.2, blob_store=None):
+        self._session_factory = session_factory
+        self.crypto_service = crypto_service
+        self.blob_store = blob_store
+        self.batch_size = batch_size
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.state = "idle"
+        self.table = None
+        self.total_rows = 0
+        self.scanned = 0
+        self.rotated = 0
+        self.skipped = 0 # Changed or deleted while we worked on it
+        self.failed = 0 # No configured key can decrypt it
+        self.batches = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Starts a pass in the background; returns False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._reset()
+            self._stop.clear()
+            self.state = "running"
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="key-rotation", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        """Runs a full pass in the calling thread (used by the CLI script)."""
+        self._reset()
+        self.state = "running"
+        self.started_at = time.time()
+        self._run()
+
+    def _run(self):
+        try:
+            self._count_rows()
+            self._rotate_table(database.AnalysisResult, self._rotate_result)
+            self._rotate_table(database.TrendPoint, self._rotate_trend_point)
+            if self.blob_store is not None:
+                self._rotate_table(database.StoredBlob, self._rotate_blob)
+            self.state = "stopped" if self._stop.is_set() else "completed"
+        except Exception as e:
+            self.state = "error"
+            self.last_error = str(e)
+            print(f"Key rotation failed: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def _count_rows(self):
+        db = self._session_factory()
+        try:
+            self.total_rows = (
+                db.scalar(select(func.count()).select_from(database.AnalysisResult)) +
+                db.scalar(select(func.count()).select_from(database.TrendPoint))
+            )
+            if self.blob_store is not None:
+                self.total_rows += db.scalar(select(func.count()).select_from(database.StoredBlob))
+        finally:
+            db.close()
+
+    def _rotate_table(self, model, rotate_batch):
+        self.table = model.__tablename__
+        last_id = 0
+        while not self._stop.is_set():
+            db = self._session_factory()
+            try:
+                last_id = rotate_batch(db, last_id)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            if not last_id:
+                return
+            self.batches += 1
+            if self.pause:
+                self._stop.wait(self.pause)
+
+    def _rotate_result(self, db, last_id: int) -> int:
+        """Rotates one batch of analysis_results; returns the last id seen (0 when done)."""
+        r = database.AnalysisResult
+        rows = db.execute(
+            select(r.id, r.encrypted_payload, r.encrypted_data)
+            .where(r.id > last_id)
+            .order_by(r.id.asc()).limit(self.batch_size)
+        ).all()
+        for row in rows:
+            self.scanned += 1
+            current = row.encrypted_payload if row.encrypted_payload is not None else row.encrypted_data
+            if current is None:
+                continue
+            try:
+                new_payload = storage.reencrypt(self.crypto_service, current)
+            except Exception:
+                self.failed += 1
+                continue
+            if new_payload is None:
+                continue
+
+            guard = (r.encrypted_payload == row.encrypted_payload) if row.encrypted_payload is not None \
+                else (r.encrypted_payload.is_(None) & (r.encrypted_data == row.encrypted_data))
+            updated = db.execute(
+                update(r).where(r.id == row.id, guard)
+                .values(encrypted_payload=new_payload, encrypted_data=None)
+            ).rowcount
+            if updated:
+                self.rotated += 1
+            else:
+                self.skipped += 1
+        return rows[-1].id if rows else 0
+
+    def _rotate_trend_point(self, db, last_id: int) -> int:
+        t = database.TrendPoint
+        rows = db.execute(
+            select(t.id, t.encrypted_projection)
+            .where(t.id > last_id)
+            .order_by(t.id.asc()).limit(self.batch_size)
+        ).all()
+        for row in rows:
+            self.scanned += 1
+            token = row.encrypted_projection.encode()
+            if self.crypto_service.is_primary_token(token):
+                continue
+            try:
+                new_token = self.crypto_service.rotate_token(token).decode()
+            except Exception:
+                self.failed += 1
+                continue
+            updated = db.execute(
+                update(t).where(t.id == row.id, t.encrypted_projection == row.encrypted_projection)
+                .values(encrypted_projection=new_token)
+            ).rowcount
+            if updated:
+                self.rotated += 1
+            else:
+                self.skipped += 1
+        return rows[-1].id if rows else 0
+
+    def _rotate_blob(self, db, last_id: str) -> str:
+        """Re-seals one batch of blob data keys; blob ids are strings, so the cursor is too ("" when done)."""
+        b = database.StoredBlob
+        ids = db.scalars(
+            select(b.id).where(b.id > (last_id or "")).order_by(b.id.asc()).limit(self.batch_size)
+        ).all()
+        for blob_id in ids:
+            self.scanned += 1
+            try:
+                # Holds the blob's row until the commit, so the collector cannot remove it mid-rewrap
+                rotated = self.blob_store.rewrap(blob_id, db)
+                db.commit()
+            except (FileNotFoundError, blobstore.BlobNotFound):
+                db.rollback()
+                self.skipped += 1 # Collected while we worked on it
+                continue
+            except Exception:
+                db.rollback()
+                self.failed += 1
+                continue
+            if rotated:
+                self.rotated += 1
+        return ids[-1] if ids else ""
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "state": self.state,
+            "table": self.table,
+            "primary_key_id": self.crypto_service.payload_key_id.hex(),
+            "active_keys": len(self.crypto_service.keys),
+            "total_rows": self.total_rows,
+            "scanned": self.scanned,
+            "rotated": self.rotated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "progress": min(1.0, round(self.scanned / self.total_rows, 4)) if self.total_rows else (1.0 if self.state == "completed" else 0.0),
+            "elapsed_seconds": round(elapsed, 3),
+            "last_error": self.last_error,
+        }
+
+
+def worker_from_env(crypto_service, blob_store=None) -> KeyRotationWorker:
+    return KeyRotationWorker(
+        database.SessionLocal,
+        crypto_service,
+        batch_size=int(os.getenv("KEY_ROTATION_BATCH_SIZE", 50)),
+        pause=float(os.getenv("KEY_ROTATION_PAUSE_SECONDS", 0.2)),
+        blob_store=blob_store
+    )
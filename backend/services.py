@@ -2,15 +2,58 @@ import pytesseract
 from PIL import Image
 import io
 import json
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import base64
+import hashlib
 import os
-from typing import Dict, Any
+from typing import Dict, Any, BinaryIO, Iterable, Iterator, List, Optional, Union
+
+# Tesseract inherits this: one OpenMP thread each, parallelism comes from the
+# OCR process pool and the PDF page threads (pdfs.PDF_OCR_WORKERS) instead
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def load_encryption_keys() -> List[str]:
+    """
+    ENCRYPTION_KEYS is a comma-separated list of Fernet keys, primary first;
+    the others are retired keys kept only for decryption until rotation
+    finishes. Falls back to the single ENCRYPTION_KEY.
+    """
+    keys = [k.strip() for k in os.getenv("ENCRYPTION_KEYS", "").split(",") if k.strip()]
+    if not keys and os.getenv("ENCRYPTION_KEY"):
+        keys = [os.getenv("ENCRYPTION_KEY")]
+    if not keys:
+        print("Warning: ENCRYPTION_KEY is not set; using an ephemeral key. Data stored now will be unreadable after a restart.")
+        keys = [Fernet.generate_key().decode()]
+    return keys
+
+def derive_payload_key(fernet_key: Union[str, bytes]) -> bytes:
+    # AES-256-GCM key for the binary payload format (storage.py), derived
+    # from the Fernet secret so no extra configuration is needed
+    raw_key = base64.urlsafe_b64decode(fernet_key)
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"biotrack payload v2").derive(raw_key)
 
 class MedicalCryptoService:
-    def __init__(self):
-        # In production, this key should be managed via a secure KMS (Key Management Service)
-        self.key = os.getenv("ENCRYPTION_KEY", Fernet.generate_key())
-        self.cipher = Fernet(self.key)
+    """
+    Encrypts with the primary key and decrypts with any configured key, so
+    keys can be rotated while old rows are re-encrypted in the background
+    (see rotation.py).
+    """
+
+    def __init__(self, keys: Optional[List[str]] = None):
+        # In production, these keys should be managed via a secure KMS (Key Management Service)
+        self.keys = list(keys) if keys else load_encryption_keys()
+        self.key = self.keys[0]
+        self._primary_fernet = Fernet(self.key)
+        self.cipher = MultiFernet([Fernet(k) for k in self.keys])
+
+        self._payload_aeads: Dict[bytes, AESGCM] = {}
+        for k in self.keys:
+            payload_key = derive_payload_key(k)
+            self._payload_aeads.setdefault(hashlib.sha256(payload_key).digest()[:4], AESGCM(payload_key))
+        self.payload_key_id = next(iter(self._payload_aeads))
 
     def encrypt_file(self, file_content: bytes) -> bytes:
         return self.cipher.encrypt(file_content)
@@ -18,124 +61,81 @@ class MedicalCryptoService:
     def decrypt_file(self, encrypted_content: bytes) -> bytes:
         return self.cipher.decrypt(encrypted_content)
 
+    def payload_cipher(self, key_id: Optional[bytes] = None) -> AESGCM:
+        """AEAD for binary payloads; raises KeyError for a key id this service does not hold."""
+        return self._payload_aeads[self.payload_key_id if key_id is None else key_id]
+
+    def is_primary_token(self, token: bytes) -> bool:
+        """True if a Fernet token is already encrypted under the primary key."""
+        try:
+            self._primary_fernet.decrypt(token)
+            return True
+        except InvalidToken:
+            return False
+
+    def rotate_token(self, token: bytes) -> bytes:
+        """Re-encrypts a Fernet token under the primary key (raises InvalidToken if no key fits)."""
+        return self.cipher.rotate(token)
+
 class OCRService:
     @staticmethod
-    def extract_text(image_content: bytes) -> str:
-        image = Image.open(io.BytesIO(image_content))
-        text = pytesseract.image_to_string(image)
-        return text
+    def iter_pages(content: Union[bytes, str, BinaryIO], on_page_error=None) -> Iterator[str]:
+        """
+        Text page by page from raw bytes, a file path or an open binary file:
+        PDFs via their text layer or per-page OCR (pdfs.py), images as one
+        page. PDF pages that fail OCR go to on_page_error.
+        """
+        from . import pdfs
+        if pdfs.is_pdf(content):
+            yield from pdfs.iter_page_text(content, on_error=on_page_error)
+            return
+        if isinstance(content, bytes):
+            content = io.BytesIO(content)
+        yield OCRService.image_to_text(Image.open(content))
+
+    @staticmethod
+    def image_to_text(image: Image.Image) -> str:
+        from . import preprocess
+        return pytesseract.image_to_string(preprocess.prepare(image))
 
 class DietRecommendationEngine:
     @staticmethod
     def generate_diet_plan(diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Maps medical markers to specific diet templates with structured data.
+        Selection is a rule table over bucketed markers; see diet.py.
         """
-        markers = {m["name"]: m["value"] for m in diagnosis_data.get("biomarkers", [])}
-        
-        # Default Plan: Balanced
-        diet_type = "Balanced Maintenance"
-        macros = {"calories": 2000, "protein": 150, "carbs": 200, "fats": 65, "hydration": 2500}
-        meals = [
-            {"time": "Breakfast", "name": "Oatmeal with Berries", "calories": 400, "protein": 12, "carbs": 60, "fats": 8, "desc": "Steel-cut oats with blueberries and almonds"},
-            {"time": "Lunch", "name": "Grilled Chicken Salad", "calories": 600, "protein": 45, "carbs": 20, "fats": 35, "desc": "Mixed greens, cherry tomatoes, balsamic vinaigrette"},
-            {"time": "Snack", "name": "Greek Yogurt Parfait", "calories": 250, "protein": 15, "carbs": 30, "fats": 5, "desc": "Low-fat yogurt with honey and granola"},
-            {"time": "Dinner", "name": "Baked Salmon & Quinoa", "calories": 550, "protein": 40, "carbs": 45, "fats": 20, "desc": "Lemon herb salmon with steamed broccoli"}
-        ]
-        shopping_list = ["Oats", "Blueberries", "Chicken Breast", "Mixed Greens", "Salmon", "Quinoa", "Greek Yogurt"]
-
-        # Logic layer
-        if markers.get("Glucose", 0) > 126 or markers.get("HbA1c", 0) > 6.5:
-            diet_type = "Low Glycemic / Diabetic Friendly"
-            macros = {"calories": 1800, "protein": 140, "carbs": 130, "fats": 70, "hydration": 2200}
-            meals = [
-                {"time": "Breakfast", "name": "Vegetable Omelet", "calories": 350, "protein": 22, "carbs": 8, "fats": 25, "desc": "3 eggs with spinach and mushrooms"},
-                {"time": "Lunch", "name": "Turkey Lettuce Wraps", "calories": 450, "protein": 35, "carbs": 15, "fats": 28, "desc": "Lean ground turkey, asian slaw, lettuce cups"},
-                {"time": "Snack", "name": "Handful of Almonds", "calories": 180, "protein": 6, "carbs": 6, "fats": 16, "desc": "Raw almonds (unsalted)"},
-                {"time": "Dinner", "name": "Zucchini Noodles with Pesto", "calories": 400, "protein": 28, "carbs": 12, "fats": 24, "desc": "Spiralized zucchini, chicken, basil pesto"}
-            ]
-            shopping_list = ["Eggs", "Spinach", "Ground Turkey", "Lettuce", "Zucchini", "Chicken Breast", "Almonds", "Pesto"]
-        
-        elif markers.get("Systolic BP", 0) > 140:
-            diet_type = "DASH (Heart Healthy)"
-            macros = {"calories": 1900, "protein": 130, "carbs": 220, "fats": 50, "hydration": 2000}
-            meals = [
-                {"time": "Breakfast", "name": "Banana & Spinach Smoothie", "calories": 300, "protein": 10, "carbs": 55, "fats": 4, "desc": "Spinach, banana, skim milk, chia seeds"},
-                {"time": "Lunch", "name": "Lentil Soup", "calories": 450, "protein": 25, "carbs": 65, "fats": 8, "desc": "Low-sodium lentil soup with whole wheat roll"},
-                {"time": "Snack", "name": "Apple Slices", "calories": 100, "protein": 1, "carbs": 25, "fats": 0, "desc": "Fresh apple slices"},
-                {"time": "Dinner", "name": "Grilled White Fish", "calories": 500, "protein": 45, "carbs": 40, "fats": 15, "desc": "Cod or Tilapia with brown rice and asparagus"}
-            ]
-            shopping_list = ["Banana", "Spinach", "Skim Milk", "Lentils", "Whole Wheat Rolls", "Cod/Tilapia", "Brown Rice", "Asparagus"]
-
-        elif markers.get("Creatinine", 0) > 1.2:
-            diet_type = "Renal Friendly"
-            macros = {"calories": 1800, "protein": 60, "carbs": 250, "fats": 60, "hydration": 1800}
-            meals = [
-                {"time": "Breakfast", "name": "Rice Cereal with Berries", "calories": 350, "protein": 4, "carbs": 70, "fats": 4, "desc": "Rice cereal with almond milk and strawberries"},
-                {"time": "Lunch", "name": "Pasta with Olive Oil", "calories": 500, "protein": 10, "carbs": 80, "fats": 14, "desc": "White pasta with garlic, olive oil, and bell peppers"},
-                {"time": "Snack", "name": "Rice Cakes", "calories": 100, "protein": 2, "carbs": 22, "fats": 0, "desc": "Plain rice cakes"},
-                {"time": "Dinner", "name": "Eggplant Stir-fry", "calories": 450, "protein": 8, "carbs": 60, "fats": 20, "desc": "Eggplant, onions, carrots, white rice"}
-            ]
-            shopping_list = ["Rice Cereal", "Strawberries", "Pasta", "Bell Peppers", "Eggplant", "White Rice", "Rice Cakes"]
-
-        return {
-            "diet_type": diet_type,
-            "macros": macros,
-            "meals": meals,
-            "shopping_list": shopping_list,
-            "recommendations": [f"Follow the {diet_type} plan.", "Stay hydrated.", "Monitor portion sizes."]
-        }
+        from .diet import generate_plan
+        return generate_plan(diagnosis_data)
+
+    @staticmethod
+    def generate_diet_plans(diagnoses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        from .diet import generate_plans
+        return generate_plans(diagnoses)
 
 class BiomarkerExtractor:
     @staticmethod
     def parse_with_llm(text: str) -> Dict[str, Any]:
         """
-        Extracts structured biomarkers with reference ranges.
+        Extracts structured biomarkers with reference ranges from the report
+        text, normalized to canonical units. See labs.py.
         """
-        # Hardcoded simulation of typical lab report findings
-        biomarkers = [
-            {"name": "Glucose", "value": 142, "unit": "mg/dL", "range": "70 - 99", "status": "High"},
-            {"name": "HbA1c", "value": 7.2, "unit": "%", "range": "4.0 - 5.6", "status": "High"},
-            {"name": "Cholesterol", "value": 225, "unit": "mg/dL", "range": "< 200", "status": "High"},
-            {"name": "Systolic BP", "value": 145, "unit": "mmHg", "range": "90 - 120", "status": "High"},
-            {"name": "Creatinine", "value": 0.9, "unit": "mg/dL", "range": "0.7 - 1.3", "status": "Normal"}
-        ]
-        
-        return {
-            "biomarkers": biomarkers,
-            "interpretation": "Analysis shows elevated blood sugar and blood pressure. Renal markers are within normal range."
-        }
+        from .labs import parse_report
+        return parse_report(text)
+
+    @staticmethod
+    def parse_pages(pages: Iterable[str]) -> Dict[str, Any]:
+        """Same as parse_with_llm, consuming pages as they arrive."""
+        from .labs import parse_pages
+        return parse_pages(pages)
 
 
 class NutritionEstimator:
     @staticmethod
     def estimate_nutrition(query: str) -> Dict[str, Any]:
         """
-        Simulates an AI estimation of nutrition from natural language text.
-        In a real app, this would call an LLM or Nutrition API (e.g., Edamam, Nutritionix).
+        Estimates nutrition from natural language text ("2 eggs and a banana").
+        Delegates to the shared food engine, which is built once per process.
         """
-        query = query.lower()
-        
-        # Simple local database for demo purposes
-        db = {
-            "oatmeal": {"calories": 150, "protein": 5, "carbs": 27, "fats": 3},
-            "egg": {"calories": 70, "protein": 6, "carbs": 1, "fats": 5},
-            "chicken": {"calories": 165, "protein": 31, "carbs": 0, "fats": 3.6},
-            "salad": {"calories": 50, "protein": 2, "carbs": 10, "fats": 0},
-            "apple": {"calories": 95, "protein": 0.5, "carbs": 25, "fats": 0.3},
-            "rice": {"calories": 130, "protein": 2.7, "carbs": 28, "fats": 0.3},
-            "banana": {"calories": 105, "protein": 1.3, "carbs": 27, "fats": 0.3},
-            "yogurt": {"calories": 59, "protein": 10, "carbs": 3.6, "fats": 0.4},
-            "salmon": {"calories": 208, "protein": 20, "carbs": 0, "fats": 13},
-            "avocado": {"calories": 160, "protein": 2, "carbs": 9, "fats": 15},
-            "almonds": {"calories": 164, "protein": 6, "carbs": 6, "fats": 14},
-            "steak": {"calories": 271, "protein": 26, "carbs": 0, "fats": 19},
-        }
-
-        # Fuzzy match logic
-        for key, data in db.items():
-            if key in query:
-                return data
-        
-        # Default fallback if unknown
-        return {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
+        from .foods import food_engine
+        return food_engine.estimate(query)
@@ -0,0 +1,154 @@
+"""
+Versioned at-rest format for encrypted analysis payloads.
+
+Version 2 (AnalysisResult.encrypted_payload, binary column):
+
+    version (1) | codec (1) | key id (4) | nonce (12) | AES-256-GCM ciphertext + tag
+
+The JSON is compressed before encryption (ciphertext does not compress) and
+the 6-byte header is bound as associated data, so it cannot be altered
+without failing authentication. Rows written before this format keep their
+base64 Fernet token in encrypted_data and stay readable; migrate_payloads.py
+rewrites them in place.
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, Optional, Union
+from cryptography.exceptions import InvalidTag
+from . import database
+
+FORMAT_V2 = 2
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+
+_HEADER = struct.Struct(">BB4s")
+NONCE_BYTES = 12
+ZLIB_LEVEL = int(os.getenv("PAYLOAD_ZLIB_LEVEL", 6))
+# Tiny payloads are not worth a zlib header; store them raw
+MIN_COMPRESS_BYTES = 256
+
+
+class PayloadFormatError(ValueError):
+    pass
+
+
+def seal(crypto_service, plaintext: bytes) -> bytes:
+    codec = CODEC_NONE
+    body = plaintext
+    if len(plaintext) >= MIN_COMPRESS_BYTES:
+        compressed = zlib.compress(plaintext, ZLIB_LEVEL)
+        if len(compressed) < len(plaintext):
+            codec, body = CODEC_ZLIB, compressed
+
+    header = _HEADER.pack(FORMAT_V2, codec, crypto_service.payload_key_id)
+    nonce = os.urandom(NONCE_BYTES)
+    return header + nonce + crypto_service.payload_cipher().encrypt(nonce, body, header)
+
+
+def unseal(crypto_service, blob: bytes) -> bytes:
+    if len(blob) < _HEADER.size + NONCE_BYTES:
+        raise PayloadFormatError("Payload is truncated")
+    version, codec, key_id = _HEADER.unpack_from(blob)
+    if version != FORMAT_V2:
+        raise PayloadFormatError(f"Unsupported payload format version {version}")
+
+    header = blob[:_HEADER.size]
+    nonce = blob[_HEADER.size:_HEADER.size + NONCE_BYTES]
+    try:
+        body = crypto_service.payload_cipher(key_id).decrypt(nonce, blob[_HEADER.size + NONCE_BYTES:], header)
+    except KeyError:
+        raise PayloadFormatError(f"No key available for key id {key_id.hex()}")
+    except InvalidTag:
+        raise PayloadFormatError("Payload failed authentication")
+
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_NONE:
+        return body
+    raise PayloadFormatError(f"Unknown payload codec {codec}")
+
+
+def decrypt_stored(crypto_service, ciphertext: Union[bytes, str]) -> bytes:
+    """Plaintext for either a v2 binary payload or a legacy Fernet token (str)."""
+    if isinstance(ciphertext, str):
+        return crypto_service.decrypt_file(ciphertext.encode())
+    if ciphertext[:1] == bytes([FORMAT_V2]):
+        return unseal(crypto_service, bytes(ciphertext))
+    # A legacy token that ended up in a binary column
+    return crypto_service.decrypt_file(bytes(ciphertext))
+
+
+def payload_key_id(blob: bytes) -> Optional[bytes]:
+    """Key id from a v2 header, or None for anything else."""
+    if len(blob) >= _HEADER.size and blob[0] == FORMAT_V2:
+        return _HEADER.unpack_from(blob)[2]
+    return None
+
+
+def reencrypt(crypto_service, ciphertext: Union[bytes, str]) -> Optional[bytes]:
+    """
+    Returns the ciphertext re-sealed under the primary key in the v2 format,
+    or None if it already is. Legacy Fernet tokens are always converted.
+    """
+    if isinstance(ciphertext, (bytes, bytearray, memoryview)) and payload_key_id(bytes(ciphertext)) == crypto_service.payload_key_id:
+        return None
+    return seal(crypto_service, decrypt_stored(crypto_service, ciphertext))
+
+
+def encode_json(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def stored_ciphertext(result) -> Optional[Union[bytes, str]]:
+    """The row's ciphertext in whichever format it was written."""
+    if result.encrypted_payload is not None:
+        return result.encrypted_payload
+    return result.encrypted_data
+
+
+def load_result_payload(crypto_service, result) -> Dict[str, Any]:
+    return json.loads(decrypt_stored(crypto_service, stored_ciphertext(result)))
+
+
+def store_result_payload(crypto_service, result, data: Dict[str, Any]):
+    """Writes data to the row in the current format and clears any legacy token."""
+    result.encrypted_payload = seal(crypto_service, encode_json(data))
+    result.encrypted_data = None
+
+
+def migrate_legacy_payloads(db, crypto_service, batch_size: int = 100) -> Dict[str, int]:
+    """
+    Rewrites rows that still hold a legacy Fernet token into the v2 format.
+    Commits once per batch so the run can be interrupted and resumed.
+    """
+    stats = {"migrated": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    while True:
+        results = db.query(database.AnalysisResult).filter(
+            database.AnalysisResult.id > last_id,
+            database.AnalysisResult.encrypted_payload.is_(None),
+            database.AnalysisResult.encrypted_data.isnot(None)
+        ).order_by(database.AnalysisResult.id.asc()).limit(batch_size).all()
+
+        if not results:
+            break
+
+        for r in results:
+            last_id = r.id
+            try:
+                plaintext = crypto_service.decrypt_file(r.encrypted_data.encode())
+            except Exception as e:
+                print(f"Skipping result {r.id}: {e}")
+                stats["failed"] += 1
+                continue
+            stats["bytes_before"] += len(r.encrypted_data)
+            # Re-encode so legacy whitespace-padded JSON gets the compact form too
+            r.encrypted_payload = seal(crypto_service, encode_json(json.loads(plaintext)))
+            r.encrypted_data = None
+            stats["bytes_after"] += len(r.encrypted_payload)
+            stats["migrated"] += 1
+        db.commit()
+
+    return stats
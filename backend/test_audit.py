@@ -0,0 +1,66 @@
+"""
+The batched AuditWriter.
+
+Run from the repository root: python -m pytest backend/test_audit.py
+"""
+import asyncio
+import json
+import time
+
+from backend.audit import AuditWriter
+
+
+class SlowSession:
+    """Stands in for a SQLAlchemy session; commits take `delay` seconds and land in `rows`."""
+
+    def __init__(self, rows: list, delay: float):
+        self.rows = rows
+        self.delay = delay
+        self.pending = []
+
+    def add_all(self, objs):
+        self.pending.extend(objs)
+
+    def commit(self):
+        time.sleep(self.delay)
+        self.rows.extend(self.pending)
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def slow_writer(rows: list, delay: float = 0.5, **kwargs) -> AuditWriter:
+    return AuditWriter(lambda: SlowSession(rows, delay), flush_interval=0.01, **kwargs)
+
+
+def test_timed_out_wait_does_not_kill_the_writer(tmp_path):
+    rows = []
+    writer = slow_writer(rows, wait_timeout=0.1, dead_letter_path=str(tmp_path / "dead.jsonl"))
+
+    async def run():
+        await writer.log(1, "VIEW", "report/1", "127.0.0.1") # Gives up waiting after 0.1s
+        await writer.log(1, "VIEW", "report/2", "127.0.0.1")
+
+    asyncio.run(run())
+    assert writer.stats()["durability_timeouts"] == 2
+    assert writer._thread.is_alive()
+    writer.shutdown()
+    assert [r.resource for r in rows] == ["report/1", "report/2"]
+    assert writer.stats()["events_failed"] == 0
+
+
+def test_log_after_shutdown_dead_letters_the_event(tmp_path):
+    rows = []
+    dead = tmp_path / "dead.jsonl"
+    writer = slow_writer(rows, delay=0, dead_letter_path=str(dead))
+    asyncio.run(writer.log(1, "VIEW", "report/1", "127.0.0.1"))
+    writer.shutdown()
+
+    asyncio.run(writer.log(1, "DELETE", "report/1", "127.0.0.1")) # Does not raise
+    assert [r.resource for r in rows] == ["report/1"]
+    record = json.loads(dead.read_text())
+    assert (record["action"], record["resource"]) == ("DELETE", "report/1")
+    assert "shut down" in record["error"]
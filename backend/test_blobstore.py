@@ -0,0 +1,213 @@
+"""
+The encrypted blob store (blobstore.py) on a temporary directory and database.
+
+Run from the repository root: python -m pytest backend/test_blobstore.py
+"""
+import asyncio
+import datetime
+import hashlib
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from backend import database
+from backend.blobstore import BlobCorrupted, BlobNotFound, BlobStore, byte_range
+from backend.services import MedicalCryptoService
+
+CHUNK = 16
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'blobs.db'}"
+    engine = database.make_engine(url, "production")
+    database.Base.metadata.create_all(bind=engine)
+    yield url
+    engine.dispose()
+
+
+@pytest.fixture
+def store(tmp_path, db_url):
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=database.make_engine(db_url, "production"))
+    return BlobStore(str(tmp_path / "blobs"), MedicalCryptoService([Fernet.generate_key().decode()]),
+                     session_factory=Session, chunk_size=CHUNK)
+
+
+@pytest.fixture
+def in_transaction(db_url):
+    """Runs fn(async_session) in one committed transaction, as a request handler would."""
+    engine = create_async_engine(database.async_database_url(db_url), poolclass=NullPool)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    def run(fn):
+        async def go():
+            async with Session() as db:
+                result = await fn(db)
+                await db.commit()
+                return result
+        return asyncio.run(go())
+
+    yield run
+    asyncio.run(engine.dispose())
+
+
+def row(store, blob_id):
+    db = store._session_factory()
+    try:
+        return db.get(database.StoredBlob, blob_id)
+    finally:
+        db.close()
+
+
+def stored(store, data: bytes) -> str:
+    blob_id = store.blob_id(hashlib.sha256(data).hexdigest())
+    store.write(data, blob_id)
+    return blob_id
+
+
+# --- byte_range ---
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-19", (10, 19)),
+    ("bytes=90-500", (90, 99)), # Clamped to the end
+    ("bytes=95-", (95, 99)), # Open-ended
+    ("bytes=-10", (90, 99)), # Suffix
+    ("bytes=-500", (0, 99)), # Suffix longer than the blob
+    ("bytes=99-99", (99, 99)),
+])
+def test_byte_range_satisfiable(header, expected):
+    assert byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-9", "bytes=0-9,20-29", "bytes=", "bytes=-", "bytes=abc-", "bytes=1-x",
+    "bytes=1.5-9", "bytes=-+5", "bytes=20-10", "bytes=0-9 junk",
+])
+def test_byte_range_ignores_malformed_headers(header):
+    assert byte_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", 100), ("bytes=100-200", 100), ("bytes=-0", 100), ("bytes=-5", 0), ("bytes=0-", 0),
+])
+def test_byte_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        byte_range(header, size)
+
+
+# --- Files ---
+
+@pytest.mark.parametrize("length", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 4 * CHUNK, 4 * CHUNK + 5])
+def test_round_trip_at_chunk_sizes(store, length):
+    data = os.urandom(length)
+    blob_id = stored(store, data)
+    assert store.size(blob_id) == length
+    assert b"".join(store.read(blob_id)) == data
+
+
+@pytest.mark.parametrize("start, end", [
+    (0, 0), (0, CHUNK - 1), (CHUNK - 1, CHUNK), (CHUNK, 2 * CHUNK - 1), (CHUNK - 3, 3 * CHUNK + 2),
+    (3 * CHUNK, 3 * CHUNK), (4 * CHUNK, 4 * CHUNK + 4), (4 * CHUNK + 4, 4 * CHUNK + 4), (5, 10_000),
+])
+def test_ranged_reads_across_chunk_boundaries(store, start, end):
+    data = os.urandom(4 * CHUNK + 5)
+    blob_id = stored(store, data)
+    assert b"".join(store.read(blob_id, start, end)) == data[start:end + 1]
+
+
+def test_range_decrypts_only_the_chunks_it_overlaps(store):
+    data = os.urandom(4 * CHUNK)
+    blob_id = stored(store, data)
+    assert list(store.read(blob_id, CHUNK - 2, CHUNK + 1)) == [data[CHUNK - 2:CHUNK], data[CHUNK:CHUNK + 2]]
+
+
+def test_duplicate_write_keeps_the_existing_file(store):
+    data = os.urandom(50)
+    blob_id = stored(store, data)
+    before = open(store.path(blob_id), "rb").read()
+    assert store.write(data, blob_id) is False
+    assert open(store.path(blob_id), "rb").read() == before
+
+
+def test_content_is_encrypted_and_tamper_evident(store):
+    data = b"patient x-ray " * 10
+    blob_id = stored(store, data)
+    with open(store.path(blob_id), "r+b") as f:
+        raw = f.read()
+        assert b"patient" not in raw
+        f.seek(len(raw) - 1)
+        f.write(bytes([raw[-1] ^ 1]))
+    with pytest.raises(BlobCorrupted):
+        b"".join(store.read(blob_id))
+    with pytest.raises(BlobNotFound):
+        store.read("0" * 64)
+
+
+def test_ids_do_not_reveal_the_content_hash(store):
+    sha = hashlib.sha256(b"x").hexdigest()
+    assert store.blob_id(sha) != sha
+    other = BlobStore(store.root, MedicalCryptoService([Fernet.generate_key().decode()]))
+    assert other.blob_id(sha) != store.blob_id(sha)
+
+
+# --- References and collection ---
+
+def test_identical_uploads_share_one_counted_blob(store, in_transaction):
+    data = os.urandom(100)
+    sha = hashlib.sha256(data).hexdigest()
+    first = in_transaction(lambda db: store.put(db, data, sha, "image/png"))
+    second = in_transaction(lambda db: store.put(db, data, sha, "image/png"))
+    assert first == second
+    assert (row(store, first).refcount, row(store, first).size_bytes) == (2, 100)
+    assert store.stats()["writes"] == 1 and store.stats()["dedup_hits"] == 1
+
+    in_transaction(lambda db: store.release(db, first))
+    assert (row(store, first).refcount, row(store, first).orphaned_at) == (1, None)
+    in_transaction(lambda db: store.release(db, first))
+    assert row(store, first).refcount == 0 and row(store, first).orphaned_at is not None
+
+
+def test_collect_waits_for_the_grace_period(store, in_transaction):
+    data = os.urandom(100)
+    blob_id = in_transaction(lambda db: store.put(db, data, hashlib.sha256(data).hexdigest()))
+    in_transaction(lambda db: store.release(db, blob_id))
+
+    assert store.collect() == 0 # Orphaned just now, grace period is an hour
+    assert store.exists(blob_id)
+
+    db = store._session_factory()
+    b = database.StoredBlob
+    past = datetime.datetime.utcnow() - datetime.timedelta(seconds=store.grace_seconds + 1)
+    db.execute(update(b).where(b.id == blob_id).values(orphaned_at=past))
+    db.commit()
+    db.close()
+    assert store.collect() == 1
+    assert not store.exists(blob_id) and row(store, blob_id) is None
+
+
+def test_collect_keeps_referenced_and_revived_blobs(store, in_transaction):
+    kept, revived = os.urandom(60), os.urandom(70)
+    kept_id = in_transaction(lambda db: store.put(db, kept, hashlib.sha256(kept).hexdigest()))
+    revived_id = in_transaction(lambda db: store.put(db, revived, hashlib.sha256(revived).hexdigest()))
+    in_transaction(lambda db: store.release(db, revived_id))
+    in_transaction(lambda db: store.put(db, revived, hashlib.sha256(revived).hexdigest())) # Uploaded again
+
+    store.grace_seconds = 0
+    assert store.collect() == 0
+    assert row(store, revived_id).refcount == 1 and row(store, revived_id).orphaned_at is None
+    assert b"".join(store.read(kept_id)) == kept
+    assert b"".join(store.read(revived_id)) == revived
+
+
+def test_collect_sweeps_files_without_rows(store):
+    orphan = stored(store, os.urandom(40)) # Written, but the transaction never committed
+    store.grace_seconds = 0
+    assert store.collect() == 0 # Only a sweep walks the files
+    assert store.collect(sweep_files=True) == 1
+    assert not store.exists(orphan)
@@ -0,0 +1,68 @@
+"""
+Diet plan selection (diet.py) against the if/elif chain it replaced.
+
+Run from the repository root: python -m pytest backend/test_diet.py
+"""
+import itertools
+
+import pytest
+
+from backend import diet
+from bench_diet_plans import legacy_plan
+
+# Each marker at, and just past, the threshold the old chain compared with ">"
+BOUNDARIES = {
+    "Glucose": (None, 126, 127),
+    "HbA1c": (None, 6.5, 6.51),
+    "Systolic BP": (None, 140, 141),
+    "Creatinine": (None, 1.2, 1.21),
+}
+
+
+def patient(values: dict) -> dict:
+    return {"biomarkers": [{"name": k, "value": v} for k, v in values.items() if v is not None]}
+
+
+def boundary_patients():
+    for combo in itertools.product(*BOUNDARIES.values()):
+        yield dict(zip(BOUNDARIES, combo))
+
+
+@pytest.mark.parametrize("values", list(boundary_patients()), ids=str)
+def test_generate_plan_matches_old_chain_at_thresholds(values):
+    new, old = diet.generate_plan(patient(values)), legacy_plan(patient(values))
+    diabetic = (values["Glucose"] or 0) > 126 or (values["HbA1c"] or 0) > 6.5
+    hypertensive = (values["Systolic BP"] or 0) > 140
+    if diabetic and hypertensive: # The one case the old chain had no plan for
+        assert old["diet_type"] == "Low Glycemic / Diabetic Friendly"
+        assert new == diet.PLANS["diabetic_dash"].to_dict()
+    else:
+        assert new == old
+
+
+@pytest.mark.parametrize("name, at, past, plan", [
+    ("Glucose", 126, 127, "low_glycemic"),
+    ("HbA1c", 6.5, 6.51, "low_glycemic"),
+    ("Systolic BP", 140, 141, "dash"),
+    ("Creatinine", 1.2, 1.21, "renal"),
+])
+def test_threshold_itself_is_not_enough(name, at, past, plan):
+    assert diet.generate_plan(patient({name: at}))["diet_type"] == diet.PLANS["balanced"].diet_type
+    assert diet.generate_plan(patient({name: past}))["diet_type"] == diet.PLANS[plan].diet_type
+
+
+def test_batch_matches_single_plans():
+    patients = [patient(v) for v in boundary_patients()]
+    assert diet.generate_plans(patients) == [diet.generate_plan(p) for p in patients]
+
+
+def test_plans_are_fresh_copies():
+    plan = diet.generate_plan(patient({"Glucose": 127}))
+    plan["meals"][0]["calories"] = 0
+    plan["shopping_list"].append("Cake")
+    assert diet.generate_plan(patient({"Glucose": 127})) == legacy_plan(patient({"Glucose": 127}))
+
+
+def test_signature_accepts_mapping_and_string_values():
+    assert diet.marker_signature({"Glucose": 127}) == diet.marker_signature([{"name": "Glucose", "value": "127"}])
+    assert diet.marker_signature([{"name": "Glucose", "value": "n/a"}, {"name": "Ferritin", "value": 900}]) == (0, 0, 0, 0)
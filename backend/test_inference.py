@@ -0,0 +1,205 @@
+"""
+XRayAnalyzer and the micro-batching InferenceServer.
+
+Run from the repository root: python -m pytest backend/test_inference.py
+"""
+import asyncio
+import io
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.inference import InferenceServer
+from backend.models import ReferenceModel, UnreadableImage, XRayAnalyzer, XRayModel
+
+
+def encode(array: np.ndarray, fmt: str = "PNG") -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(array).save(buf, fmt) # uint16 arrays become I;16
+    return buf.getvalue()
+
+
+def ramp(height: int = 64, width: int = 48, top: int = 255, dtype=np.uint8) -> np.ndarray:
+    return np.tile(np.linspace(0, top, width), (height, 1)).astype(dtype)
+
+
+class RecordingModel(XRayModel):
+    """Constant scores; records batch sizes, optionally holds the first batch until released."""
+    name = "recording"
+    input_size = 16
+
+    def __init__(self, fail_on_size: int = None):
+        self.batch_sizes = []
+        self.fail_on_size = fail_on_size
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        self.entered.set()
+        self.release.wait(5)
+        self.batch_sizes.append(len(batch))
+        if len(batch) == self.fail_on_size:
+            raise RuntimeError("forward failed")
+        return np.tile(np.array([[0.25, 0.75]], dtype=np.float32), (len(batch), 1))
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return XRayAnalyzer(ReferenceModel(input_size=64))
+
+
+def prepared(n: int, size: int = 16):
+    return [np.full((size, size), i, dtype=np.uint8) for i in range(n)]
+
+
+# --- XRayAnalyzer ---
+
+def test_prepare_resizes_to_model_input(analyzer):
+    image = analyzer.prepare(encode(ramp()))
+    assert image.shape == (64, 64)
+    assert image.dtype == np.uint8
+
+
+def test_prepare_converts_color_to_grayscale(analyzer):
+    rgb = np.stack([ramp()] * 3, axis=-1)
+    assert analyzer.prepare(encode(rgb, "JPEG")).shape == (64, 64)
+
+
+def test_prepare_keeps_16_bit_precision(analyzer):
+    image = analyzer.prepare(encode(ramp(top=40950, dtype=np.uint16)))
+    assert image.max() > 255 # Not squashed to 8 bits
+
+
+def test_prepare_keeps_big_endian_16_bit_precision(analyzer):
+    pixels = ramp(top=40950, dtype=np.uint16).astype(">u2")
+    image = Image.frombuffer("I;16B", pixels.shape[::-1], pixels.tobytes(), "raw", "I;16B", 0, 1)
+    buf = io.BytesIO()
+    image.save(buf, "TIFF")
+    assert Image.open(io.BytesIO(buf.getvalue())).mode == "I;16B"
+    prepared = analyzer.prepare(buf.getvalue())
+    assert prepared.dtype == np.uint16
+    assert 40000 < prepared.max() <= 40950
+
+
+def test_prepare_rejects_undecodable_bytes(analyzer):
+    with pytest.raises(UnreadableImage):
+        analyzer.prepare(b"not an image")
+    with pytest.raises(UnreadableImage):
+        noise = np.random.default_rng(0).integers(0, 256, (64, 64), dtype=np.uint8)
+        analyzer.prepare(encode(noise)[:2000]) # Truncated mid-stream
+
+
+def test_infer_returns_probabilities_per_image(analyzer):
+    images = [analyzer.prepare(encode(ramp(top=t))) for t in (80, 160, 255)]
+    results = analyzer.infer(images)
+    assert len(results) == 3
+    for r in results:
+        assert r["prediction"] in analyzer.model.labels
+        assert sum(r["scores"].values()) == pytest.approx(1, abs=1e-3)
+        assert r["confidence"] == pytest.approx(max(r["scores"].values()), abs=1e-3)
+        assert r["diagnostic"] is False # The reference model never backs findings
+
+
+def test_infer_batch_matches_single_images(analyzer):
+    images = [analyzer.prepare(encode(ramp(top=t))) for t in (60, 200)]
+    batched = analyzer.infer(images)
+    for image, together in zip(images, batched):
+        alone = analyzer.infer([image])[0]
+        assert alone["prediction"] == together["prediction"]
+        assert alone["confidence"] == pytest.approx(together["confidence"], abs=1e-5)
+
+
+def test_reference_model_is_deterministic():
+    batch = np.random.default_rng(0).normal(size=(2, 64, 64)).astype(np.float32)
+    np.testing.assert_array_equal(ReferenceModel(input_size=64).forward(batch), ReferenceModel(input_size=64).forward(batch))
+
+
+# --- InferenceServer ---
+
+def test_server_batches_requests_queued_during_a_forward_pass():
+    model = RecordingModel()
+    server = InferenceServer(XRayAnalyzer(model), max_batch_size=4, max_wait=0.001)
+    model.release.clear()
+    first = server.submit(prepared(1)[0])
+    assert model.entered.wait(5) # The worker is busy with the first request...
+    queued = [server.submit(image) for image in prepared(6)] # ...while these queue up
+    model.release.set()
+    results = [f.result(5) for f in [first] + queued]
+    server.shutdown()
+
+    assert [r["prediction"] for r in results] == ["Abnormal"] * 7
+    assert model.batch_sizes == [1, 4, 2]
+    stats = server.stats()
+    assert stats["requests_served"] == 7
+    assert stats["batches_run"] == 3
+    assert stats["batch_sizes"] == {1: 1, 2: 1, 4: 1}
+
+
+def test_server_fails_only_the_failing_batch():
+    model = RecordingModel(fail_on_size=3)
+    server = InferenceServer(XRayAnalyzer(model), max_batch_size=3, max_wait=0.001)
+    model.release.clear()
+    server.submit(prepared(1)[0])
+    assert model.entered.wait(5)
+    doomed = [server.submit(image) for image in prepared(3)]
+    model.release.set()
+    for f in doomed:
+        with pytest.raises(RuntimeError, match="forward failed"):
+            f.result(5)
+
+    assert server.submit(prepared(1)[0]).result(5)["status"] == "Success" # Still serving
+    server.shutdown()
+    assert server.stats()["batch_failures"] == 1
+
+
+def test_shutdown_drains_queue_and_refuses_new_requests():
+    model = RecordingModel()
+    server = InferenceServer(XRayAnalyzer(model), max_batch_size=2, max_wait=0.001)
+    model.release.clear()
+    futures = [server.submit(image) for image in prepared(5)]
+    assert model.entered.wait(5)
+    model.release.set()
+    server.shutdown()
+
+    assert all(f.done() and f.result()["status"] == "Success" for f in futures)
+    with pytest.raises(RuntimeError):
+        server.submit(prepared(1)[0])
+
+
+def test_predict_decodes_and_serves_uploads(analyzer):
+    server = InferenceServer(analyzer, max_batch_size=8, max_wait=0.001)
+
+    async def run():
+        good = await asyncio.gather(*(server.predict(encode(ramp(top=t))) for t in (90, 180, 255)))
+        with pytest.raises(UnreadableImage):
+            await server.predict(b"garbage")
+        return good
+
+    results = asyncio.run(run())
+    server.shutdown()
+    assert [r["status"] for r in results] == ["Success"] * 3
+    assert server.stats()["requests_served"] == 3 # The undecodable upload never reached the queue
+
+
+def test_cancelled_predict_does_not_kill_the_server():
+    model = RecordingModel()
+    server = InferenceServer(XRayAnalyzer(model), max_batch_size=4, max_wait=0.001)
+    model.release.clear()
+    first = server.submit(prepared(1)[0])
+    assert model.entered.wait(5)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError): # Cancels the queued request's future
+            await asyncio.wait_for(server.predict(encode(ramp())), 0.1)
+        model.release.set()
+        return await server.predict(encode(ramp()))
+
+    result = asyncio.run(run())
+    assert first.result(5)["status"] == result["status"] == "Success"
+    assert server._thread.is_alive()
+    server.shutdown()
+    assert server.stats()["requests_cancelled"] == 1
+    assert server.stats()["requests_served"] == 2
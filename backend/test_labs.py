@@ -0,0 +1,147 @@
+"""
+Biomarker extraction from lab report text (labs.py).
+
+Run from the repository root: python -m pytest backend/test_labs.py
+"""
+import pytest
+
+from backend import diet, labs
+
+
+def only(text: str) -> dict:
+    readings = labs.extract(text)
+    assert len(readings) == 1, readings
+    return readings[0]
+
+
+@pytest.mark.parametrize("text, name", [
+    ("Fasting Blood Sugar: 110 mg/dL", "Glucose"),
+    ("FBG 110 mg/dL", "Glucose"),
+    ("Glucose, Fasting ..... 110 mg/dL", "Glucose"),
+    ("Hb A1c 6.2 %", "HbA1c"),
+    ("Haemoglobin A1c: 6.2%", "HbA1c"),
+    ("Glycated hemoglobin 6.2 %", "HbA1c"),
+    ("LDL-C 120 mg/dL", "LDL"),
+    ("Serum Creatinine 0.9 mg/dL", "Creatinine"),
+    ("Creatinine (mg/dL) 0.9", "Creatinine"),
+    ("25-OH Vitamin D 42 ng/mL", "Vitamin D"),
+    ("SBP 118 mmHg", "Systolic BP"),
+])
+def test_aliases(text, name):
+    assert only(text)["name"] == name
+
+
+def test_alias_does_not_match_inside_a_longer_word():
+    assert labs.extract("Hemoglobin 14 g/dL") == [
+        {"name": "Hemoglobin", "value": 14, "unit": "g/dL", "range": "12 - 17.5", "status": "Normal"}
+    ] # Not read as "Hb"
+    assert labs.extract("TGF-beta 12 ng/mL") == []
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("Glucose 5.5 mmol/L", 99.09, "mg/dL"),
+    ("Glucose 7 mmol/l", 126.11, "mg/dL"),
+    ("Cholesterol 5.2 mmol/L", 201.08, "mg/dL"),
+    ("Creatinine 88.42 µmol/L", 1, "mg/dL"),
+    ("HbA1c 48 mmol/mol", 6.54, "%"),
+    ("HbA1c 31 mmol/mol", 4.99, "%"),
+])
+def test_converts_to_canonical_unit(text, value, unit):
+    reading = only(text)
+    assert reading["value"] == pytest.approx(value, abs=0.01)
+    assert reading["unit"] == unit
+
+
+def test_printed_range_is_converted_with_the_value():
+    reading = only("Glucose 7.8 mmol/L 3.9-5.5")
+    assert reading["range"] == "70.26 - 99.09"
+    assert reading["status"] == "High"
+
+
+@pytest.mark.parametrize("text, rng, status", [
+    ("Glucose 150 mg/dL (70 - 99) H", "70 - 99", "High"),
+    ("Potassium 3.2 mmol/L Ref range: 3.5 to 5.1", "3.5 - 5.1", "Low"),
+    ("Ferritin 250 ng/mL [30-300]", "30 - 300", "Normal"),
+    ("Ferritin 350 ng/mL [30-300]", "30 - 300", "High"),
+])
+def test_printed_range_overrides_default(text, rng, status):
+    reading = only(text)
+    assert (reading["range"], reading["status"]) == (rng, status)
+
+
+@pytest.mark.parametrize("text, rng, status", [
+    ("LDL 130 mg/dL < 100", "< 100", "High"),
+    ("LDL 3.2 mmol/L (< 2.6)", "< 100.54", "High"),
+    ("HDL 45 mg/dL > 40", "> 40", "Normal"),
+    ("HDL 35 mg/dL >= 40", "> 40", "Low"),
+])
+def test_one_sided_bounds(text, rng, status):
+    reading = only(text)
+    assert (reading["range"], reading["status"]) == (rng, status)
+
+
+def test_default_range_when_none_is_printed():
+    reading = only("Sodium 150 mEq/L")
+    assert reading == {"name": "Sodium", "value": 150, "unit": "mmol/L", "range": "135 - 145", "status": "High"}
+
+
+@pytest.mark.parametrize("text, status", [
+    ("Creatinine 1.1 mmol/L", "Normal"),
+    ("Glucose 6.1 %", "Normal"),
+    ("Glucose 6.1 % L", "Low"),
+    ("Glucose 6.1 % H", "High"),
+])
+def test_unconvertible_unit_keeps_lab_value_and_uses_only_the_flag(text, status):
+    reading = only(text)
+    assert reading["range"] == ""
+    assert reading["status"] == status
+    assert diet.marker_signature([reading]) == (0,) * len(diet.MARKERS)
+
+
+def test_paired_blood_pressure():
+    assert labs.extract("Blood Pressure 145/92 mmHg") == [
+        {"name": "Systolic BP", "value": 145, "unit": "mmHg", "range": "90 - 120", "status": "High"},
+        {"name": "Diastolic BP", "value": 92, "unit": "mmHg", "range": "60 - 80", "status": "High"},
+    ]
+    assert [r["value"] for r in labs.extract("BP: 118/76")] == [118, 76]
+
+
+def test_single_analyte_with_a_ratio_is_ignored():
+    assert labs.extract("Glucose 5/7") == []
+
+
+@pytest.mark.parametrize("text", [
+    "Date: 12/05/2024",
+    "Collected 2024-05-12 08:30",
+    "Report date: 05/12/2024 Page 1 of 3",
+])
+def test_date_lines_are_ignored(text):
+    assert labs.extract(text) == []
+
+
+def test_date_lines_between_results():
+    text = "Collected: 12/05/2024\nGlucose 92 mg/dL\nReported 13/05/2024 09:14\nHbA1c 5.4 %"
+    assert [(r["name"], r["value"]) for r in labs.extract(text)] == [("Glucose", 92), ("HbA1c", 5.4)]
+
+
+def test_values_do_not_span_lines():
+    assert labs.extract("Glucose\n95 mg/dL") == []
+
+
+def test_first_reading_wins():
+    text = "Glucose 95 mg/dL\nHbA1c 5.4 %\n\nHistory\nGlucose 180 mg/dL\nHbA1c 8.1 %"
+    assert [(r["name"], r["value"]) for r in labs.extract(text)] == [("Glucose", 95), ("HbA1c", 5.4)]
+
+
+def test_first_reading_wins_across_pages():
+    pages = ["Glucose 95 mg/dL", "Glucose 180 mg/dL\nCreatinine 1.0 mg/dL"]
+    assert [(r["name"], r["value"]) for r in labs.extract_pages(pages)] == [("Glucose", 95), ("Creatinine", 1)]
+    assert labs.extract_pages(pages) == labs.extract("\n".join(pages))
+
+
+def test_interpretation_lists_out_of_range_markers():
+    report = labs.parse_report("Glucose 150 mg/dL\nHDL 35 mg/dL\nSodium 140 mmol/L")
+    assert report["interpretation"] == (
+        "Above reference range: Glucose. Below reference range: HDL. All other measured markers are within range."
+    )
+    assert labs.parse_report("nothing here")["interpretation"] == "No recognized biomarkers were found in the report text."
@@ -0,0 +1,107 @@
+"""
+Concurrent writes under the production SQLite profile (see bench_sqlite_writes.py).
+
+Run from the repository root: python -m pytest backend/test_sqlite_writes.py
+"""
+import datetime
+import threading
+import time
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from backend import database, nutrition
+
+WRITERS = 16
+READERS = 4
+SECONDS = 2.0
+USERS = 8
+
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'stress.db'}", "production")
+    database.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def test_production_profile_uses_wal(Session):
+    db = Session()
+    try:
+        assert db.connection().exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert db.connection().exec_driver_sql("PRAGMA busy_timeout").scalar() == database.SQLITE_PROFILES["production"]["busy_timeout"]
+    finally:
+        db.close()
+
+
+def test_concurrent_writers_and_readers_never_lock(Session):
+    counts = {"writes": 0, "reads": 0}
+    errors = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(n):
+        db = Session()
+        try:
+            i = 0
+            while not stop.is_set():
+                user_id = (n + i) % USERS + 1
+                if i % 3:
+                    db.add(database.MealLog(user_id=user_id, name="stress", calories=250, protein=10, carbs=30, fats=8))
+                else:
+                    db.add(database.WaterLog(user_id=user_id, amount_ml=250))
+                try:
+                    db.commit()
+                    bump("writes")
+                except (OperationalError, PoolTimeoutError) as e:
+                    db.rollback()
+                    errors.append(e)
+                i += 1
+        finally:
+            db.close()
+
+    def reader(n):
+        db = Session()
+        try:
+            i = 0
+            while not stop.is_set():
+                start, end = nutrition.day_window(datetime.datetime.utcnow().date())
+                try:
+                    db.query(func.sum(database.MealLog.calories)).filter(
+                        database.MealLog.user_id == (n + i) % USERS + 1,
+                        database.MealLog.created_at >= start,
+                        database.MealLog.created_at < end
+                    ).scalar()
+                    db.commit() # End the read transaction so the next read sees new writes
+                    bump("reads")
+                except (OperationalError, PoolTimeoutError) as e:
+                    db.rollback()
+                    errors.append(e)
+                i += 1
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(READERS)]
+    for t in threads:
+        t.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for t in threads:
+        t.join(30)
+
+    assert errors == []
+    assert counts["writes"] > 0 and counts["reads"] > 0
+    db = Session()
+    try:
+        rows = db.query(func.count(database.MealLog.id)).scalar() + db.query(func.count(database.WaterLog.id)).scalar()
+    finally:
+        db.close()
+    assert rows == counts["writes"] # Every acknowledged commit is there
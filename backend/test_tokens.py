@@ -0,0 +1,214 @@
+"""
+Offline ID token verification and the verified-token cache (tokens.py).
+
+Run from the repository root: python -m pytest backend/test_tokens.py
+"""
+import datetime
+import time
+
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from backend.tokens import OfflineTokenVerifier, TokenRevoked, VerifiedTokenCache
+
+PROJECT_ID = "biotrack-test"
+KID = "test-kid"
+
+
+def make_cert(key) -> str:
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "stand-in signer")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope="module")
+def key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(scope="module")
+def verifier(key):
+    verifier = OfflineTokenVerifier(PROJECT_ID)
+    verifier.load_certs({KID: make_cert(key)})
+    return verifier
+
+
+def make_token(key, uid="user-1", kid=KID, **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": uid,
+        "iat": now,
+        "exp": now + 3600,
+        "email": f"{uid}@example.com",
+    }
+    claims.update(overrides)
+    claims = {k: v for k, v in claims.items() if v is not None}
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# --- OfflineTokenVerifier ---
+
+def test_verify_accepts_a_valid_token(key, verifier):
+    token = make_token(key)
+    assert verifier.enabled and verifier.has_key(token)
+    claims = verifier.verify(token)
+    assert claims["uid"] == claims["sub"] == "user-1"
+    assert claims["email"] == "user-1@example.com"
+
+
+def test_verify_rejects_expired_token(key, verifier):
+    past = int(time.time()) - 7200
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verifier.verify(make_token(key, iat=past, exp=past + 3600))
+
+
+@pytest.mark.parametrize("claims", [
+    {"aud": "another-project"},
+    {"iss": "https://securetoken.google.com/another-project"},
+])
+def test_verify_rejects_token_for_another_project(key, verifier, claims):
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(make_token(key, **claims))
+
+
+def test_verify_rejects_missing_or_empty_subject(key, verifier):
+    with pytest.raises(jwt.MissingRequiredClaimError):
+        verifier.verify(make_token(key, sub=None))
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(make_token(key, uid=""))
+
+
+def test_verify_rejects_unknown_kid_and_foreign_signature(key, verifier):
+    token = make_token(key, kid="other-kid")
+    assert not verifier.has_key(token)
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown signing key"):
+        verifier.verify(token)
+    forged = make_token(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    with pytest.raises(jwt.InvalidSignatureError):
+        verifier.verify(forged)
+
+
+def test_verifier_needs_project_and_certs(key):
+    assert not OfflineTokenVerifier(PROJECT_ID).enabled
+    assert not OfflineTokenVerifier(None, {KID: make_cert(key)}).enabled
+    assert not OfflineTokenVerifier(PROJECT_ID).has_key("not a jwt")
+
+
+# --- VerifiedTokenCache ---
+
+def test_cache_hit_until_exp_minus_margin():
+    clock = Clock()
+    cache = VerifiedTokenCache(expiry_margin=30, clock=clock)
+    cache.put("t", {"sub": "u", "exp": clock.now + 100})
+    assert cache.get("t") == {"sub": "u", "exp": clock.now + 100}
+    clock.now += 69
+    assert cache.get("t") is not None
+    clock.now += 1 # Now exactly exp - margin
+    assert cache.get("t") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_skips_claims_without_exp_or_inside_the_margin():
+    clock = Clock()
+    cache = VerifiedTokenCache(expiry_margin=30, clock=clock)
+    cache.put("no-exp", {"sub": "u"})
+    cache.put("nearly-expired", {"sub": "u", "exp": clock.now + 30})
+    assert cache.get("no-exp") is None
+    assert cache.get("nearly-expired") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_is_bounded_lru():
+    clock = Clock()
+    cache = VerifiedTokenCache(max_entries=3, clock=clock)
+    for t in ("a", "b", "c"):
+        cache.put(t, {"sub": t, "exp": clock.now + 3600})
+    assert cache.get("a") is not None # Now most recently used
+    cache.put("d", {"sub": "d", "exp": clock.now + 3600})
+    assert cache.stats()["entries"] == 3
+    assert cache.get("b") is None
+    assert all(cache.get(t) is not None for t in ("a", "c", "d"))
+
+
+def test_revoke_denies_the_token_until_its_exp():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    claims = {"sub": "u", "iat": clock.now, "exp": clock.now + 600}
+    cache.put("t", claims)
+    assert cache.revoke("t") == clock.now + 600 # The cached token's own exp
+    assert cache.get("t") is None
+    with pytest.raises(TokenRevoked):
+        cache.check_revoked("t", claims)
+    cache.check_revoked("other", claims) # Only that token
+    clock.now += 601
+    cache.check_revoked("t", claims) # Expired anyway; the entry is dropped
+    assert cache.stats()["revoked_tokens"] == 0
+
+
+def test_revoke_uncached_token_defaults_to_an_hour():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    assert cache.revoke("t") == clock.now + 3600
+    assert cache.revoke("u", exp=clock.now + 5) == clock.now + 5
+
+
+def test_revoke_user_rejects_tokens_issued_before_it():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    old = {"sub": "uid-1", "email": "a@example.com", "iat": clock.now - 10, "exp": clock.now + 3000}
+    other = {"sub": "uid-2", "iat": clock.now - 10, "exp": clock.now + 3000}
+    cache.put("old", old)
+    cache.put("other", other)
+    assert cache.revoke_user("uid-1") == clock.now
+    assert cache.get("old") is None # Evicted from the cache
+    assert cache.get("other") is not None
+    with pytest.raises(TokenRevoked):
+        cache.check_revoked("old", old)
+    cache.check_revoked("other", other)
+
+    clock.now += 1
+    cache.check_revoked("new", dict(old, iat=clock.now)) # Signed in again afterwards
+
+
+def test_revoke_user_by_email_and_keeps_latest_time():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    claims = {"sub": "uid-1", "email": "a@example.com", "iat": clock.now - 5, "exp": clock.now + 3000}
+    cache.revoke_user("a@example.com")
+    cache.revoke_user("a@example.com", revoked_at=clock.now - 100) # Older: ignored
+    with pytest.raises(TokenRevoked, match="Session revoked"):
+        cache.check_revoked("t", claims)
+    assert cache.stats()["revoked_users"] == 1
+
+
+def test_verified_token_round_trip_through_the_cache(key, verifier):
+    cache = VerifiedTokenCache()
+    token = make_token(key)
+    claims = verifier.verify(token)
+    cache.put(token, claims)
+    assert cache.get(token)["uid"] == "user-1"
+    cache.revoke(token)
+    with pytest.raises(TokenRevoked):
+        cache.check_revoked(token, claims)
@@ -0,0 +1,214 @@
+"""
+Firebase ID token verification helpers.
+
+VerifiedTokenCache remembers tokens that already passed signature checks so
+repeat requests skip RSA verification until the token's own `exp`.
+OfflineTokenVerifier checks RS256 signatures against a locally cached set of
+signing certificates (the same JSON format Google publishes), which also lets
+tests run against a stand-in key set.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import jwt
+from cryptography import x509
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenRevoked(Exception):
+    pass
+
+
+def _subjects(claims: Dict[str, Any]):
+    return [s for s in (claims.get("uid") or claims.get("sub"), claims.get("email")) if s]
+
+
+class VerifiedTokenCache:
+    """
+    LRU of verified token claims keyed by SHA-256 of the token.
+
+    Entries expire at the token's `exp` (minus a safety margin) and the cache
+    holds at most max_entries. Revocation is explicit: a revoked token is
+    denied until it would have expired anyway, and revoke_user() rejects every
+    token for a subject (uid or email) issued before the revocation. Both are
+    per process; auth.RevocationSync shares them between processes.
+    """
+
+    def __init__(self, max_entries: int = 10000, expiry_margin: float = 30.0, clock=time.time):
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict() # digest -> (claims, expires_at)
+        self._revoked: Dict[bytes, float] = {} # digest -> original exp
+        self._revoked_users: Dict[str, float] = {} # uid -> revoked at
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        digest = token_digest(token)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= now:
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: Dict[str, Any]):
+        exp = claims.get("exp")
+        if exp is None:
+            return # Never cache claims without an expiry
+        expires_at = float(exp) - self.expiry_margin
+        if expires_at <= self._clock():
+            return
+        digest = token_digest(token)
+        with self._lock:
+            self._entries[digest] = (claims, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def check_revoked(self, token: str, claims: Optional[Dict[str, Any]] = None):
+        """Raises TokenRevoked if the token, or its user before this token was issued, was revoked."""
+        now = self._clock()
+        digest = token_digest(token)
+        with self._lock:
+            if digest in self._revoked:
+                if self._revoked[digest] > now:
+                    raise TokenRevoked("Token has been revoked")
+                del self._revoked[digest]
+            if claims is not None:
+                for subject in _subjects(claims):
+                    revoked_at = self._revoked_users.get(subject)
+                    if revoked_at is not None and float(claims.get("iat", 0)) <= revoked_at:
+                        raise TokenRevoked("Session revoked for this user")
+
+    def revoke(self, token: str, exp: Optional[float] = None) -> float:
+        """Denies the token until exp (its own exp when cached, else an hour); returns that time."""
+        digest = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if exp is None:
+                exp = entry[0].get("exp") if entry else self._clock() + 3600
+        self.revoke_digest(digest, float(exp))
+        return float(exp)
+
+    def revoke_digest(self, digest: bytes, exp: float):
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = exp
+
+    def revoke_user(self, subject: str, revoked_at: Optional[float] = None) -> float:
+        """Rejects tokens of subject (uid or email) issued at or before revoked_at (default now); returns that time."""
+        revoked_at = self._clock() if revoked_at is None else revoked_at
+        with self._lock:
+            self._revoked_users[subject] = max(revoked_at, self._revoked_users.get(subject, 0.0))
+            for digest in [d for d, (claims, _) in self._entries.items() if subject in _subjects(claims)]:
+                del self._entries[digest]
+        return revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "revoked_tokens": len(self._revoked),
+                "revoked_users": len(self._revoked_users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class OfflineTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally: RS256 signature against cached
+    certificates keyed by `kid`, plus exp/iat/aud/iss/sub claim checks.
+    """
+
+    def __init__(self, project_id: Optional[str], certs: Optional[Dict[str, str]] = None, leeway: float = 0):
+        self.project_id = project_id
+        self.leeway = leeway
+        self._keys: Dict[str, Any] = {}
+        if certs:
+            self.load_certs(certs)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.project_id and self._keys)
+
+    def load_certs(self, certs: Dict[str, str]):
+        """certs maps kid -> PEM-encoded X.509 certificate."""
+        self._keys = {kid: x509.load_pem_x509_certificate(pem.encode()).public_key() for kid, pem in certs.items()}
+
+    def load_file(self, path: str):
+        with open(path) as f:
+            self.load_certs(json.load(f))
+
+    def refresh(self, cache_path: Optional[str] = None, url: str = GOOGLE_CERTS_URL):
+        """Downloads the published certificates, optionally caching them to disk."""
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            certs = json.loads(resp.read().decode())
+        self.load_certs(certs)
+        if cache_path:
+            with open(cache_path, "w") as f:
+                json.dump(certs, f)
+
+    def has_key(self, token: str) -> bool:
+        try:
+            return jwt.get_unverified_header(token).get("kid") in self._keys
+        except jwt.PyJWTError:
+            return False
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        header = jwt.get_unverified_header(token)
+        key = self._keys.get(header.get("kid"))
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key id")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=self.project_id,
+            issuer=f"https://securetoken.google.com/{self.project_id}",
+            leeway=self.leeway,
+            options={"require": ["exp", "iat", "sub"]}
+        )
+        if not claims.get("sub"):
+            raise jwt.InvalidTokenError("Token has an empty subject")
+        claims.setdefault("uid", claims["sub"])
+        return claims
+
+
+def verifier_from_env() -> OfflineTokenVerifier:
+    verifier = OfflineTokenVerifier(project_id=os.getenv("FIREBASE_PROJECT_ID"))
+    keys_file = os.getenv("FIREBASE_SIGNING_KEYS_FILE")
+    if keys_file and os.path.exists(keys_file):
+        try:
+            verifier.load_file(keys_file)
+        except Exception as e:
+            print(f"Warning: could not load signing keys from {keys_file}: {e}")
+    return verifier
@@ -0,0 +1,102 @@
+import json
+from typing import Any, Dict, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import database, storage
+
+
+def vitality_score(biomarkers) -> int:
+    # Mock Vitality Score based on biomarkers
+    return min(100, 70 + (len(biomarkers) * 5)) # Base 70 + 5 per detected biomarker
+
+
+def build_projection(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduces a full analysis payload to the fields the trends chart needs.
+    Drops extracted_text and the meal plan so trend reads stay small.
+    """
+    biomarkers = data.get("biomarkers", {})
+
+    # Extract macros if available
+    macros = {}
+    if "diet_plan" in data and "macros" in data["diet_plan"]:
+        macros = data["diet_plan"]["macros"]
+
+    return {
+        "biomarkers": biomarkers,
+        "macros": macros,
+        "vitality_score": vitality_score(biomarkers)
+    }
+
+
+def record_trend_point(db, crypto_service, result: database.AnalysisResult, data: Dict[str, Any]) -> database.TrendPoint:
+    """
+    Adds the encrypted projection for a freshly stored report (sync or async session).
+    The caller commits, so the point lands in the same transaction as the result.
+    """
+    projection = build_projection(data)
+    point = database.TrendPoint(
+        user_id=result.user_id,
+        result_id=result.id,
+        recorded_at=result.created_at,
+        encrypted_projection=crypto_service.encrypt_file(json.dumps(projection).encode()).decode()
+    )
+    db.add(point)
+    return point
+
+
+async def load_trends(db: AsyncSession, crypto_service, user_id: int, cache=None) -> List[Dict[str, Any]]:
+    points = (await db.execute(
+        select(database.TrendPoint).where(
+            database.TrendPoint.user_id == user_id
+        ).order_by(database.TrendPoint.recorded_at.asc())
+    )).scalars().all()
+
+    trends = []
+    for p in points:
+        try:
+            if cache is not None:
+                projection = cache.load(p.result_id, p.encrypted_projection, crypto_service)
+            else:
+                projection = json.loads(crypto_service.decrypt_file(p.encrypted_projection.encode()).decode())
+        except Exception as e:
+            print(f"Error decrypting trend point {p.id}: {e}")
+            continue
+        trends.append({"date": p.recorded_at.isoformat(), **projection})
+    return trends
+
+
+def backfill(db: Session, crypto_service, batch_size: int = 100) -> Dict[str, int]:
+    """
+    Creates trend points for report results stored before projections existed.
+    Commits once per batch so a long backfill can be interrupted and resumed.
+    """
+    created = 0
+    failed = 0
+    last_id = 0
+    while True:
+        results = db.query(database.AnalysisResult).outerjoin(
+            database.TrendPoint, database.TrendPoint.result_id == database.AnalysisResult.id
+        ).filter(
+            database.AnalysisResult.analysis_type == "report",
+            database.AnalysisResult.id > last_id,
+            database.TrendPoint.id.is_(None)
+        ).order_by(database.AnalysisResult.id.asc()).limit(batch_size).all()
+
+        if not results:
+            break
+
+        for r in results:
+            last_id = r.id
+            try:
+                data = storage.load_result_payload(crypto_service, r)
+            except Exception as e:
+                print(f"Skipping result {r.id}: {e}")
+                failed += 1
+                continue
+            record_trend_point(db, crypto_service, r, data)
+            created += 1
+        db.commit()
+
+    return {"created": created, "failed": failed}
@@ -0,0 +1,241 @@
+"""
+Streaming ingestion for uploaded scans and reports.
+
+Uploads are read in fixed-size chunks. The file type is sniffed from its
+magic bytes (the client's content_type is not trusted), a per-type size cap
+is enforced before the data is kept, and a SHA-256 is computed on the fly.
+Small uploads stay in memory; larger ones spill to a named temp file so
+worker processes can open them by path instead of receiving one big bytes
+object.
+
+By the time a handler sees an UploadFile, Starlette has already spooled the
+whole multipart body, so the cap that bounds what reaches the disk is
+BodySizeLimit: it counts request body bytes as they arrive, with or without
+a Content-Length. The copy into IngestedUpload is deliberate: FastAPI closes
+UploadFiles when the request ends, while background jobs keep their upload.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from typing import Callable, Iterable, Optional, Union
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# (magic prefix, kind, media type)
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"\xff\xd8\xff", "jpeg", "image/jpeg"),
+    (b"II*\x00", "tiff", "image/tiff"),
+    (b"MM\x00*", "tiff", "image/tiff"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+    (b"BM", "bmp", "image/bmp"),
+    (b"%PDF-", "pdf", "application/pdf"),
+)
+_SNIFF_BYTES = 16
+
+IMAGE_KINDS = ("png", "jpeg", "tiff", "gif", "bmp", "webp")
+REPORT_KINDS = IMAGE_KINDS + ("pdf",)
+
+MAX_UPLOAD_BYTES = {
+    "image": int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", 20 * 1024 * 1024)),
+    "pdf": int(os.getenv("MAX_PDF_UPLOAD_BYTES", 50 * 1024 * 1024)),
+}
+
+
+def sniff_kind(head: bytes) -> Optional[tuple]:
+    """Returns (kind, media_type) for a recognised file header, else None."""
+    for magic, kind, media_type in _SIGNATURES:
+        if head.startswith(magic):
+            return kind, media_type
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def size_limit(kind: str) -> int:
+    return MAX_UPLOAD_BYTES["pdf" if kind == "pdf" else "image"]
+
+
+def max_upload_bytes() -> int:
+    return max(MAX_UPLOAD_BYTES.values())
+
+
+class IngestedUpload:
+    """
+    A validated upload held in memory or in a temp file.
+    Use .path (when spilled to disk) or .open() for later stages; .read()
+    materialises the bytes and should be reserved for small payloads.
+    """
+
+    def __init__(self, filename: Optional[str] = None):
+        self.filename = filename
+        self.kind: Optional[str] = None
+        self.media_type: Optional[str] = None
+        self.size = 0
+        self.sha256: Optional[str] = None
+        self.path: Optional[str] = None
+        self._buffer: Union[io.BytesIO, "tempfile._TemporaryFileWrapper"] = io.BytesIO()
+
+    def _write(self, chunk: bytes):
+        self._buffer.write(chunk)
+        if self.path is None and self._buffer.tell() > SPOOL_THRESHOLD:
+            spill = tempfile.NamedTemporaryFile(prefix="upload_", dir=UPLOAD_TMP_DIR, delete=False)
+            spill.write(self._buffer.getvalue())
+            self._buffer = spill
+            self.path = spill.name
+
+    def _finish(self):
+        self._buffer.flush()
+        self._buffer.seek(0)
+
+    def open(self):
+        """Returns a file handle positioned at the start of the upload."""
+        self._buffer.seek(0)
+        return self._buffer
+
+    def read(self) -> bytes:
+        return self.open().read()
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """Picklable handle for worker processes: a temp file path, or the bytes if small."""
+        return self.path if self.path is not None else self.read()
+
+    def close(self):
+        self._buffer.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def ingest_upload(file: UploadFile, allowed_kinds: Iterable[str]) -> IngestedUpload:
+    """
+    Streams an UploadFile into an IngestedUpload.
+    Raises 415 for unrecognised or disallowed types, 413 once the per-type cap
+    is exceeded, and 400 for empty uploads.
+    """
+    allowed_kinds = tuple(allowed_kinds)
+    upload = IngestedUpload(filename=file.filename)
+    hasher = hashlib.sha256()
+    head = b""
+    limit = max_upload_bytes()
+
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if upload.kind is None:
+                head += chunk[:_SNIFF_BYTES]
+                if len(head) >= _SNIFF_BYTES or len(chunk) < CHUNK_SIZE:
+                    detected = sniff_kind(head)
+                    if detected is None or detected[0] not in allowed_kinds:
+                        raise HTTPException(
+                            status_code=415,
+                            detail=f"Unsupported file type. Allowed: {', '.join(allowed_kinds)}."
+                        )
+                    upload.kind, upload.media_type = detected
+                    limit = size_limit(upload.kind)
+
+            upload.size += len(chunk)
+            if upload.size > limit:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {limit} byte limit for {upload.kind or 'this'} uploads.")
+
+            hasher.update(chunk)
+            upload._write(chunk)
+
+        if upload.size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload.")
+        if upload.kind is None:
+            detected = sniff_kind(head)
+            if detected is None or detected[0] not in allowed_kinds:
+                raise HTTPException(status_code=415, detail=f"Unsupported file type. Allowed: {', '.join(allowed_kinds)}.")
+            upload.kind, upload.media_type = detected
+    except BaseException:
+        upload.close()
+        raise
+
+    upload.sha256 = hasher.hexdigest()
+    upload._finish()
+    return upload
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimit:
+    """
+    ASGI middleware capping POST bodies at limit_for(path) bytes (None: no cap).
+    A larger Content-Length is refused before anything is read; otherwise the
+    body is counted as it streams in and the request is answered 413 as soon
+    as it passes the cap, whatever the app made of the aborted body.
+    """
+
+    def __init__(self, app, limit_for: Callable[[str], Optional[int]]):
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return # The app's answer to a truncated body; ours follows
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded: # FastAPI may re-raise our abort as something else
+                raise
+        if exceeded and not started:
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send):
+        body = b'{"detail":"Upload too large."}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
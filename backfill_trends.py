@@ -0,0 +1,24 @@
+"""
+Backfills encrypted trend projections for reports analyzed before
+/analytics/trends switched to the trend_points table.
+
+Usage: python backfill_trends.py [batch_size]
+"""
+import sys
+from backend import database, trends
+from backend.services import MedicalCryptoService
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        stats = trends.backfill(db, MedicalCryptoService(), batch_size=batch_size)
+        print(f"Trend points created: {stats['created']}, skipped (undecryptable): {stats['failed']}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmarks request latency under concurrency for the async database layer.
+
+Runs N concurrent clients against GET /nutrition/meals on main.app (AsyncSession
+via aiosqlite/asyncpg) and against an equivalent handler that uses a blocking
+sync Session inside an async route (the previous layout). Auth is overridden
+so only the database path is measured.
+
+--latency-ms adds a per-statement delay on the thread that runs the query to
+emulate a networked database such as Postgres. Against a local SQLite file
+queries take microseconds and the async path mostly adds driver overhead; the
+gain shows once each query has to wait on I/O.
+
+Usage: python bench_async_db.py [--clients 50] [--requests 20] [--latency-ms 2]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_async_db_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from backend import auth, database, main
+
+MEALS = 30
+
+
+def seed() -> auth.UserIdentity:
+    database.init_db()
+    db = database.SessionLocal()
+    user = database.User(username="bench@example.com", full_name="Bench", hashed_password="N/A", role="patient")
+    db.add(user)
+    db.commit()
+    noon = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time(12))
+    db.add_all(
+        database.MealLog(user_id=user.id, name=f"meal {i}", calories=100, protein=5, carbs=10, fats=2,
+                         created_at=noon + datetime.timedelta(minutes=i))
+        for i in range(MEALS)
+    )
+    db.commit()
+    identity = auth.UserIdentity.from_user(user)
+    db.close()
+    return identity
+
+
+def blocking_app(identity: auth.UserIdentity, clients: int, latency_ms: float) -> FastAPI:
+    """
+    The old shape: an async route doing a sync query on the event loop.
+    It gets a pool as large as the client count; with the default pool (5 + 10
+    overflow) a blocked checkout stalls the loop that would release
+    connections, so past 15 concurrent requests it hangs for pool_timeout.
+    """
+    app = FastAPI()
+    engine = create_engine(database.SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+                           pool_size=clients, max_overflow=0)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    add_latency(engine, latency_ms)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/nutrition/meals")
+    async def get_todays_meals(db: Session = Depends(get_db)):
+        start, end = main.nutrition.day_window(datetime.datetime.utcnow().date())
+        meals = db.query(database.MealLog).filter(
+            database.MealLog.user_id == identity.id,
+            database.MealLog.created_at >= start,
+            database.MealLog.created_at < end
+        ).order_by(database.MealLog.created_at.desc()).limit(50).all()
+        return [{"id": m.id, "name": m.name, "calories": m.calories} for m in meals]
+
+    return app
+
+
+def add_latency(engine, latency_ms: float):
+    if latency_ms <= 0:
+        return
+    delay = latency_ms / 1000
+
+    def on_connect(dbapi_connection, connection_record):
+        # sqlite3 calls the trace callback on the thread executing the statement:
+        # the caller's thread for the sync engine, aiosqlite's worker thread otherwise
+        raw = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        raw = getattr(raw, "_conn", raw)
+        raw.set_trace_callback(lambda statement: time.sleep(delay))
+
+    event.listen(engine, "connect", on_connect)
+
+
+async def drive(app: FastAPI, clients: int, requests: int):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/nutrition/meals") # Warm the pools
+
+        async def worker():
+            for _ in range(requests):
+                start = time.perf_counter()
+                r = await client.get("/nutrition/meals")
+                latencies.append(time.perf_counter() - start)
+                assert r.status_code == 200 and len(r.json()) == MEALS, r.text
+
+        wall = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        wall = time.perf_counter() - wall
+    # aiosqlite connections own non-daemon threads; close them on this loop
+    await database.async_engine.dispose()
+    return latencies, wall
+
+
+def report(label: str, latencies, wall: float):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<22} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms   {len(latencies) / wall:8.1f} req/s")
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    identity = seed()
+    add_latency(database.async_engine.sync_engine, args.latency_ms)
+
+    async def current_user():
+        return identity
+
+    main.app.dependency_overrides[auth.get_current_active_user] = current_user
+
+    print(f"{args.clients} concurrent clients x {args.requests} requests, "
+          f"{MEALS} meals/day, +{args.latency_ms} ms per query")
+    report("sync Session (before)", *asyncio.run(drive(blocking_app(identity, args.clients, args.latency_ms), args.clients, args.requests)))
+    report("AsyncSession", *asyncio.run(drive(main.app, args.clients, args.requests)))
+
+
+if __name__ == "__main__":
+    run()
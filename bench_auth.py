@@ -0,0 +1,81 @@
+"""
+Benchmarks per-request auth overhead of auth.verify_firebase_token using a
+local stand-in signing key set (no network, no Firebase project needed).
+
+Compares RS256 verification on every request against the verified-token
+cache, for a dashboard-style burst of 6 calls per page load.
+
+Usage: python bench_auth.py [page_loads]
+"""
+import datetime
+import sys
+import time
+import uuid
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from backend import auth, tokens
+
+PROJECT_ID = "biotrack-bench"
+CALLS_PER_PAGE = 6
+
+
+def make_key_set():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "stand-in signer")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    kid = uuid.uuid4().hex
+    return kid, key, {kid: cert.public_bytes(serialization.Encoding.PEM).decode()}
+
+
+def make_token(kid, key, uid):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": uid,
+        "iat": now,
+        "exp": now + 3600,
+        "email": f"{uid}@example.com",
+    }
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+def run(page_loads: int, cached: bool) -> float:
+    kid, key, certs = make_key_set()
+    auth.offline_verifier = tokens.OfflineTokenVerifier(PROJECT_ID, certs)
+    auth.token_cache = tokens.VerifiedTokenCache(max_entries=10000 if cached else 0)
+    token_list = [make_token(kid, key, f"user{i}") for i in range(page_loads)]
+
+    start = time.perf_counter()
+    for token in token_list:
+        for _ in range(CALLS_PER_PAGE):
+            claims = auth.verify_firebase_token(token)
+            assert claims["aud"] == PROJECT_ID
+    return (time.perf_counter() - start) / (page_loads * CALLS_PER_PAGE)
+
+
+def main():
+    page_loads = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    uncached = run(page_loads, cached=False)
+    cached = run(page_loads, cached=True)
+    print(f"{page_loads} page loads x {CALLS_PER_PAGE} authenticated calls")
+    print(f"RS256 verify every request : {uncached * 1e6:8.1f} us/request")
+    print(f"verified-token cache       : {cached * 1e6:8.1f} us/request")
+    print(f"speedup                    : {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Biomarker extraction throughput over a synthetic lab report corpus.
+
+Reports mix table and "Name: value" layouts, SI and conventional units,
+flags, reference ranges and pages of unrelated text. The benchmark checks
+extraction against the generated ground truth, then times labs.extract on
+reports of growing length (time per line should stay flat: the scan is
+linear) against the usual alternative of one regex per analyte.
+
+Usage: python bench_biomarker_extraction.py [lines per report, e.g. 1000,10000,50000]
+"""
+import random
+import re
+import sys
+import time
+
+from backend import labs
+
+FILLER = [
+    "Specimen received in good condition. Results reviewed by the laboratory director.",
+    "Page {page} of {pages}          Printed 2024-03-02 08:14          Accession 0042-{n}",
+    "Patient instructions: fast for 8 to 12 hours before the next draw.",
+    "Method: enzymatic colorimetric assay on an automated analyzer.",
+    "Comment: interpret results in the context of the clinical picture.",
+    "",
+]
+# (analyte, canonical value range, SI unit, factor canonical->SI)
+SAMPLES = [
+    ("Glucose", (70, 200), "mmol/L", 1 / 18.016),
+    ("HbA1c", (4.5, 9.5), None, None),
+    ("Cholesterol", (140, 280), "mmol/L", 1 / 38.67),
+    ("Triglycerides", (60, 300), "mmol/L", 1 / 88.57),
+    ("Creatinine", (0.6, 2.0), "umol/L", 88.42),
+    ("Hemoglobin", (10, 17), "g/L", 10),
+    ("TSH", (0.3, 6), None, None),
+    ("Potassium", (3.2, 5.6), None, None),
+]
+LABELS = {"Glucose": "Glucose, Fasting", "HbA1c": "Hemoglobin A1c", "Cholesterol": "Total Cholesterol"}
+
+
+def report(lines: int, rng: random.Random):
+    truth = {}
+    out = []
+    pages = max(1, lines // 60)
+    for name, (lo, hi), si_unit, factor in SAMPLES:
+        value = round(rng.uniform(lo, hi), 1)
+        truth[name] = value
+        a = labs._BY_NAME[name]
+        label = LABELS.get(name, name)
+        if si_unit and rng.random() < 0.5:
+            shown, unit = round(value * factor, 3), si_unit
+        else:
+            shown, unit = value, a.unit
+        if rng.random() < 0.5:
+            out.append(f"{label:<22}{shown:<9}{'H' if a.high and value > a.high else '':<4}{unit:<10}ref {a.low or 0} - {a.high or 999}")
+        else:
+            out.append(f"{label}: {shown} {unit}")
+    sbp, dbp = rng.randint(100, 170), rng.randint(60, 100)
+    truth["Systolic BP"], truth["Diastolic BP"] = sbp, dbp
+    out.append(f"Blood Pressure: {sbp}/{dbp} mmHg")
+
+    body = []
+    for i in range(lines - len(out)):
+        body.append(rng.choice(FILLER).format(page=i // 60 + 1, pages=pages, n=i))
+    # Results on the first page, the rest is narrative and repeated headers
+    return "\n".join(out + body), truth
+
+
+def per_analyte_regex(text: str) -> dict:
+    """Baseline: one pattern per alias, each scanning the whole report."""
+    found = {}
+    for a in labs.ANALYTES:
+        for alias in a.aliases:
+            m = re.search(rf"(?<![\w-]){re.escape(alias)}(?![\w-])[^\d\n]{{0,30}}?(\d+(?:\.\d+)?)", text, re.IGNORECASE)
+            if m:
+                found[a.name] = float(m.group(1))
+                break
+    return found
+
+
+def check(rng: random.Random, reports: int = 200) -> float:
+    correct = total = 0
+    for _ in range(reports):
+        text, truth = report(80, rng)
+        got = {b["name"]: b["value"] for b in labs.extract(text)}
+        for name, value in truth.items():
+            total += 1
+            correct += name in got and abs(got[name] - value) <= max(0.06, value * 0.002)
+    return correct / total
+
+
+def timed(fn, text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 50000]
+    rng = random.Random(3)
+    print(f"accuracy on 200 generated reports: {check(rng):.1%} of values recovered")
+    print(f"{'lines':>7} {'KiB':>7} {'extract ms':>11} {'ns/line':>8} {'MiB/s':>7} {'per-analyte ms':>15}")
+    for lines in sizes:
+        text, _ = report(lines, rng)
+        repeat = max(1, 200000 // lines)
+        single = timed(labs.extract, text, repeat)
+        naive = timed(per_analyte_regex, text, max(1, repeat // 4))
+        print(f"{lines:>7} {len(text) // 1024:>7} {single * 1e3:>11.2f} {single / lines * 1e9:>8.0f} "
+              f"{len(text) / single / 2 ** 20:>7.1f} {naive * 1e3:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Blob store throughput, ranged reads and memory (backend/blobstore.py).
+
+1. Write: encrypt + fsync + publish for uploads of several sizes, from bytes
+   and from a spilled temp file (the path large uploads take), and the cost
+   of a duplicate upload (the blob already exists, nothing is written).
+2. Read: full decrypt of each blob vs a 64 KiB range at its middle, which
+   only decrypts the one or two chunks it overlaps.
+3. Memory: peak Python allocations (tracemalloc) while writing and streaming
+   the largest blob, which stays near a couple of chunks whatever its size.
+
+Files go to a temporary directory; no database is needed.
+
+Usage: python bench_blob_store.py [--sizes-mb 0.1,1,10,50] [--chunk-kb 64] [--reps 5]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from backend import blobstore
+from backend.services import MedicalCryptoService
+
+
+def timed(fn, reps: int) -> float:
+    fn() # Warm up
+    start = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - start) / reps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", default="0.1,1,10,50")
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--reps", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_blobs_")
+    try:
+        store = blobstore.BlobStore(root, MedicalCryptoService(), chunk_size=args.chunk_kb * 1024)
+        print(f"chunk size {args.chunk_kb} KiB, {args.reps} reps")
+        print(f"{'size MB':>8} {'write MB/s':>11} {'file MB/s':>10} {'dup ms':>7} {'read MB/s':>10} "
+              f"{'full ms':>8} {'range ms':>9} {'overhead':>9}")
+        largest = None
+        for size_mb in (float(s) for s in args.sizes_mb.split(",")):
+            data = os.urandom(int(size_mb * 1024 * 1024))
+            blob_id = store.blob_id(hashlib.sha256(data).hexdigest())
+            spilled = os.path.join(root, "upload.bin")
+            with open(spilled, "wb") as f:
+                f.write(data)
+
+            def write_fresh(source=data):
+                try:
+                    os.unlink(store.path(blob_id))
+                except FileNotFoundError:
+                    pass
+                store.write(source, blob_id)
+
+            write_s = timed(write_fresh, args.reps)
+            file_s = timed(lambda: write_fresh(spilled), args.reps)
+            dup_s = timed(lambda: store.write(data, blob_id), args.reps)
+            full_s = timed(lambda: b"".join(store.read(blob_id)), args.reps)
+            middle = len(data) // 2
+            range_s = timed(lambda: b"".join(store.read(blob_id, middle, middle + 65535)), args.reps * 20)
+            overhead = os.path.getsize(store.path(blob_id)) / max(len(data), 1) - 1
+            print(f"{size_mb:>8.1f} {size_mb / write_s:>11.0f} {size_mb / file_s:>10.0f} {dup_s * 1000:>7.3f} "
+                  f"{size_mb / full_s:>10.0f} {full_s * 1000:>8.2f} {range_s * 1000:>9.3f} {overhead:>9.2%}")
+            largest = (size_mb, spilled, blob_id)
+
+        size_mb, spilled, blob_id = largest
+        os.unlink(store.path(blob_id))
+        tracemalloc.start()
+        store.write(spilled, blob_id)
+        _, write_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        streamed = sum(len(piece) for piece in store.read(blob_id))
+        _, read_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"\n{size_mb:.0f} MB blob from a temp file: peak {write_peak / 1024:.0f} KiB writing, "
+              f"{read_peak / 1024:.0f} KiB streaming {streamed / 1024 / 1024:.0f} MB back")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Diet plan generation throughput: the old if/elif chain that rebuilt every
+template per call, versus diet.generate_plan (rule table + memoized
+selection) and diet.generate_plans (batch, one render per distinct plan).
+
+Synthetic patients get markers drawn around the clinical thresholds. Every
+patient without the new diabetic + hypertensive combination must get the
+same plan from both implementations; the benchmark checks that first.
+
+Usage: python bench_diet_plans.py [patients]
+"""
+import json
+import random
+import sys
+import time
+from typing import Any, Dict
+
+from backend import diet
+
+
+def legacy_plan(diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The if/elif chain diet.py replaced, kept verbatim as the baseline."""
+    markers = {m["name"]: m["value"] for m in diagnosis_data.get("biomarkers", [])}
+
+    # Default Plan: Balanced
+    diet_type = "Balanced Maintenance"
+    macros = {"calories": 2000, "protein": 150, "carbs": 200, "fats": 65, "hydration": 2500}
+    meals = [
+        {"time": "Breakfast", "name": "Oatmeal with Berries", "calories": 400, "protein": 12, "carbs": 60, "fats": 8, "desc": "Steel-cut oats with blueberries and almonds"},
+        {"time": "Lunch", "name": "Grilled Chicken Salad", "calories": 600, "protein": 45, "carbs": 20, "fats": 35, "desc": "Mixed greens, cherry tomatoes, balsamic vinaigrette"},
+        {"time": "Snack", "name": "Greek Yogurt Parfait", "calories": 250, "protein": 15, "carbs": 30, "fats": 5, "desc": "Low-fat yogurt with honey and granola"},
+        {"time": "Dinner", "name": "Baked Salmon & Quinoa", "calories": 550, "protein": 40, "carbs": 45, "fats": 20, "desc": "Lemon herb salmon with steamed broccoli"}
+    ]
+    shopping_list = ["Oats", "Blueberries", "Chicken Breast", "Mixed Greens", "Salmon", "Quinoa", "Greek Yogurt"]
+
+    # Logic layer
+    if markers.get("Glucose", 0) > 126 or markers.get("HbA1c", 0) > 6.5:
+        diet_type = "Low Glycemic / Diabetic Friendly"
+        macros = {"calories": 1800, "protein": 140, "carbs": 130, "fats": 70, "hydration": 2200}
+        meals = [
+            {"time": "Breakfast", "name": "Vegetable Omelet", "calories": 350, "protein": 22, "carbs": 8, "fats": 25, "desc": "3 eggs with spinach and mushrooms"},
+            {"time": "Lunch", "name": "Turkey Lettuce Wraps", "calories": 450, "protein": 35, "carbs": 15, "fats": 28, "desc": "Lean ground turkey, asian slaw, lettuce cups"},
+            {"time": "Snack", "name": "Handful of Almonds", "calories": 180, "protein": 6, "carbs": 6, "fats": 16, "desc": "Raw almonds (unsalted)"},
+            {"time": "Dinner", "name": "Zucchini Noodles with Pesto", "calories": 400, "protein": 28, "carbs": 12, "fats": 24, "desc": "Spiralized zucchini, chicken, basil pesto"}
+        ]
+        shopping_list = ["Eggs", "Spinach", "Ground Turkey", "Lettuce", "Zucchini", "Chicken Breast", "Almonds", "Pesto"]
+
+    elif markers.get("Systolic BP", 0) > 140:
+        diet_type = "DASH (Heart Healthy)"
+        macros = {"calories": 1900, "protein": 130, "carbs": 220, "fats": 50, "hydration": 2000}
+        meals = [
+            {"time": "Breakfast", "name": "Banana & Spinach Smoothie", "calories": 300, "protein": 10, "carbs": 55, "fats": 4, "desc": "Spinach, banana, skim milk, chia seeds"},
+            {"time": "Lunch", "name": "Lentil Soup", "calories": 450, "protein": 25, "carbs": 65, "fats": 8, "desc": "Low-sodium lentil soup with whole wheat roll"},
+            {"time": "Snack", "name": "Apple Slices", "calories": 100, "protein": 1, "carbs": 25, "fats": 0, "desc": "Fresh apple slices"},
+            {"time": "Dinner", "name": "Grilled White Fish", "calories": 500, "protein": 45, "carbs": 40, "fats": 15, "desc": "Cod or Tilapia with brown rice and asparagus"}
+        ]
+        shopping_list = ["Banana", "Spinach", "Skim Milk", "Lentils", "Whole Wheat Rolls", "Cod/Tilapia", "Brown Rice", "Asparagus"]
+
+    elif markers.get("Creatinine", 0) > 1.2:
+        diet_type = "Renal Friendly"
+        macros = {"calories": 1800, "protein": 60, "carbs": 250, "fats": 60, "hydration": 1800}
+        meals = [
+            {"time": "Breakfast", "name": "Rice Cereal with Berries", "calories": 350, "protein": 4, "carbs": 70, "fats": 4, "desc": "Rice cereal with almond milk and strawberries"},
+            {"time": "Lunch", "name": "Pasta with Olive Oil", "calories": 500, "protein": 10, "carbs": 80, "fats": 14, "desc": "White pasta with garlic, olive oil, and bell peppers"},
+            {"time": "Snack", "name": "Rice Cakes", "calories": 100, "protein": 2, "carbs": 22, "fats": 0, "desc": "Plain rice cakes"},
+            {"time": "Dinner", "name": "Eggplant Stir-fry", "calories": 450, "protein": 8, "carbs": 60, "fats": 20, "desc": "Eggplant, onions, carrots, white rice"}
+        ]
+        shopping_list = ["Rice Cereal", "Strawberries", "Pasta", "Bell Peppers", "Eggplant", "White Rice", "Rice Cakes"]
+
+    return {
+        "diet_type": diet_type,
+        "macros": macros,
+        "meals": meals,
+        "shopping_list": shopping_list,
+        "recommendations": [f"Follow the {diet_type} plan.", "Stay hydrated.", "Monitor portion sizes."]
+    }
+
+
+def synthetic_patients(count: int, rng: random.Random) -> list:
+    patients = []
+    for _ in range(count):
+        markers = [
+            {"name": "Glucose", "value": round(rng.uniform(70, 180)), "unit": "mg/dL"},
+            {"name": "HbA1c", "value": round(rng.uniform(4.5, 8.5), 1), "unit": "%"},
+            {"name": "Systolic BP", "value": round(rng.uniform(100, 170)), "unit": "mmHg"},
+            {"name": "Creatinine", "value": round(rng.uniform(0.6, 1.8), 2), "unit": "mg/dL"},
+        ]
+        patients.append({"biomarkers": rng.sample(markers, rng.randint(1, 4))})
+    return patients
+
+
+def check(patients: list) -> int:
+    differing = 0
+    for p in patients:
+        new, old = diet.generate_plan(p), legacy_plan(p)
+        if new != old:
+            assert "diabetic_dash" == diet.RULES[0].plan and new["diet_type"] == diet.PLANS["diabetic_dash"].diet_type, (p, new["diet_type"])
+            differing += 1
+    return differing
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    patients = synthetic_patients(count, random.Random(5))
+    combined = check(patients)
+    print(f"{count} patients; {combined} get the combined diabetic + hypertensive plan, the rest match the old chain")
+
+    diet.plan_for_signature.cache_clear()
+    rows = [
+        ("if/elif chain", timed(lambda: [legacy_plan(p) for p in patients])),
+        ("generate_plan", timed(lambda: [diet.generate_plan(p) for p in patients])),
+        ("generate_plans (batch)", timed(lambda: diet.generate_plans(patients))),
+    ]
+    print(f"memo: {diet.plan_for_signature.cache_info()}")
+    print(f"{'':<24} {'total ms':>9} {'us/patient':>11}")
+    for name, seconds in rows:
+        print(f"{name:<24} {seconds * 1e3:>9.1f} {seconds / count * 1e6:>11.2f}")
+    batch = diet.generate_plans(patients)
+    print(f"batch response: {len(json.dumps({'plans': batch})) // 1024} KiB JSON")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Startup time and memory of the food engine: CSV parsed into Python objects
+versus the memory-mapped database from build_food_db.py.
+
+Generates a synthetic nutrient CSV, builds the mapped file, then loads each
+variant in a fresh process and reports load time, RSS, private (unshared)
+memory and per-query latency. Private memory is what each extra uvicorn
+worker costs; mapped pages are shared through the page cache.
+
+Usage: python bench_food_db.py [foods] [workers]
+"""
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "tu", "ven", "sor", "pel", "qui", "dan", "bre", "gol", "fis", "nam"]
+QUERIES = ["2 eggs and a banana", "200 g grilled chicken with brown rice", "half a cup of oatmeal and almonds"]
+
+
+def memory_kb() -> dict:
+    stats = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                stats["rss_kb"] = int(line.split()[1])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    stats["private_kb"] = stats.get("private_kb", 0) + int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return stats
+
+
+def child(mode: str, path: str, hold: float):
+    before = memory_kb()
+    start = time.perf_counter()
+    from backend import foods
+    engine = foods.FoodEngine.from_csv(path) if mode == "csv" else foods.FoodEngine.from_mapped(path)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(200):
+        for q in QUERIES:
+            engine.estimate(q)
+    query_us = (time.perf_counter() - start) / (200 * len(QUERIES)) * 1e6
+    after = memory_kb()
+    time.sleep(hold) # Keep the mapping alive while sibling workers measure
+    print(json.dumps({
+        "load_s": load,
+        "query_us": query_us,
+        "rss_kb": after["rss_kb"],
+        "private_kb": after.get("private_kb", 0) - before.get("private_kb", 0),
+        "rss_growth_kb": after["rss_kb"] - before["rss_kb"],
+    }))
+
+
+def write_csv(path: str, size: int):
+    from backend import foods
+    rng = random.Random(11)
+    real = foods.FoodTable.from_csv(foods.DEFAULT_FOODS_CSV)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["name", "synonyms", "serving_g"] + list(foods.NUTRIENTS))
+        for i in range(size - len(real)):
+            name = " ".join("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(2, 3)))
+            w.writerow([f"{name} {i}", "", 100, rng.randint(10, 600), rng.randint(0, 40), rng.randint(0, 80), rng.randint(0, 30)])
+        for i in range(len(real)):
+            w.writerow([real.names[i], "|".join(real.synonyms[i]), real.serving_g[i]] + [real.columns[n][i] for n in foods.NUTRIENTS])
+
+
+def run_workers(mode: str, path: str, workers: int) -> list:
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--child", mode, path, "2"], stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    return [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    tmp = tempfile.mkdtemp(prefix="bench_food_db_")
+    csv_path, db_path = os.path.join(tmp, "foods.csv"), os.path.join(tmp, "foods.bin")
+    write_csv(csv_path, size)
+
+    from backend import fooddb
+    start = time.perf_counter()
+    stats = fooddb.build(csv_path, db_path)
+    print(f"{size} foods: CSV {os.path.getsize(csv_path) // 1024} KiB, mapped file {stats['bytes'] // 1024} KiB "
+          f"(build {time.perf_counter() - start:.1f}s), {workers} concurrent workers each")
+    print(f"{'':<8} {'load s':>8} {'query us':>9} {'RSS MiB':>8} {'+RSS MiB':>9} {'+private MiB':>13}")
+    for mode, path in (("csv", csv_path), ("mapped", db_path)):
+        results = run_workers(mode, path, workers)
+        avg = {k: sum(r[k] for r in results) / len(results) for k in results[0]}
+        print(f"{mode:<8} {avg['load_s']:>8.3f} {avg['query_us']:>9.1f} {avg['rss_kb'] / 1024:>8.1f} "
+              f"{avg['rss_growth_kb'] / 1024:>9.1f} {avg['private_kb'] / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,68 @@
+"""
+Shows that food lookup cost does not grow with the size of the food table.
+
+Builds synthetic tables (real foods.csv rows plus generated two- and three-word
+names) and times FoodEngine.estimate against the old approach of a linear
+substring scan over every name.
+
+Usage: python bench_food_parser.py [sizes, e.g. 1000,10000,100000,300000]
+"""
+import random
+import sys
+import time
+
+from backend import foods
+
+QUERIES = [
+    "2 eggs and a banana",
+    "200 g grilled chicken with brown rice and a side salad",
+    "half a cup of oatmeal, greek yogurt and a handful of almonds",
+    "1 lb ribeye steak with avocado",
+]
+SYLLABLES = ["ka", "lo", "mi", "ra", "tu", "ven", "sor", "pel", "qui", "dan", "bre", "gol", "fis", "nam"]
+
+
+def synthetic_table(size: int, rng: random.Random) -> foods.FoodTable:
+    real = foods.FoodTable.from_csv(foods.DEFAULT_FOODS_CSV)
+    table = foods.FoodTable()
+    while len(table) < size - len(real):
+        words = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(2, 3))]
+        table.add(" ".join(words), (), 100, calories=rng.randint(10, 600), protein=1, carbs=1, fats=1)
+    # Real foods last, so the linear scan cannot stop early on a common name
+    for i in range(len(real)):
+        table.add(real.names[i], real.synonyms[i], real.serving_g[i], **real.nutrients(i))
+    return table
+
+
+def linear_scan(table: foods.FoodTable, query: str):
+    query = query.lower()
+    for food_id, name in enumerate(table.names):
+        if name in query:
+            return table.nutrients(food_id)
+    return None
+
+
+def per_query(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            fn(q)
+    return (time.perf_counter() - start) / (repeat * len(QUERIES))
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 100000, 300000]
+    rng = random.Random(7)
+    print(f"{'foods':>8} {'build s':>8} {'engine us/query':>16} {'linear scan us/query':>21}")
+    for size in sizes:
+        table = synthetic_table(size, rng)
+        start = time.perf_counter()
+        engine = foods.FoodEngine(table)
+        build = time.perf_counter() - start
+        engine_us = per_query(engine.estimate, 200) * 1e6
+        linear_us = per_query(lambda q: linear_scan(table, q), 3) * 1e6
+        print(f"{size:>8} {build:>8.2f} {engine_us:>16.1f} {linear_us:>21.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares the legacy payload encoding (base64 Fernet token of json.dumps) with
+the compressed binary v2 format on a synthetic corpus of report analyses:
+stored bytes per row and decrypt + JSON parse time per read.
+
+Usage: python bench_payload_storage.py [reports]
+"""
+import json
+import random
+import sys
+import time
+
+from backend import pipeline, storage
+from backend.services import BiomarkerExtractor, MedicalCryptoService
+
+TESTS = [
+    ("Glucose", "mg/dL", 70, 180), ("HbA1c", "%", 4.5, 9.0), ("Total Cholesterol", "mg/dL", 140, 280),
+    ("LDL", "mg/dL", 60, 190), ("HDL", "mg/dL", 30, 80), ("Triglycerides", "mg/dL", 50, 300),
+    ("Creatinine", "mg/dL", 0.5, 2.0), ("Hemoglobin", "g/dL", 10, 17), ("TSH", "mIU/L", 0.3, 6.0),
+    ("Vitamin D", "ng/mL", 10, 80), ("Systolic BP", "mmHg", 100, 170), ("ALT", "U/L", 7, 80),
+]
+
+
+def synthetic_report_text(rng: random.Random) -> str:
+    lines = [
+        "CITY GENERAL HOSPITAL - CLINICAL LABORATORY",
+        f"Patient ID: {rng.randint(100000, 999999)}    Collected: 2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "Specimen: Serum    Ordering physician: Dr. A. Example",
+        "-" * 60,
+    ]
+    for _ in range(rng.randint(3, 6)): # Several panels per report
+        for name, unit, low, high in rng.sample(TESTS, rng.randint(4, len(TESTS))):
+            value = round(rng.uniform(low, high), 1)
+            lines.append(f"{name:<22}{value:>8} {unit:<8} Reference: {low}-{high}")
+        lines.append("Comments: Results reviewed by laboratory staff. Fasting sample unless noted.")
+    lines.append("This report was electronically signed. Confidential patient information.")
+    return "\n".join(lines)
+
+
+def analyze_text(text: str) -> dict:
+    """An analysis result (pipeline.build_result) for report text, skipping OCR."""
+    return pipeline.build_result(text, BiomarkerExtractor.parse_with_llm(text))
+
+
+def legacy_encode(crypto, data) -> str:
+    return crypto.encrypt_file(json.dumps(data).encode()).decode()
+
+
+def time_reads(fn, items, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items)
+
+
+def main():
+    reports = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(42)
+    crypto = MedicalCryptoService()
+    corpus = [analyze_text(synthetic_report_text(rng)) for _ in range(reports)]
+
+    legacy = [legacy_encode(crypto, d) for d in corpus]
+    v2 = [storage.seal(crypto, storage.encode_json(d)) for d in corpus]
+    assert all(json.loads(storage.decrypt_stored(crypto, b)) == d for b, d in zip(v2, corpus))
+
+    legacy_bytes = sum(len(t) for t in legacy)
+    v2_bytes = sum(len(b) for b in v2)
+    legacy_read = time_reads(lambda t: json.loads(storage.decrypt_stored(crypto, t)), legacy)
+    v2_read = time_reads(lambda b: json.loads(storage.decrypt_stored(crypto, b)), v2)
+
+    print(f"{reports} synthetic report payloads, avg plaintext {sum(len(json.dumps(d)) for d in corpus) // reports} bytes")
+    print(f"legacy (Fernet, base64 text) : {legacy_bytes // reports:7d} bytes/row  {legacy_read * 1e6:7.1f} us/read")
+    print(f"v2 (zlib + AES-GCM, binary)  : {v2_bytes // reports:7d} bytes/row  {v2_read * 1e6:7.1f} us/read")
+    print(f"reduction                    : {1 - v2_bytes / legacy_bytes:7.1%} size     {1 - v2_read / legacy_read:7.1%} read time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Wall time to read a multi-page PDF lab report.
+
+Builds a report with text-layer pages and scanned (image-only) pages, then
+compares:
+  ocr every page   rasterize and tesseract each page one after another
+  text layer       embedded text where present, serial OCR for the rest
+  text + parallel  same, with image pages OCR'd on PDF_OCR_WORKERS threads
+
+Uses tesseract when it is installed. Otherwise each OCR call is emulated by
+waiting --ocr-seconds (tesseract runs as a subprocess, so the wait overlaps
+across threads the same way) and the output says so.
+
+Usage: python bench_pdf_ocr.py [--pages 30] [--scanned 10] [--workers 4] [--ocr-seconds 1.5]
+"""
+import argparse
+import shutil
+import time
+
+import pymupdf
+
+from backend import labs, pdfs
+from backend.services import OCRService
+
+LINES = [
+    "Glucose, Fasting      {g}   mg/dL    70 - 99",
+    "Hemoglobin A1c        {a}   %        4.0 - 5.6",
+    "Creatinine            {c}   mg/dL    0.7 - 1.3",
+    "Blood Pressure: {s}/{d} mmHg",
+]
+
+
+def build_report(pages: int, scanned: int) -> bytes:
+    doc = pymupdf.open()
+    scan_every = pages // scanned if scanned else 0
+    for i in range(pages):
+        body = [f"CITY LAB - page {i + 1} of {pages}"] + [
+            line.format(g=90 + i, a=5.0 + i / 10, c=0.8, s=118, d=76) for line in LINES
+        ] + ["Comment: results reviewed by the laboratory director."] * 20
+        text = "\n".join(body)
+        page = doc.new_page()
+        if scan_every and i % scan_every == scan_every - 1:
+            # Simulated scan: render the page and keep only the picture
+            src = pymupdf.open()
+            src.new_page().insert_text((56, 56), text, fontsize=10)
+            page.insert_image(page.rect, stream=src[0].get_pixmap(dpi=150, colorspace=pymupdf.csGRAY).tobytes("png"))
+        else:
+            page.insert_text((56, 56), text, fontsize=10)
+    return doc.tobytes(garbage=3, deflate=True)
+
+
+def ocr_every_page(data: bytes, ocr) -> list:
+    doc = pdfs.open_document(data)
+    try:
+        return [ocr(pdfs.rasterize(page)) for page in doc]
+    finally:
+        doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--scanned", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ocr-seconds", type=float, default=1.5)
+    args = parser.parse_args()
+
+    if shutil.which("tesseract"):
+        ocr, mode = OCRService.image_to_text, "tesseract"
+    else:
+        def ocr(image):
+            time.sleep(args.ocr_seconds)
+            return ""
+        mode = f"emulated OCR, {args.ocr_seconds}s/page (tesseract not installed)"
+
+    data = build_report(args.pages, args.scanned)
+    print(f"{pdfs.page_stats(data)}, {len(data) // 1024} KiB, {mode}")
+
+    runs = [("ocr every page", None), ("text layer", 1), (f"text + {args.workers} threads", args.workers)]
+    print(f"{'':<20} {'seconds':>8} {'first page s':>13} {'biomarkers':>11}")
+    for name, workers in runs:
+        start = time.perf_counter()
+        if workers is None:
+            pages = ocr_every_page(data, ocr)
+            first = time.perf_counter() - start # Nothing is usable until the loop ends
+        else:
+            pages, first = [], None
+            for page in pdfs.iter_page_text(data, workers=workers, ocr=ocr):
+                first = first if first is not None else time.perf_counter() - start
+                pages.append(page)
+        total = time.perf_counter() - start
+        print(f"{name:<20} {total:>8.2f} {first:>13.2f} {len(labs.extract_pages(pages)):>11}")
+
+
+if __name__ == "__main__":
+    main()
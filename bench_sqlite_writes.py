@@ -0,0 +1,112 @@
+"""
+Concurrency stress test for the SQLite storage profiles.
+
+Writer threads log meals and water the way the API does (one commit per
+entry) while reader threads compute daily totals. Each storage profile gets
+its own fresh database file, since WAL mode persists in the file.
+
+Reports committed writes/s, reads/s and how many operations failed with
+"database is locked" (or timed out waiting for a pooled connection).
+
+Usage: python bench_sqlite_writes.py [--writers 16] [--readers 4] [--seconds 5]
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from backend import database, nutrition
+
+
+def stress(profile: str, writers: int, readers: int, seconds: float, users: int = 8):
+    path = os.path.join(tempfile.mkdtemp(prefix=f"bench_sqlite_{profile}_"), "stress.db")
+    engine = database.make_engine(f"sqlite:///{path}", profile)
+    database.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(n):
+        db = Session()
+        try:
+            i = 0
+            while not stop.is_set():
+                user_id = (n + i) % users + 1
+                if i % 3:
+                    db.add(database.MealLog(user_id=user_id, name="stress", calories=250, protein=10, carbs=30, fats=8))
+                else:
+                    db.add(database.WaterLog(user_id=user_id, amount_ml=250))
+                try:
+                    db.commit()
+                    bump("writes")
+                except (OperationalError, PoolTimeoutError):
+                    db.rollback()
+                    bump("locked")
+                i += 1
+        finally:
+            db.close()
+
+    def reader(n):
+        db = Session()
+        try:
+            i = 0
+            while not stop.is_set():
+                start, end = nutrition.day_window(datetime.datetime.utcnow().date())
+                try:
+                    db.query(func.sum(database.MealLog.calories)).filter(
+                        database.MealLog.user_id == (n + i) % users + 1,
+                        database.MealLog.created_at >= start,
+                        database.MealLog.created_at < end
+                    ).scalar()
+                    db.commit() # End the read transaction so the next read sees new writes
+                    bump("reads")
+                except (OperationalError, PoolTimeoutError):
+                    db.rollback()
+                    bump("locked")
+                i += 1
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    engine.dispose()
+
+    print(f"{profile:<11} {counts['writes'] / elapsed:9.1f} writes/s {counts['reads'] / elapsed:9.1f} reads/s"
+          f"   locked/timeouts: {counts['locked']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profiles", default=",".join(database.SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer threads, {args.readers} reader threads, {args.seconds:g}s per profile")
+    for profile in args.profiles.split(","):
+        stress(profile, args.writers, args.readers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
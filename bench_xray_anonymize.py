@@ -0,0 +1,81 @@
+"""
+Benchmarks X-ray metadata stripping: the legacy putdata(list(getdata()))
+round trip against imaging.strip_metadata.
+
+Each run happens in a fresh process so peak RSS is not polluted by earlier
+runs. tracemalloc captures Python-level allocations (the per-pixel tuples).
+
+Usage: python bench_xray_anonymize.py [size]
+"""
+import io
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from PIL import Image
+
+
+def legacy_strip(content: bytes) -> bytes:
+    img = Image.open(io.BytesIO(content))
+    img_no_exif = Image.new(img.mode, img.size)
+    img_no_exif.putdata(list(img.getdata()))
+    buf = io.BytesIO()
+    img_no_exif.save(buf, format=img.format if img.format else "PNG")
+    return buf.getvalue()
+
+
+def make_radiograph(mode: str, size: int) -> bytes:
+    # Smooth gradient + noise-free structure compresses like a real film scan
+    img = Image.linear_gradient("L").resize((size, size))
+    if mode == "I;16":
+        img = img.point(lambda v: v * 257, "I").convert("I;16")
+    elif mode == "RGB":
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def _run(method: str, mode: str, size: int, out):
+    from backend.imaging import strip_metadata
+    fn = strip_metadata if method == "strip_metadata" else legacy_strip
+    content = make_radiograph(mode, size)
+    rss_before = _rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(content)
+    elapsed = time.perf_counter() - start
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    out.put((elapsed, py_peak / (1024 * 1024), _rss_mb() - rss_before))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'mode':<6} {'method':<16} {'seconds':>9} {'py peak MB':>11} {'RSS +MB':>9}")
+    for mode in ("L", "I;16", "RGB"):
+        for method in ("legacy_putdata", "strip_metadata"):
+            out = ctx.Queue()
+            p = ctx.Process(target=_run, args=(method, mode, size, out))
+            p.start()
+            elapsed, py_peak, rss = out.get()
+            p.join()
+            print(f"{mode:<6} {method:<16} {elapsed:>9.3f} {py_peak:>11.1f} {rss:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+X-ray inference throughput and latency across batch sizes.
+
+1. Model alone: to_tensor + forward for batches of 1..64 prepared images.
+2. Inference server: `clients` concurrent async callers, each sending its
+   next request as soon as the previous one returns, against servers with
+   different max_batch_size. max_batch_size=1 is one forward pass per
+   request, i.e. no batching. Reports images/s and p50/p95/p99 latency
+   (queue wait + forward pass). Images are prepared up front so the numbers
+   isolate serving; decode cost per upload is printed separately.
+
+Runs the NumPy reference model unless XRAY_MODEL points elsewhere.
+
+Usage: python bench_xray_inference.py [--requests 512] [--clients 1,8,32] [--wait-ms 5]
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from backend.inference import InferenceServer
+from backend.models import XRayAnalyzer
+
+
+def radiograph(seed: int, size: int = 1024) -> bytes:
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    body = np.exp(-((xx - 0.5) ** 2 / 0.08 + (yy - 0.55) ** 2 / 0.15)) * 180
+    pixels = (body + rng.normal(0, 12, (size, size))).clip(0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def percentile(values, q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else values[0]
+
+
+async def load(server: InferenceServer, images, clients: int, total: int):
+    latencies = []
+    next_index = iter(range(total))
+
+    async def client():
+        for i in next_index:
+            start = time.perf_counter()
+            await asyncio.wrap_future(server.submit(images[i % len(images)]))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--clients", default="1,8,32")
+    parser.add_argument("--batch-sizes", default="1,4,8,16,32")
+    parser.add_argument("--wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    analyzer = XRayAnalyzer()
+    uploads = [radiograph(seed) for seed in range(8)]
+    start = time.perf_counter()
+    images = [analyzer.prepare(b) for b in uploads]
+    decode_ms = (time.perf_counter() - start) * 1000 / len(uploads)
+    print(f"decode + resize 1024px PNG -> {analyzer.model.input_size}px: {decode_ms:.2f} ms/upload (outside the batch)")
+    images = images * 8
+
+    print(f"\nmodel only ({analyzer.model.name})")
+    print(f"{'batch':>6} {'ms/batch':>9} {'ms/image':>9} {'images/s':>9}")
+    for size in (1, 2, 4, 8, 16, 32, 64):
+        analyzer.infer(images[:size]) # Warm up
+        reps = max(3, 128 // size)
+        start = time.perf_counter()
+        for _ in range(reps):
+            analyzer.infer(images[:size])
+        per_batch = (time.perf_counter() - start) / reps
+        print(f"{size:>6} {per_batch * 1000:>9.2f} {per_batch * 1000 / size:>9.3f} {size / per_batch:>9.0f}")
+
+    print(f"\ninference server, {args.requests} requests, max wait {args.wait_ms} ms")
+    print(f"{'clients':>7} {'max batch':>9} {'images/s':>9} {'avg batch':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for clients in (int(c) for c in args.clients.split(",")):
+        for max_batch in (int(b) for b in args.batch_sizes.split(",")):
+            server = InferenceServer(analyzer, max_batch_size=max_batch, max_wait=args.wait_ms / 1000)
+            server.start()
+            elapsed, latencies = asyncio.run(load(server, images, clients, args.requests))
+            server.shutdown()
+            stats = server.stats()
+            print(f"{clients:>7} {max_batch:>9} {args.requests / elapsed:>9.0f} {stats['avg_batch_size']:>9.2f} "
+                  f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} {percentile(latencies, 99):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Builds the memory-mapped food database the nutrition estimator opens at
+startup (see backend/fooddb.py). Re-run whenever the CSV changes.
+
+Usage: python build_food_db.py [csv_path] [out_path]
+"""
+import sys
+import time
+from backend import fooddb, foods
+
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else foods.DEFAULT_FOODS_CSV
+    out_path = sys.argv[2] if len(sys.argv) > 2 else foods.DEFAULT_FOOD_DB
+    start = time.perf_counter()
+    stats = fooddb.build(csv_path, out_path)
+    print(f"Wrote {out_path}: {stats['foods']} foods, {stats['keys']} spellings, "
+          f"{stats['bytes']} bytes in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -44,13 +44,13 @@ def debug_data():
         print("-" * 30)
         print(f"INSPECTING REPORT ID {target_report_id}:")
         try:
-            from backend import services
+            from backend import services, storage
             crypto = services.MedicalCryptoService()
             key_env = os.getenv("ENCRYPTION_KEY")
             if not key_env:
                 print("CRITICAL: ENCRYPTION_KEY missing.")
             else:
-                 decrypted = crypto.decrypt_file(report.encrypted_data.encode())
+                 decrypted = storage.decrypt_stored(crypto, storage.stored_ciphertext(report))
                  data = json.loads(decrypted.decode())
                  if "diet_plan" in data:
                      dp = data["diet_plan"]
@@ -0,0 +1,20 @@
+"""
+Brings an existing database up to the current schema (new tables, indexes
+and columns). The app also runs this at startup via database.init_db().
+
+Usage: python migrate_db.py
+"""
+from backend import database, migrations
+
+
+def main():
+    database.Base.metadata.create_all(bind=database.engine)
+    applied = migrations.run_migrations(database.engine)
+    if applied:
+        print(f"Applied migrations: {applied}")
+    else:
+        print("Database schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Rewrites analysis results stored as base64 Fernet text into the compressed
+binary payload format (see backend/storage.py). Safe to re-run; rows already
+migrated are skipped.
+
+Usage: python migrate_payloads.py [batch_size]
+"""
+import sys
+from backend import database, storage
+from backend.services import MedicalCryptoService
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        stats = storage.migrate_legacy_payloads(db, MedicalCryptoService(), batch_size=batch_size)
+    finally:
+        db.close()
+
+    print(f"Payloads migrated: {stats['migrated']}, skipped (undecryptable): {stats['failed']}")
+    if stats["migrated"]:
+        saved = 1 - stats["bytes_after"] / stats["bytes_before"]
+        print(f"Stored bytes: {stats['bytes_before']} -> {stats['bytes_after']} ({saved:.1%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Recomputes daily_nutrition_rollup from the raw meal and water logs.
+Use after bulk imports or manual edits to meal_logs / water_logs.
+
+Usage: python rebuild_rollups.py [user_id]
+"""
+import sys
+from backend import database, nutrition
+
+
+def main():
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        written = nutrition.rebuild_rollups(db, user_id=user_id)
+        scope = f"user {user_id}" if user_id is not None else "all users"
+        print(f"Rebuilt {written} daily rollup rows for {scope}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Re-encrypts stored analysis payloads, trend projections and the data keys of
+stored uploads (blob store) under the primary key after a key rotation. Put the new key first in ENCRYPTION_KEYS and keep
+the old ones after it until this reports no failures, then drop them.
+
+The API server runs the same pass in the background on startup whenever more
+than one key is configured; this script is for running it offline.
+
+Usage: python rotate_keys.py [batch_size]
+"""
+import sys
+from backend import blobstore, database, rotation
+from backend.services import MedicalCryptoService
+
+
+def main():
+    database.init_db()
+    crypto_service = MedicalCryptoService()
+    worker = rotation.worker_from_env(crypto_service, blobstore.store_from_env(crypto_service))
+    if len(sys.argv) > 1:
+        worker.batch_size = int(sys.argv[1])
+    worker.pause = 0 # Offline: no request traffic to yield to
+    worker.run_once()
+
+    stats = worker.stats()
+    print(f"Rows scanned: {stats['scanned']}, re-encrypted: {stats['rotated']}, "
+          f"changed concurrently: {stats['skipped']}, undecryptable: {stats['failed']}")
+    if stats["state"] == "error":
+        print(f"Stopped with an error: {stats['last_error']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,7 +26,8 @@ def test_upload():
     # But main.py uses Depends(auth.get_current_user_optional).
     # If we don't send header, it falls back to guest.
     
-    response = client.post("/analyze-report", files=files)
+    # ?sync=true keeps the inline response; the default queues a background job
+    response = client.post("/analyze-report?sync=true", files=files)
     
     if response.status_code == 200:
         print("Upload Success.")